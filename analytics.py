@@ -0,0 +1,339 @@
+"""
+Statistiques de circulation : agrégats quotidiens et requêtes d'analyse
+
+Le job nocturne agrège chaque jour clôturé dans quatre tables (circulation
+de la bibliothèque, emprunts par livre, par catégorie et par membre). Un jour
+est recalculé en entier depuis les emprunts et les amendes (DELETE puis
+INSERT ... SELECT groupé, index sur les dates) : relancer le job est sans
+effet, et la première exécution agrège tout l'historique par tranches.
+
+Une analyse sur une période additionne les lignes agrégées au lieu de
+parcourir les emprunts. Seuls les jours postérieurs au dernier jour agrégé
+(aujourd'hui, ou la veille avant le passage du job) sont comptés directement
+dans les emprunts, par l'index sur date_emprunt : les résultats sont à jour
+sans attendre le job.
+
+Recettes : montants des amendes payées, au jour de leur paiement (les
+amendes payées avant le suivi des modifications, sans date de paiement
+connue, n'y figurent pas : voir migrations.dater_paiements).
+"""
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+from sqlalchemy import delete, func, insert, literal_column, select, union_all
+from sqlalchemy.exc import IntegrityError
+from historique import lire_date
+from logging_config import HIGH_VOLUME
+from models import (
+    db, Livre, Membre, Emprunt, Amende,
+    StatistiqueJour, StatistiqueLivreJour, StatistiqueCategorieJour, StatistiqueMembreJour
+)
+
+logger = logging.getLogger(__name__)
+
+TABLES = (StatistiqueJour, StatistiqueLivreJour, StatistiqueCategorieJour, StatistiqueMembreJour)
+INDICATEURS = ('emprunts', 'retours', 'amendes_payees', 'recettes')
+PERIODES = ('jour', 'semaine', 'mois')
+PLAGE_DEFAUT_JOURS = 30
+LIMITE_DEFAUT = 10
+LIMITE_MAX = 100
+# Jours agrégés par transaction lors du rattrapage de l'historique
+TRANCHE_JOURS = 31
+
+
+def _categorie():
+    return func.coalesce(Livre.categorie, '')
+
+
+# Classements : table agrégée, colonne de la table, même clé calculée depuis les emprunts
+CLASSEMENTS = {
+    'livres': (StatistiqueLivreJour, StatistiqueLivreJour.id_livre, Emprunt.id_livre),
+    'categories': (StatistiqueCategorieJour, StatistiqueCategorieJour.categorie, _categorie()),
+    'membres': (StatistiqueMembreJour, StatistiqueMembreJour.id_membre, Emprunt.id_membre)
+}
+
+
+# ============ REQUÊTES SUR LES EMPRUNTS ============
+
+def _jours(colonne, debut, fin):
+    """
+    Jours de [debut, fin] ; une période courte (jours non agrégés, tranche du job) est une
+    liste IN : estimée comme des égalités, elle fait choisir l'index sur la date plutôt que
+    le parcours des emprunts de tous les livres de la bibliothèque
+    """
+    nombre = (fin - debut).days + 1
+    if nombre <= TRANCHE_JOURS:
+        return colonne.in_([debut + timedelta(days=i) for i in range(nombre)])
+    return colonne.between(debut, fin)
+
+
+def _bibliotheque(id_utilisateur):
+    return [] if id_utilisateur is None else [Livre.id_utilisateur == id_utilisateur]
+
+
+def _circulation(debut, fin, id_utilisateur=None):
+    """(id_utilisateur, jour, emprunts, retours, amendes_payees, recettes) des jours de [debut, fin] ayant une activité"""
+    zero, zero_reel = literal_column('0'), literal_column('0.0')
+    emprunts = (
+        select(Livre.id_utilisateur, Emprunt.date_emprunt.label('jour'), func.count().label('emprunts'),
+               zero.label('retours'), zero.label('amendes_payees'), zero_reel.label('recettes'))
+        .join_from(Emprunt, Livre, Emprunt.id_livre == Livre.id_livre)
+        .where(_jours(Emprunt.date_emprunt, debut, fin), *_bibliotheque(id_utilisateur))
+        .group_by(Livre.id_utilisateur, Emprunt.date_emprunt)
+    )
+    retours = (
+        select(Livre.id_utilisateur, Emprunt.date_retour_reelle, zero, func.count(), zero, zero_reel)
+        .join_from(Emprunt, Livre, Emprunt.id_livre == Livre.id_livre)
+        .where(_jours(Emprunt.date_retour_reelle, debut, fin), *_bibliotheque(id_utilisateur))
+        .group_by(Livre.id_utilisateur, Emprunt.date_retour_reelle)
+    )
+    paiements = (
+        select(Livre.id_utilisateur, Amende.date_paiement, zero, zero, func.count(), func.sum(Amende.montant))
+        .join_from(Amende, Emprunt, Amende.id_emprunt == Emprunt.id_emprunt)
+        .join(Livre, Emprunt.id_livre == Livre.id_livre)
+        .where(_jours(Amende.date_paiement, debut, fin), *_bibliotheque(id_utilisateur))
+        .group_by(Livre.id_utilisateur, Amende.date_paiement)
+    )
+    lignes = union_all(emprunts, retours, paiements).subquery()
+    return (
+        select(lignes.c.id_utilisateur, lignes.c.jour, *(func.sum(lignes.c[nom]).label(nom) for nom in INDICATEURS))
+        .group_by(lignes.c.id_utilisateur, lignes.c.jour)
+    )
+
+
+def _emprunts_par(cle, debut, fin, id_utilisateur=None):
+    """(id_utilisateur, jour, clé, emprunts) des emprunts de [debut, fin]"""
+    return (
+        select(Livre.id_utilisateur, Emprunt.date_emprunt.label('jour'), cle.label('cle'), func.count().label('emprunts'))
+        .join_from(Emprunt, Livre, Emprunt.id_livre == Livre.id_livre)
+        .where(_jours(Emprunt.date_emprunt, debut, fin), *_bibliotheque(id_utilisateur))
+        .group_by(Livre.id_utilisateur, Emprunt.date_emprunt, cle)
+    )
+
+
+# ============ AGRÉGATION ============
+
+def agreger(debut, fin):
+    """Recalcule les agrégats des jours de [debut, fin] pour toutes les bibliothèques (sans commit)"""
+    for table in TABLES:
+        db.session.execute(delete(table).where(table.jour.between(debut, fin)))
+    db.session.execute(insert(StatistiqueJour).from_select(
+        ['id_utilisateur', 'jour', *INDICATEURS], _circulation(debut, fin)
+    ))
+    for table, colonne, cle in CLASSEMENTS.values():
+        db.session.execute(insert(table).from_select(
+            ['id_utilisateur', 'jour', colonne.key, 'emprunts'], _emprunts_par(cle, debut, fin)
+        ))
+
+
+def _dernier_jour_agrege():
+    return db.session.scalar(select(func.max(StatistiqueJour.jour)))
+
+
+class AnalyticsService:
+    """Service d'agrégation quotidienne des statistiques de circulation"""
+
+    def __init__(self, app):
+        self.app = app
+        self.scheduler = BackgroundScheduler()
+
+    def run(self, aujourd_hui=None):
+        """Agrège les jours clôturés depuis le dernier jour agrégé (recalculé) ; retourne le nombre de jours"""
+        start = time.perf_counter()
+        with self.app.app_context():
+            aujourd_hui = aujourd_hui or datetime.utcnow().date()
+            hier = aujourd_hui - timedelta(days=1)
+            debut = _dernier_jour_agrege() or db.session.scalar(select(func.min(Emprunt.date_emprunt)))
+            db.session.rollback()
+            if debut is None or debut > hier:
+                return 0
+
+            jours = 0
+            while debut <= hier:
+                fin = min(debut + timedelta(days=TRANCHE_JOURS - 1), hier)
+                try:
+                    agreger(debut, fin)
+                    db.session.commit()
+                except IntegrityError:
+                    # Même tranche agrégée au même moment par le planificateur d'un autre worker
+                    db.session.rollback()
+                    logger.info("Statistiques déjà agrégées par un autre worker", extra={'debut': str(debut)})
+                    return jours
+                except Exception:
+                    db.session.rollback()
+                    logger.exception("Erreur lors de l'agrégation des statistiques", extra={'debut': str(debut)})
+                    return jours
+                jours += (fin - debut).days + 1
+                debut = fin + timedelta(days=1)
+
+        logger.info("Statistiques de circulation agrégées", extra={
+            'jours': jours, 'duree_ms': round((time.perf_counter() - start) * 1000), **HIGH_VOLUME
+        })
+        return jours
+
+    def start_daily_run(self, hour=2, minute=0):
+        """Agrège la veille tous les jours à une heure précise, et rattrape les jours manquants au démarrage"""
+        self.scheduler.add_job(
+            self.run,
+            trigger=CronTrigger(hour=hour, minute=minute),
+            id='analytics_daily',
+            name='Statistiques de circulation',
+            next_run_time=datetime.now(),
+            coalesce=True,
+            replace_existing=True
+        )
+        logger.info("Agrégation des statistiques programmée", extra={'heure': f"{hour:02d}:{minute:02d}"})
+
+    def start(self):
+        """Démarre le planificateur"""
+        if not self.scheduler.running:
+            self.scheduler.start()
+            logger.info("Service des statistiques démarré")
+        else:
+            logger.warning("Le service des statistiques est déjà en cours d'exécution")
+
+    def stop(self):
+        """Arrête le planificateur"""
+        if self.scheduler.running:
+            self.scheduler.shutdown()
+            logger.info("Service des statistiques arrêté")
+
+
+# Instance globale du service
+analytics_service = None
+
+def init_analytics_service(app):
+    """Initialise l'agrégation quotidienne des statistiques (ANALYTICS_* dans la configuration)"""
+    global analytics_service
+
+    if not app.config.get('ANALYTICS_ENABLED', True):
+        logger.info("Agrégation des statistiques désactivée")
+        return None
+
+    analytics_service = AnalyticsService(app)
+    analytics_service.start_daily_run(
+        hour=app.config.get('ANALYTICS_HOUR', 2),
+        minute=app.config.get('ANALYTICS_MINUTE', 0)
+    )
+    analytics_service.start()
+    return analytics_service
+
+
+# ============ ANALYSES ============
+
+def _bornes(depuis, jusqu_au):
+    """Période demandée (par défaut les PLAGE_DEFAUT_JOURS derniers jours) ; lève ValueError si invalide"""
+    fin = lire_date(jusqu_au, 'jusqu_au') or datetime.utcnow().date()
+    debut = lire_date(depuis, 'depuis') or fin - timedelta(days=PLAGE_DEFAUT_JOURS - 1)
+    if debut > fin:
+        raise ValueError("depuis doit précéder jusqu_au")
+    return debut, fin
+
+
+def _plages(debut, fin):
+    """
+    Découpage de [debut, fin] : (plage lue dans les agrégats, plage comptée dans les
+    emprunts), chacune (début, fin) ou None
+    """
+    dernier = _dernier_jour_agrege()
+    if dernier is None or dernier < debut:
+        return None, (debut, fin)
+    if dernier >= fin:
+        return (debut, fin), None
+    return (debut, dernier), (dernier + timedelta(days=1), fin)
+
+
+def _zero():
+    return {'emprunts': 0, 'retours': 0, 'amendes_payees': 0, 'recettes': 0.0}
+
+
+def _periode(jour, periode):
+    if periode == 'semaine':
+        return jour - timedelta(days=jour.weekday())
+    if periode == 'mois':
+        return jour.replace(day=1)
+    return jour
+
+
+def serie_circulation(id_utilisateur, depuis=None, jusqu_au=None, periode='jour'):
+    """
+    Emprunts, retours, amendes payées et recettes par jour, semaine (lundi) ou mois
+    de la période, périodes sans activité comprises, et leurs totaux
+    """
+    if periode not in PERIODES:
+        raise ValueError(f"Période inconnue ({', '.join(PERIODES)})")
+    debut, fin = _bornes(depuis, jusqu_au)
+    agreges, directs = _plages(debut, fin)
+
+    requetes = []
+    if agreges:
+        requetes.append(
+            select(StatistiqueJour.jour, *(getattr(StatistiqueJour, nom) for nom in INDICATEURS))
+            .where(StatistiqueJour.id_utilisateur == id_utilisateur, StatistiqueJour.jour.between(*agreges))
+        )
+    if directs:
+        lignes = _circulation(*directs, id_utilisateur).subquery()
+        requetes.append(select(lignes.c.jour, *(lignes.c[nom] for nom in INDICATEURS)))
+
+    totaux = defaultdict(_zero)
+    for jour, *valeurs in db.session.execute(union_all(*requetes) if len(requetes) > 1 else requetes[0]):
+        cumul = totaux[_periode(jour, periode)]
+        for nom, valeur in zip(INDICATEURS, valeurs):
+            cumul[nom] += valeur or 0
+
+    serie, jour = [], _periode(debut, periode)
+    while jour <= fin:
+        serie.append({'periode': jour.isoformat(), **totaux.get(jour, _zero())})
+        jour = _periode(jour + timedelta(days=32 if periode == 'mois' else 7 if periode == 'semaine' else 1), periode)
+    return {
+        'depuis': debut.isoformat(),
+        'jusqu_au': fin.isoformat(),
+        'periode': periode,
+        'serie': serie,
+        'totaux': {nom: sum(ligne[nom] for ligne in serie) for nom in INDICATEURS}
+    }
+
+
+def classement(id_utilisateur, axe, depuis=None, jusqu_au=None, limite=LIMITE_DEFAUT):
+    """Livres, catégories ou membres les plus empruntés de la période (`axe` : clé de CLASSEMENTS)"""
+    if not 1 <= limite <= LIMITE_MAX:
+        raise ValueError(f"limite doit être comprise entre 1 et {LIMITE_MAX}")
+    table, colonne, cle = CLASSEMENTS[axe]
+    debut, fin = _bornes(depuis, jusqu_au)
+    agreges, directs = _plages(debut, fin)
+
+    requetes = []
+    if agreges:
+        requetes.append(
+            select(colonne.label('cle'), table.emprunts.label('emprunts'))
+            .where(table.id_utilisateur == id_utilisateur, table.jour.between(*agreges))
+        )
+    if directs:
+        lignes = _emprunts_par(cle, *directs, id_utilisateur).subquery()
+        requetes.append(select(lignes.c.cle, lignes.c.emprunts))
+    lignes = union_all(*requetes).subquery()
+    total = func.sum(lignes.c.emprunts)
+    classes = db.session.execute(
+        select(lignes.c.cle, total).group_by(lignes.c.cle).order_by(total.desc(), lignes.c.cle).limit(limite)
+    ).all()
+
+    if axe == 'livres':
+        details = {ligne.id_livre: {'titre': ligne.titre, 'auteur': ligne.auteur} for ligne in db.session.execute(
+            select(Livre.id_livre, Livre.titre, Livre.auteur)
+            .where(Livre.id_utilisateur == id_utilisateur, Livre.id_livre.in_([cle for cle, _ in classes]))
+        )}
+        resultats = [{'id_livre': cle, **details.get(cle, {'titre': None, 'auteur': None}), 'emprunts': nombre}
+                     for cle, nombre in classes]
+    elif axe == 'membres':
+        details = {ligne.id_membre: {'nom': ligne.nom, 'prenom': ligne.prenom} for ligne in db.session.execute(
+            select(Membre.id_membre, Membre.nom, Membre.prenom)
+            .where(Membre.id_utilisateur == id_utilisateur, Membre.id_membre.in_([cle for cle, _ in classes]))
+        )}
+        resultats = [{'id_membre': cle, **details.get(cle, {'nom': None, 'prenom': None}), 'emprunts': nombre}
+                     for cle, nombre in classes]
+    else:
+        resultats = [{'categorie': cle or None, 'emprunts': nombre} for cle, nombre in classes]
+    return {'depuis': debut.isoformat(), 'jusqu_au': fin.isoformat(), axe: resultats}
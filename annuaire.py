@@ -0,0 +1,113 @@
+"""
+Annuaire des membres : recherche par préfixe, filtres, tri et pagination par curseur
+
+La recherche porte sur les colonnes *_recherche des membres (nom, prénom et
+email sans accents ni casse, chiffres du téléphone, tenues à jour par le
+modèle). Chaque mot de `q` doit être le début de l'un de ces champs :
+« hel dup » trouve « Hélène Dupré ». Un préfixe est une plage d'index
+(`col >= 'dup' AND col < 'duq'`), ce qui fonctionne sur SQLite comme sur
+PostgreSQL (collation C) sans balayer la table.
+
+Pagination par curseur (keyset) : le curseur opaque contient les valeurs de
+tri de la dernière ligne renvoyée, et la page suivante commence strictement
+après elles. Chaque tri a son index (id_utilisateur, clés de tri,
+id_membre) : une page coûte `limite` lignes lues quelle que soit sa position.
+"""
+import base64
+import json
+import re
+from datetime import date
+from sqlalchemy import Date, and_, or_, select, tuple_
+from models import db, Membre, chiffres, normaliser_recherche
+from serializers import MEMBRE_RESOURCE, Selection
+
+# Clés de tri (id_membre départage les égalités) ; `-tri` pour l'ordre décroissant
+TRIS = {
+    'nom': (Membre.nom_recherche, Membre.prenom_recherche),
+    'prenom': (Membre.prenom_recherche, Membre.nom_recherche),
+    'email': (Membre.email_recherche,),
+    'telephone': (Membre.telephone_recherche,),
+    'date_inscription': (Membre.date_inscription,)
+}
+# Paramètres de requête qui demandent une page de l'annuaire plutôt que la liste complète
+PARAMETRES = ('q', 'statut', 'tri', 'limite', 'curseur')
+LIMITE_DEFAUT = 50
+LIMITE_MAX = 200
+# Recherche composée uniquement d'un numéro de téléphone (chiffres, espaces, + . - parenthèses)
+TELEPHONE = re.compile(r'\+?[\d\s().-]*\d[\d\s().-]*')
+
+
+def _prefixe(colonne, prefixe):
+    """Valeurs commençant par `prefixe`, sous forme de plage utilisable par un index"""
+    return and_(colonne >= prefixe, colonne < prefixe[:-1] + chr(ord(prefixe[-1]) + 1))
+
+
+def _recherche(q):
+    """Chaque mot de la recherche doit préfixer le nom, le prénom, l'email ou le téléphone"""
+    if TELEPHONE.fullmatch(q.strip()):
+        # Numéro saisi avec espaces ou séparateurs (« +226 70 11 ») : un seul préfixe de chiffres
+        return [_prefixe(Membre.telephone_recherche, chiffres(q))]
+    conditions = []
+    for mot in q.split():
+        texte, numero = normaliser_recherche(mot), chiffres(mot)
+        champs = [_prefixe(colonne, texte) for colonne in
+                  (Membre.nom_recherche, Membre.prenom_recherche, Membre.email_recherche)] if texte else []
+        if numero:
+            champs.append(_prefixe(Membre.telephone_recherche, numero))
+        if champs:
+            conditions.append(or_(*champs))
+    return conditions
+
+
+def encoder_curseur(tri, valeurs):
+    valeurs = [valeur.isoformat() if isinstance(valeur, date) else valeur for valeur in valeurs]
+    return base64.urlsafe_b64encode(json.dumps([tri, valeurs]).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decoder_curseur(curseur, tri, cles):
+    """
+    Valeurs des colonnes `cles` de la dernière ligne de la page précédente,
+    dates reconverties ; lève ValueError si le curseur est invalide ou d'un autre tri
+    """
+    try:
+        tri_curseur, valeurs = json.loads(base64.urlsafe_b64decode(curseur + '=' * (-len(curseur) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError('Curseur invalide') from None
+    if tri_curseur != tri or not isinstance(valeurs, list) or len(valeurs) != len(cles):
+        raise ValueError('Curseur invalide pour ce tri')
+    try:
+        return [date.fromisoformat(valeur) if isinstance(cle.type, Date) and valeur is not None else valeur
+                for cle, valeur in zip(cles, valeurs)]
+    except (ValueError, TypeError):
+        raise ValueError('Curseur invalide') from None
+
+
+def rechercher_membres(id_utilisateur, q='', statuts=None, tri='nom', limite=LIMITE_DEFAUT, curseur=None, fields=None):
+    """
+    Page de l'annuaire : {'membres': [...], 'curseur_suivant': str ou None}
+
+    Lève ValueError pour un tri, un curseur, une limite ou un champ invalides.
+    """
+    if tri.lstrip('-') not in TRIS:
+        raise ValueError(f"Tri inconnu (valeurs possibles : {', '.join(TRIS)}, préfixées de - pour l'ordre décroissant)")
+    if not 1 <= limite <= LIMITE_MAX:
+        raise ValueError(f"limite doit être comprise entre 1 et {LIMITE_MAX}")
+    decroissant = tri.startswith('-')
+    cles = TRIS[tri.lstrip('-')] + (Membre.id_membre,)
+
+    selection = Selection(MEMBRE_RESOURCE, fields)
+    # Clés de tri sélectionnées après les champs demandés : ignorées par serialize(), lues pour le curseur
+    query = select(*selection.columns(), *(cle.label(f'_tri_{i}') for i, cle in enumerate(cles))).where(Membre.id_utilisateur == id_utilisateur, *_recherche(q or ''))
+    if statuts:
+        query = query.where(Membre.statut.in_(statuts))
+    if curseur:
+        derniere = tuple_(*decoder_curseur(curseur, tri, cles))
+        query = query.where(tuple_(*cles) < derniere if decroissant else tuple_(*cles) > derniere)
+    query = query.order_by(*(cle.desc() if decroissant else cle for cle in cles)).limit(limite + 1)
+
+    rows = db.session.execute(query).all()
+    suivant = None
+    if len(rows) > limite:
+        rows = rows[:limite]
+        suivant = encoder_curseur(tri, rows[-1][-len(cles):])
+    return {'membres': [selection.serialize(row) for row in rows], 'curseur_suivant': suivant}
@@ -1,10 +1,29 @@
-from flask import Flask, request, jsonify, session, send_from_directory
+from flask import Flask, Response, request, jsonify, session, send_from_directory, stream_with_context
 from flask_cors import CORS
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_mail import Mail, Message
 from config import Config
-from models import db, bcrypt, Utilisateur, Livre, Membre, Emprunt, Amende, Reservation
-from datetime import datetime, timedelta
+from models import db, bcrypt, Utilisateur, Livre, Membre, Emprunt, Amende, Exemplaire, Reservation, TacheImport
+from serializers import init_json_provider, list_livres, list_membres, list_emprunts, list_amendes, list_reservations
+from versioning import bump_versions, conditional, init_versioning
+from response_cache import cached, init_response_cache
+from batch import parse_batch, run_subrequest
+from sync import changes_since, init_sync
+from events import init_events, publish
+from circulation import (
+    STATUTS_EN_COURS, STATUTS_RESERVATION_ACTIFS, CirculationError, annuler_reservation, emprunter, emprunter_lot,
+    reserver, retourner, retourner_lot
+)
+from migrations import migrer_donnees, upgrade_schema
+from exemplaires import ajouter_exemplaire, ajouter_exemplaires, creer_exemplaires, lister_exemplaires, scanner
+from sqlalchemy.exc import IntegrityError
+from catalogue_import import COMPTEURS, ImportCatalogue, detecter_format, lire_csv, lire_lignes, lire_ndjson
+from annuaire import LIMITE_DEFAUT, PARAMETRES as ANNUAIRE_PARAMETRES, rechercher_membres
+from historique import LIMITE_DEFAUT as HISTORIQUE_LIMITE, historique_emprunts
+from analytics import CLASSEMENTS, LIMITE_DEFAUT as CLASSEMENT_LIMITE, classement, serie_circulation
+from membres_import import COLONNES as MEMBRE_COLONNES, COMPTEURS as MEMBRE_COMPTEURS, ImportMembres
+from export import SCHEMAS as EXPORT_SCHEMAS, Export
+from datetime import datetime
 from werkzeug.utils import secure_filename
 from PIL import Image
 import os
@@ -12,13 +31,23 @@ from flask import make_response
 import secrets
 from dotenv import load_dotenv
 import atexit
+import logging
 import re
+from metrics import EMAILS_SENT, init_metrics, suivre_envoi_email
 load_dotenv()
 
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
+# Encodage JSON rapide (orjson)
+init_json_provider(app)
+
+# Logs JSON non bloquants (file + thread d'écriture), corrélés par X-Request-ID
+from logging_config import HIGH_VOLUME, setup_logging
+setup_logging(app)
+logger = logging.getLogger(__name__)
+
 # Configuration Mail
 app.config['MAIL_SERVER'] = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
 app.config['MAIL_PORT'] = int(os.getenv('SMTP_PORT', 587))
@@ -225,12 +254,15 @@ def send_reset_code_email(user_email, user_name, reset_code):
         </html>
         """
         
-        mail.send(msg)
-        print(f" Email envoyé avec succès à {user_email}")
+        with suivre_envoi_email():
+            mail.send(msg)
+        EMAILS_SENT.labels(status='ok').inc()
+        logger.info("Email de réinitialisation envoyé", extra={'email': user_email, **HIGH_VOLUME})
         return True
         
-    except Exception as e:
-        print(f" Erreur lors de l'envoi de l'email: {str(e)}")
+    except Exception:
+        EMAILS_SENT.labels(status='erreur').inc()
+        logger.exception("Erreur lors de l'envoi de l'email de réinitialisation", extra={'email': user_email})
         return False
 
 
@@ -248,7 +280,8 @@ CORS(
     app,
     supports_credentials=True,
     origins=ALLOWED_ORIGINS,
-    allow_headers=["Content-Type", "Authorization"],
+    allow_headers=["Content-Type", "Authorization", "X-Request-ID", "X-Profile", "If-None-Match"],
+    expose_headers=["X-Request-ID", "X-Profile-Id", "ETag"],
     methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"]
 )
 
@@ -266,8 +299,9 @@ def after_request(response):
             
             response.headers['Access-Control-Allow-Origin'] = origin
             response.headers['Access-Control-Allow-Credentials'] = 'true'
-            response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+            response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-Request-ID, X-Profile, If-None-Match'
             response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
+            response.headers['Access-Control-Expose-Headers'] = 'X-Request-ID, X-Profile-Id, ETag'
     
     return response
 
@@ -285,7 +319,7 @@ def handle_preflight():
             response = make_response()
             response.headers["Access-Control-Allow-Origin"] = origin
             response.headers["Access-Control-Allow-Credentials"] = "true"
-            response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization"
+            response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization, X-Request-ID, X-Profile, If-None-Match"
             response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
             response.status_code = 200
             return response
@@ -296,6 +330,33 @@ def handle_preflight():
 db.init_app(app)
 bcrypt.init_app(app)
 
+# Instrumentation SQL (nombre de requêtes, temps DB, détection N+1)
+from sql_instrumentation import init_sql_instrumentation
+init_sql_instrumentation(app)
+
+# Métriques Prometheus (/metrics)
+init_metrics(app, db)
+
+# Profilage à la demande (X-Profile pour les admins, ou échantillonnage)
+from profiling import init_profiling
+init_profiling(app)
+
+# Compression gzip/brotli négociée (Accept-Encoding)
+from compression import init_compression
+init_compression(app)
+
+# Cache de réponses des routes de lecture (invalidé par les versions de collections)
+init_response_cache(app)
+
+# Versions de collections (ETag), incrémentées après le commit des écritures
+init_versioning(app)
+
+# Versions et suppressions pour la synchronisation incrémentale (/api/sync)
+init_sync(app)
+
+# Évènements temps réel (SSE) publiés par les routes d'écriture
+event_broker = init_events(app)
+
 login_manager = LoginManager()
 login_manager.init_app(app)
 
@@ -323,12 +384,25 @@ with app.app_context():
     
     # Créer les tables si elles n'existent pas
     db.create_all()
+    # Compléter les tables existantes (colonnes et index ajoutés depuis leur création)
+    upgrade_schema(db)
+    # Migrations de données des lignes créées avant l'introduction des colonnes (une fois par base)
+    if app.config['DATA_MIGRATIONS_ON_STARTUP']:
+        migrer_donnees(db)
     
     #  MODE PRODUCTION : Pas d'utilisateurs de test
-    print(" Base de données initialisée!")
-    print(f" Utilisateurs enregistrés : {Utilisateur.query.count()}")
-    print(f" Livres dans le catalogue : {Livre.query.count()}")
-    print(f" Membres actifs : {Membre.query.count()}")
+    logger.info("Base de données initialisée", extra={
+        'utilisateurs': Utilisateur.query.count(),
+        'livres': Livre.query.count(),
+        'membres': Membre.query.count()
+    })
+
+
+@app.cli.command('migrer')
+def migrer():
+    """Applique les migrations de données en attente (avec DATA_MIGRATIONS_ON_STARTUP=false, avant un déploiement)"""
+    appliquees = migrer_donnees(db)
+    print(f"Migrations appliquées : {', '.join(appliquees)}" if appliquees else "Base déjà à jour")
 
 # ============ SAUVEGARDE AUTOMATIQUE ============
 from auto_backup import init_backup_service
@@ -341,11 +415,36 @@ from auto_backup import backup_service
 if backup_service:
     atexit.register(backup_service.stop)
 
+# ============ RETARDS ET AMENDES ============
+from overdue_service import init_overdue_service
+
+# Passe quotidienne (et au démarrage) : emprunts échus en retard, amendes majorées
+overdue_service = init_overdue_service(app)
+if overdue_service:
+    atexit.register(overdue_service.stop)
+
+# ============ STATISTIQUES DE CIRCULATION ============
+from analytics import init_analytics_service
+
+# Agrégation quotidienne (et rattrapage au démarrage) des jours clôturés
+analytics_service = init_analytics_service(app)
+if analytics_service:
+    atexit.register(analytics_service.stop)
+
+# ============ IMPORTS EN ARRIÈRE-PLAN ============
+from import_service import init_import_service
+
+# Reprend au démarrage les imports interrompus, puis exécute les fichiers déposés
+import_service = init_import_service(app)
+if import_service:
+    atexit.register(import_service.stop)
+
 # ============ AUTHENTIFICATION ============
 # ============ ROUTES PROFIL ============
 
 @app.route('/api/profile', methods=['GET'])
 @login_required
+@cached('profile')
 def get_profile():
     return jsonify(current_user.to_dict()), 200
 
@@ -376,6 +475,7 @@ def update_profile():
             
             current_user.set_password(data['nouveau_mot_de_passe'])
         
+        bump_versions(current_user.id_utilisateur, 'profile')
         db.session.commit()
         return jsonify({
             'message': 'Profil mis à jour avec succès',
@@ -409,6 +509,7 @@ def upload_profile_photo():
         filename = save_profile_picture(file)
         if filename:
             current_user.photo_profil = filename
+            bump_versions(current_user.id_utilisateur, 'profile')
             db.session.commit()
             
             return jsonify({
@@ -455,29 +556,29 @@ def forgot_password():
         email_sent = send_reset_code_email(utilisateur.email, user_name, code)
         
         if email_sent:
-            print(f" Code envoyé à {utilisateur.email}: {code}")
+            logger.info("Code de réinitialisation envoyé", extra={'email': utilisateur.email})
             return jsonify({
                 'message': 'Un code de vérification a été envoyé à votre adresse email',
                 'email': email
             }), 200
         else:
-            # En cas d'erreur d'envoi, afficher le code dans la console (développement uniquement)
-            print(f"\n{'='*60}")
-            print(f"  ERREUR D'ENVOI EMAIL - CODE DE DÉVELOPPEMENT")
-            print(f"{'='*60}")
-            print(f"Email: {utilisateur.email}")
-            print(f"Code: {code}")
-            print(f"Expire dans: 15 minutes")
-            print(f"{'='*60}\n")
+            # Le code n'est jamais journalisé en production : seul l'échec de l'envoi l'est
+            logger.warning("Erreur d'envoi du code de réinitialisation", extra={'email': utilisateur.email})
+            if app.debug:
+                logger.debug("Code de réinitialisation (développement)", extra={
+                    'email': utilisateur.email,
+                    'code': code,
+                    'expire_dans': '15 minutes'
+                })
             
             return jsonify({
                 'error': 'Erreur lors de l\'envoi de l\'email. Veuillez réessayer.',
                 'dev_code': code if app.debug else None
             }), 500
             
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(f" Erreur: {str(e)}")
+        logger.exception("Erreur lors de la génération du code de réinitialisation")
         return jsonify({'error': 'Erreur lors de la génération du code'}), 500
 
 @app.route('/api/auth/verify-reset-code', methods=['POST'])
@@ -543,13 +644,13 @@ def reset_password_with_code():
         utilisateur.reset_code_expiration = None
         db.session.commit()
         
-        print(f" Mot de passe réinitialisé pour {utilisateur.email}")
+        logger.info("Mot de passe réinitialisé", extra={'email': utilisateur.email})
         
         return jsonify({'message': 'Mot de passe réinitialisé avec succès'}), 200
         
     except Exception as e:
         db.session.rollback()
-        print(f" Erreur: {str(e)}")
+        logger.exception("Erreur lors de la réinitialisation du mot de passe")
         return jsonify({'error': str(e)}), 400
     
 
@@ -759,12 +860,15 @@ def send_verification_email(user_email, user_name, verification_token):
         </html>
         """
         
-        mail.send(msg)
-        print(f" Email de vérification envoyé à {user_email}")
+        with suivre_envoi_email():
+            mail.send(msg)
+        EMAILS_SENT.labels(status='ok').inc()
+        logger.info("Email de vérification envoyé", extra={'email': user_email, **HIGH_VOLUME})
         return True
         
-    except Exception as e:
-        print(f" Erreur lors de l'envoi de l'email de vérification: {str(e)}")
+    except Exception:
+        EMAILS_SENT.labels(status='erreur').inc()
+        logger.exception("Erreur lors de l'envoi de l'email de vérification", extra={'email': user_email})
         return False    
 
 @app.route('/api/auth/register', methods=['POST'])
@@ -811,13 +915,11 @@ def register():
         else:
             # Si l'envoi échoue, afficher le lien en console (développement)
             verification_url = f"https://bibliotech-frontend.vercel.app/verify-email?token={verification_token}"
-            print(f"\n{'='*70}")
-            print(f"  ERREUR D'ENVOI EMAIL - LIEN DE VÉRIFICATION")
-            print(f"{'='*70}")
-            print(f"Email: {nouvel_utilisateur.email}")
-            print(f"Lien: {verification_url}")
-            print(f"Valide pendant: 24 heures")
-            print(f"{'='*70}\n")
+            logger.warning("Erreur d'envoi email - lien de vérification", extra={
+                'email': nouvel_utilisateur.email,
+                'lien': verification_url,
+                'valide_pendant': '24 heures'
+            })
             
             return jsonify({
                 'message': 'Inscription réussie ! Vérifiez votre email.',
@@ -827,7 +929,7 @@ def register():
             
     except Exception as e:
         db.session.rollback()
-        print(f" Erreur lors de l'inscription: {str(e)}")
+        logger.exception("Erreur lors de l'inscription")
         return jsonify({'error': str(e)}), 400
 
 
@@ -857,9 +959,10 @@ def verify_email():
             utilisateur.email_verified = True
             utilisateur.verification_token = None
             utilisateur.verification_token_expiration = None
+            bump_versions(utilisateur.id_utilisateur, 'profile')
             db.session.commit()
             
-            print(f" Email vérifié pour {utilisateur.email}")
+            logger.info("Email vérifié", extra={'email': utilisateur.email})
             
             return jsonify({
                 'message': 'Email vérifié avec succès ! Vous pouvez maintenant vous connecter.',
@@ -869,9 +972,9 @@ def verify_email():
         else:
             return jsonify({'error': 'Token expiré. Demandez un nouveau lien de vérification.'}), 400
             
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(f" Erreur lors de la vérification: {str(e)}")
+        logger.exception("Erreur lors de la vérification de l'email")
         return jsonify({'error': 'Erreur lors de la vérification'}), 500
 
 
@@ -907,9 +1010,9 @@ def resend_verification():
         else:
             return jsonify({'error': 'Erreur lors de l\'envoi de l\'email'}), 500
             
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(f" Erreur: {str(e)}")
+        logger.exception("Erreur lors du renvoi de l'email de vérification")
         return jsonify({'error': 'Erreur serveur'}), 500
 
 @app.route('/api/auth/login', methods=['POST'])
@@ -954,17 +1057,14 @@ def logout():
 
 @app.route('/api/livres', methods=['GET'])
 @login_required
+@conditional('livres')
+@cached('livres', unless=lambda: request.args.get('search'))
 def get_livres():
     search = request.args.get('search', '')
-    query = Livre.query.filter_by(id_utilisateur=current_user.id_utilisateur)
-    
-    if search:
-        query = query.filter(
-            (Livre.titre.contains(search)) | 
-            (Livre.auteur.contains(search)) 
-        )
-    
-    return jsonify([livre.to_dict() for livre in query.all()])
+    try:
+        return jsonify(list_livres(current_user.id_utilisateur, search, fields=request.args.get('fields') or None))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 @app.route('/api/livres', methods=['POST'])
 @login_required
@@ -981,12 +1081,82 @@ def create_livre():
             id_utilisateur=current_user.id_utilisateur
         )
         db.session.add(nouveau_livre)
+        db.session.flush()
+        creer_exemplaires(current_user.id_utilisateur, nouveau_livre.id_livre, nouveau_livre.nombre_exemplaires or 0)
+        bump_versions(current_user.id_utilisateur, 'livres', 'exemplaires')
         db.session.commit()
+        publish(current_user.id_utilisateur, 'livre.cree', nouveau_livre.to_dict())
         return jsonify(nouveau_livre.to_dict()), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
+@app.route('/api/livres/import', methods=['POST'])
+@login_required
+def import_livres():
+    """
+    Import en masse du catalogue : fichier multipart 'fichier' ou corps brut
+    (text/csv, application/x-ndjson), lu en flux ; rapport avec les lignes rejetées
+    """
+    fichier = request.files.get('fichier')
+    id_utilisateur = current_user.id_utilisateur
+    try:
+        format_fichier = detecter_format(
+            fichier.filename if fichier else None,
+            fichier.mimetype if fichier else request.mimetype,
+            request.args.get('format')
+        )
+        # Progression diffusée aux clients de la bibliothèque (flux /api/events) après chaque lot
+        rapport = ImportCatalogue(
+            id_utilisateur,
+            taille_lot=app.config.get('IMPORT_BATCH_SIZE', 5000),
+            max_erreurs=app.config.get('IMPORT_MAX_ERRORS', 100),
+            progression=lambda compteurs: publish(id_utilisateur, 'livres.import', compteurs)
+        ).executer(lire_lignes(fichier.stream if fichier else request.stream, format_fichier))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    publish(id_utilisateur, 'livres.importes', {compteur: rapport[compteur] for compteur in COMPTEURS})
+    return jsonify(rapport)
+
+@app.route('/api/livres/import/taches', methods=['POST'])
+@login_required
+def create_tache_import():
+    """
+    Import en arrière-plan d'un gros fichier (multipart 'fichier') : MARC21/UNIMARC
+    (.mrc), MARCXML ou ONIX (.xml), CSV, NDJSON ; suivi par GET sur la tâche renvoyée
+    """
+    if import_service is None:
+        return jsonify({'error': 'Import en arrière-plan désactivé'}), 503
+    fichier = request.files.get('fichier')
+    if fichier is None:
+        return jsonify({'error': 'Fichier requis (champ fichier)'}), 400
+    try:
+        format_fichier = detecter_format(fichier.filename, fichier.mimetype, request.args.get('format'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    tache = import_service.deposer(
+        current_user.id_utilisateur, fichier.stream, secure_filename(fichier.filename or ''), format_fichier
+    )
+    return jsonify(tache.to_dict()), 202
+
+@app.route('/api/livres/import/taches', methods=['GET'])
+@login_required
+def get_taches_import():
+    taches = TacheImport.query.filter_by(id_utilisateur=current_user.id_utilisateur).order_by(
+        TacheImport.id_tache.desc()
+    ).limit(50).all()
+    return jsonify([tache.to_dict() for tache in taches])
+
+@app.route('/api/livres/import/taches/<int:id>', methods=['GET'])
+@login_required
+def get_tache_import(id):
+    tache = TacheImport.query.filter_by(id_tache=id, id_utilisateur=current_user.id_utilisateur).first()
+    if not tache:
+        return jsonify({'error': 'Tâche non trouvée'}), 404
+    return jsonify(tache.to_dict())
+
 @app.route('/api/livres/<int:id>', methods=['PUT'])
 @login_required
 def update_livre(id):
@@ -996,12 +1166,29 @@ def update_livre(id):
     
     data = request.json
     try:
+        # nombre_exemplaires suit les exemplaires : une hausse les crée (et met à jour le stock) ;
+        # un livre ancien sans valeur compte ses exemplaires physiques
+        actuel = livre.nombre_exemplaires
+        if actuel is None:
+            actuel = Exemplaire.query.filter_by(id_livre=id).count()
+        ajoutes = int(data.get('nombre_exemplaires', actuel)) - actuel
+        if ajoutes < 0:
+            return jsonify({
+                'error': "nombre_exemplaires ne peut pas diminuer : le retrait d'exemplaires n'est pas pris en charge"
+            }), 400
         livre.titre = data.get('titre', livre.titre)
         livre.auteur = data.get('auteur', livre.auteur)
         livre.categorie = data.get('categorie', livre.categorie)
         livre.annee_publication = data.get('annee_publication', livre.annee_publication)
-        livre.nombre_exemplaires = data.get('nombre_exemplaires', livre.nombre_exemplaires)
+        servies = []
+        if ajoutes:
+            _, servies = ajouter_exemplaires(current_user.id_utilisateur, id, ajoutes)
+            bump_versions(current_user.id_utilisateur, 'exemplaires', 'reservations')
+        bump_versions(current_user.id_utilisateur, 'livres')
         db.session.commit()
+        publish(current_user.id_utilisateur, 'livre.modifie', livre.to_dict())
+        for servie in servies:
+            publish(current_user.id_utilisateur, 'reservation.disponible', servie)
         return jsonify(livre.to_dict())
     except Exception as e:
         db.session.rollback()
@@ -1016,19 +1203,80 @@ def delete_livre(id):
     
     try:
         db.session.delete(livre)
+        # Ses exemplaires et réservations disparaissent avec lui
+        bump_versions(current_user.id_utilisateur, 'livres', 'exemplaires', 'reservations')
         db.session.commit()
+        publish(current_user.id_utilisateur, 'livre.supprime', {'id_livre': id})
         return jsonify({'message': 'Livre supprimé'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
+# ============ EXEMPLAIRES ============
+
+@app.route('/api/livres/<int:id>/exemplaires', methods=['GET'])
+@login_required
+@conditional('exemplaires')
+def get_exemplaires(id):
+    return jsonify(lister_exemplaires(current_user.id_utilisateur, id))
+
+@app.route('/api/livres/<int:id>/exemplaires', methods=['POST'])
+@login_required
+def create_exemplaire(id):
+    data = request.get_json(silent=True) or {}
+    try:
+        exemplaire, servies = ajouter_exemplaire(current_user.id_utilisateur, id, data.get('code_barres'))
+        bump_versions(current_user.id_utilisateur, 'livres', 'exemplaires', 'reservations')
+        db.session.commit()
+        publish(current_user.id_utilisateur, 'exemplaire.cree', exemplaire.to_dict())
+        for servie in servies:
+            publish(current_user.id_utilisateur, 'reservation.disponible', servie)
+        return jsonify(exemplaire.to_dict()), 201
+    except CirculationError as e:
+        db.session.rollback()
+        return jsonify({'error': e.message}), e.status
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Code-barres déjà utilisé'}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/exemplaires/scan/<path:code_barres>', methods=['GET'])
+@login_required
+def scan_exemplaire(code_barres):
+    """Scan au comptoir : exemplaire, livre et emprunt en cours (avec le membre)"""
+    resultat = scanner(current_user.id_utilisateur, code_barres)
+    if resultat is None:
+        return jsonify({'error': 'Exemplaire non trouvé'}), 404
+    return jsonify(resultat)
+
 # ============ MEMBRES ============
 
 @app.route('/api/membres', methods=['GET'])
 @login_required
+@conditional('membres')
+@cached('membres')
 def get_membres():
-    membres = Membre.query.filter_by(id_utilisateur=current_user.id_utilisateur).all()
-    return jsonify([membre.to_dict() for membre in membres])
+    """
+    Tous les membres (format historique), ou une page de l'annuaire dès qu'un paramètre
+    ?q=, ?statut=, ?tri=, ?limite= ou ?curseur= est donné
+    """
+    fields = request.args.get('fields') or None
+    try:
+        if not any(parametre in request.args for parametre in ANNUAIRE_PARAMETRES):
+            return jsonify(list_membres(current_user.id_utilisateur, fields=fields))
+        return jsonify(rechercher_membres(
+            current_user.id_utilisateur,
+            q=request.args.get('q', ''),
+            statuts=[statut for statut in request.args.get('statut', '').split(',') if statut],
+            tri=request.args.get('tri', 'nom'),
+            limite=_parametre_entier('limite') or LIMITE_DEFAUT,
+            curseur=request.args.get('curseur'),
+            fields=fields
+        ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 @app.route('/api/membres', methods=['POST'])
 @login_required
@@ -1038,18 +1286,64 @@ def create_membre():
         nouveau_membre = Membre(
             nom=data['nom'],
             prenom=data['prenom'],
-            email=data['email'],
+            email=data['email'].strip(),
             telephone=data.get('telephone', ''),
             statut='actif',
             id_utilisateur=current_user.id_utilisateur
         )
         db.session.add(nouveau_membre)
+        bump_versions(current_user.id_utilisateur, 'membres')
         db.session.commit()
         return jsonify(nouveau_membre.to_dict()), 201
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Un membre avec cet email existe déjà'}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
+@app.route('/api/membres/import', methods=['POST'])
+@login_required
+def import_membres():
+    """
+    Import en masse des membres : fichier multipart 'fichier' (CSV, NDJSON), tableau JSON
+    ou corps brut ; dédoublonné par email, ?mode=maj (défaut) ou ignorer pour les inscrits
+    """
+    fichier = request.files.get('fichier')
+    try:
+        if fichier is None and request.is_json:
+            donnees = request.get_json(silent=True)
+            if not isinstance(donnees, list):
+                return jsonify({'error': 'Tableau JSON de membres attendu'}), 400
+            lignes = enumerate(donnees, 1)
+        else:
+            format_fichier = detecter_format(
+                fichier.filename if fichier else None,
+                fichier.mimetype if fichier else request.mimetype,
+                request.args.get('format')
+            )
+            flux = fichier.stream if fichier else request.stream
+            if format_fichier == 'csv':
+                lignes = lire_csv(flux, obligatoires=MEMBRE_COLONNES)
+            elif format_fichier == 'ndjson':
+                lignes = lire_ndjson(flux)
+            else:
+                return jsonify({'error': 'Format non pris en charge pour les membres (csv, ndjson ou json)'}), 400
+        rapport = ImportMembres(
+            current_user.id_utilisateur,
+            mode=request.args.get('mode', 'maj'),
+            taille_lot=app.config.get('IMPORT_BATCH_SIZE', 5000),
+            max_erreurs=app.config.get('IMPORT_MAX_ERRORS', 100)
+        ).executer(lignes)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if rapport['crees'] or rapport['mis_a_jour']:
+        publish(current_user.id_utilisateur, 'membres.importes', {
+            compteur: rapport[compteur] for compteur in MEMBRE_COMPTEURS
+        })
+    return jsonify(rapport)
+
 @app.route('/api/membres/<int:id>', methods=['PUT'])
 @login_required
 def update_membre(id):
@@ -1061,11 +1355,15 @@ def update_membre(id):
     try:
         membre.nom = data.get('nom', membre.nom)
         membre.prenom = data.get('prenom', membre.prenom)
-        membre.email = data.get('email', membre.email)
+        membre.email = data.get('email', membre.email).strip()
         membre.telephone = data.get('telephone', membre.telephone)
         membre.statut = data.get('statut', membre.statut)
+        bump_versions(current_user.id_utilisateur, 'membres')
         db.session.commit()
         return jsonify(membre.to_dict())
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Un membre avec cet email existe déjà'}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
@@ -1079,6 +1377,7 @@ def delete_membre(id):
     
     try:
         db.session.delete(membre)
+        bump_versions(current_user.id_utilisateur, 'membres')
         db.session.commit()
         return jsonify({'message': 'Membre supprimé'})
     except Exception as e:
@@ -1089,34 +1388,76 @@ def delete_membre(id):
 
 @app.route('/api/emprunts', methods=['GET'])
 @login_required
+@conditional('emprunts', 'livres', 'membres')
 def get_emprunts():
-    emprunts = Emprunt.query.join(Livre).filter(Livre.id_utilisateur == current_user.id_utilisateur).all()
-    return jsonify([emprunt.to_dict() for emprunt in emprunts])
+    try:
+        return jsonify(list_emprunts(
+            current_user.id_utilisateur,
+            fields=request.args.get('fields') or None,
+            embed=request.args.get('embed')
+        ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+def _historique(colonne, identifiant, embed):
+    """Réponse de l'historique des emprunts d'un membre ou d'un livre (paramètres de la requête)"""
+    try:
+        return jsonify(historique_emprunts(
+            colonne,
+            identifiant,
+            depuis=request.args.get('depuis'),
+            jusqu_au=request.args.get('jusqu_au'),
+            statuts=[statut for statut in request.args.get('statut', '').split(',') if statut],
+            limite=_parametre_entier('limite') or HISTORIQUE_LIMITE,
+            curseur=request.args.get('curseur'),
+            fields=request.args.get('fields') or None,
+            # Sans paramètre, seule l'autre partie de l'emprunt est embarquée
+            embed=request.args.get('embed', None if 'fields' in request.args else embed)
+        ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/membres/<int:id>/emprunts', methods=['GET'])
+@login_required
+@conditional('emprunts', 'livres', 'membres', 'amendes')
+def get_historique_membre(id):
+    """Emprunts d'un membre, du plus récent au plus ancien (?depuis=, ?jusqu_au=, ?statut=, ?limite=, ?curseur=)"""
+    if not Membre.query.with_entities(Membre.id_membre).filter_by(id_membre=id, id_utilisateur=current_user.id_utilisateur).first():
+        return jsonify({'error': 'Membre non trouvé'}), 404
+    return _historique(Emprunt.id_membre, id, 'livre')
+
+@app.route('/api/livres/<int:id>/emprunts', methods=['GET'])
+@login_required
+@conditional('emprunts', 'livres', 'membres', 'amendes')
+def get_historique_livre(id):
+    """Emprunts d'un livre, du plus récent au plus ancien (mêmes paramètres que pour un membre)"""
+    if not Livre.query.with_entities(Livre.id_livre).filter_by(id_livre=id, id_utilisateur=current_user.id_utilisateur).first():
+        return jsonify({'error': 'Livre non trouvé'}), 404
+    return _historique(Emprunt.id_livre, id, 'membre')
 
 @app.route('/api/emprunts', methods=['POST'])
 @login_required
 def create_emprunt():
     data = request.json
     
-    livre = Livre.query.filter_by(id_livre=data['id_livre'], id_utilisateur=current_user.id_utilisateur).first()
-    if not livre or livre.disponibles <= 0:
-        return jsonify({'error': 'Livre non disponible'}), 400
-    
-    membre = Membre.query.filter_by(id_membre=data['id_membre'], id_utilisateur=current_user.id_utilisateur).first()
-    if not membre or membre.statut != 'actif':
-        return jsonify({'error': 'Membre invalide'}), 400
-    
     try:
-        nouvel_emprunt = Emprunt(
-            id_livre=data['id_livre'],
-            id_membre=data['id_membre'],
-            date_retour_prevue=datetime.utcnow() + timedelta(days=14),
-            statut='en_cours'
+        # Décrément conditionnel : jamais plus d'emprunts que d'exemplaires, même en concurrence
+        nouvel_emprunt, disponibles = emprunter(
+            current_user.id_utilisateur, data.get('id_livre'), data.get('id_membre'), data.get('code_barres')
         )
-        livre.disponibles -= 1
-        db.session.add(nouvel_emprunt)
+        bump_versions(current_user.id_utilisateur, 'emprunts', 'livres', 'reservations', 'exemplaires')
         db.session.commit()
+        publish(current_user.id_utilisateur, 'emprunt.cree', {
+            'id_emprunt': nouvel_emprunt.id_emprunt,
+            'id_livre': nouvel_emprunt.id_livre,
+            'id_membre': nouvel_emprunt.id_membre,
+            'statut': nouvel_emprunt.statut,
+            'disponibles': disponibles
+        })
         return jsonify(nouvel_emprunt.to_dict()), 201
+    except CirculationError as e:
+        db.session.rollback()
+        return jsonify({'error': e.message}), e.status
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
@@ -1124,27 +1465,180 @@ def create_emprunt():
 @app.route('/api/emprunts/<int:id>/retour', methods=['POST'])
 @login_required
 def retourner_livre(id):
-    emprunt = Emprunt.query.join(Livre).filter(
-        Emprunt.id_emprunt == id,
-        Livre.id_utilisateur == current_user.id_utilisateur
-    ).first()
+    try:
+        # Clôture conditionnelle (statut en_cours ou en_retard) : un emprunt ne peut être retourné qu'une fois
+        id_livre, amende, disponibles, reservation = retourner(current_user.id_utilisateur, id)
+        bump_versions(current_user.id_utilisateur, 'emprunts', 'livres', 'amendes', 'reservations', 'exemplaires')
+        db.session.commit()
+        emprunt = db.session.get(Emprunt, id)
+        publish(current_user.id_utilisateur, 'emprunt.retourne', {
+            'id_emprunt': emprunt.id_emprunt,
+            'id_livre': id_livre,
+            'id_membre': emprunt.id_membre,
+            'statut': emprunt.statut,
+            'disponibles': disponibles,
+            'id_amende': amende.id_amende if amende else None
+        })
+        if reservation:
+            publish(current_user.id_utilisateur, 'reservation.disponible', reservation)
+        return jsonify(emprunt.to_dict())
+    except CirculationError as e:
+        db.session.rollback()
+        return jsonify({'error': e.message}), e.status
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+def _lecture_lot(cle):
+    """Liste d'éléments d'une requête par lot, ou message d'erreur"""
+    elements = (request.get_json(silent=True) or {}).get(cle)
+    if not isinstance(elements, list) or not elements:
+        return None, f"Le corps doit contenir une liste '{cle}' non vide"
+    maximum = app.config.get('BULK_MAX_ITEMS', 100)
+    if len(elements) > maximum:
+        return None, f"Trop d'éléments (maximum {maximum})"
+    return elements, None
+
+@app.route('/api/emprunts/lot', methods=['POST'])
+@login_required
+def create_emprunts_lot():
+    """Prêt de plusieurs livres en une requête et une transaction (résultat par élément)"""
+    demandes, erreur = _lecture_lot('emprunts')
+    if erreur:
+        return jsonify({'error': erreur}), 400
     
-    if not emprunt:
-        return jsonify({'error': 'Emprunt non trouvé'}), 404
+    try:
+        resultats = emprunter_lot(current_user.id_utilisateur, demandes)
+        bump_versions(current_user.id_utilisateur, 'emprunts', 'livres', 'reservations', 'exemplaires')
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
+    for resultat in resultats:
+        if resultat['status'] == 201:
+            emprunt = resultat['emprunt']
+            publish(current_user.id_utilisateur, 'emprunt.cree', {
+                'id_emprunt': emprunt['id_emprunt'],
+                'id_livre': emprunt['id_livre'],
+                'id_membre': emprunt['id_membre'],
+                'statut': emprunt['statut'],
+                'disponibles': resultat['disponibles']
+            })
+    return jsonify({
+        'resultats': resultats,
+        'succes': sum(1 for r in resultats if r['status'] == 201),
+        'echecs': sum(1 for r in resultats if r['status'] != 201)
+    })
+
+@app.route('/api/emprunts/lot/retour', methods=['POST'])
+@login_required
+def retourner_livres_lot():
+    """Retour de plusieurs emprunts en une requête et une transaction (résultat par élément)"""
+    ids, erreur = _lecture_lot('ids')
+    if erreur:
+        return jsonify({'error': erreur}), 400
     
     try:
-        emprunt.date_retour_reelle = datetime.utcnow()
-        emprunt.statut = 'retourne'
-        
-        if emprunt.date_retour_reelle.date() > emprunt.date_retour_prevue:
-            jours_retard = (emprunt.date_retour_reelle.date() - emprunt.date_retour_prevue).days
-            amende = Amende(id_emprunt=emprunt.id_emprunt, montant=jours_retard * 0.50, statut='impayee')
-            db.session.add(amende)
-        
-        livre = Livre.query.get(emprunt.id_livre)
-        livre.disponibles += 1
+        resultats = retourner_lot(current_user.id_utilisateur, ids)
+        bump_versions(current_user.id_utilisateur, 'emprunts', 'livres', 'amendes', 'reservations', 'exemplaires')
         db.session.commit()
-        return jsonify(emprunt.to_dict())
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
+    for resultat in resultats:
+        if resultat['status'] == 200:
+            publish(current_user.id_utilisateur, 'emprunt.retourne', {
+                'id_emprunt': resultat['id_emprunt'],
+                'id_livre': resultat['id_livre'],
+                'id_membre': resultat['id_membre'],
+                'statut': 'retourne',
+                'disponibles': resultat['disponibles'],
+                'id_amende': resultat['amende']['id_amende'] if resultat['amende'] else None
+            })
+            if resultat['reservation']:
+                publish(current_user.id_utilisateur, 'reservation.disponible', resultat['reservation'])
+    return jsonify({
+        'resultats': resultats,
+        'succes': sum(1 for r in resultats if r['status'] == 200),
+        'echecs': sum(1 for r in resultats if r['status'] != 200)
+    })
+
+# ============ RÉSERVATIONS ============
+
+def _parametre_entier(nom):
+    valeur = request.args.get(nom)
+    if valeur is None:
+        return None
+    if not valeur.isdigit():
+        raise ValueError(f"Paramètre '{nom}' invalide")
+    return int(valeur)
+
+@app.route('/api/reservations', methods=['GET'])
+@login_required
+@conditional('reservations', 'livres', 'membres')
+def get_reservations():
+    """Réservations dans l'ordre des files (actives par défaut ; ?statut=tous pour l'historique)"""
+    statut = request.args.get('statut')
+    statuts = None if statut == 'tous' else [statut] if statut else list(STATUTS_RESERVATION_ACTIFS)
+    try:
+        return jsonify(list_reservations(
+            current_user.id_utilisateur,
+            fields=request.args.get('fields') or None,
+            embed=request.args.get('embed'),
+            id_livre=_parametre_entier('id_livre'),
+            id_membre=_parametre_entier('id_membre'),
+            statuts=statuts
+        ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/reservations', methods=['POST'])
+@login_required
+def create_reservation():
+    data = request.get_json(silent=True) or {}
+    if not data.get('id_livre') or not data.get('id_membre'):
+        return jsonify({'error': 'id_livre et id_membre requis'}), 400
+    
+    try:
+        reservation, position = reserver(current_user.id_utilisateur, data['id_livre'], data['id_membre'])
+        bump_versions(current_user.id_utilisateur, 'reservations')
+        db.session.commit()
+        publish(current_user.id_utilisateur, 'reservation.creee', {
+            'id_reservation': reservation.id_reservation,
+            'id_livre': reservation.id_livre,
+            'id_membre': reservation.id_membre,
+            'position': position
+        })
+        return jsonify({**reservation.to_dict(), 'position': position}), 201
+    except CirculationError as e:
+        db.session.rollback()
+        return jsonify({'error': e.message}), e.status
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/reservations/<int:id>/annuler', methods=['POST'])
+@login_required
+def cancel_reservation(id):
+    try:
+        # Un exemplaire déjà mis de côté passe à la réservation suivante
+        id_livre, servies = annuler_reservation(current_user.id_utilisateur, id)
+        bump_versions(current_user.id_utilisateur, 'reservations', 'livres')
+        db.session.commit()
+        reservation = db.session.get(Reservation, id)
+        publish(current_user.id_utilisateur, 'reservation.annulee', {
+            'id_reservation': id,
+            'id_livre': id_livre,
+            'id_membre': reservation.id_membre
+        })
+        for servie in servies:
+            publish(current_user.id_utilisateur, 'reservation.disponible', servie)
+        return jsonify(reservation.to_dict())
+    except CirculationError as e:
+        db.session.rollback()
+        return jsonify({'error': e.message}), e.status
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
@@ -1153,9 +1647,16 @@ def retourner_livre(id):
 
 @app.route('/api/amendes', methods=['GET'])
 @login_required
+@conditional('amendes', 'emprunts', 'livres', 'membres')
 def get_amendes():
-    amendes = Amende.query.join(Emprunt).join(Livre).filter(Livre.id_utilisateur == current_user.id_utilisateur).all()
-    return jsonify([amende.to_dict() for amende in amendes])
+    try:
+        return jsonify(list_amendes(
+            current_user.id_utilisateur,
+            fields=request.args.get('fields') or None,
+            embed=request.args.get('embed')
+        ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 @app.route('/api/amendes/<int:id>/payer', methods=['POST'])
 @login_required
@@ -1170,7 +1671,18 @@ def payer_amende(id):
     
     try:
         amende.statut = 'payee'
+        amende.date_paiement = datetime.utcnow().date()
+        # Une amende payée pendant le retard est arrêtée au montant du jour (le reliquat sera facturé au retour)
+        amende.montant = amende.montant_du
+        amende.date_calcul = None
+        bump_versions(current_user.id_utilisateur, 'amendes')
         db.session.commit()
+        publish(current_user.id_utilisateur, 'amende.payee', {
+            'id_amende': amende.id_amende,
+            'id_emprunt': amende.id_emprunt,
+            'montant': amende.montant,
+            'statut': amende.statut
+        })
         return jsonify(amende.to_dict())
     except Exception as e:
         db.session.rollback()
@@ -1180,14 +1692,121 @@ def payer_amende(id):
 
 @app.route('/api/stats', methods=['GET'])
 @login_required
+@conditional('livres', 'membres', 'emprunts', 'amendes')
+@cached('livres', 'membres', 'emprunts', 'amendes')
 def get_stats():
     return jsonify({
         'total_livres': Livre.query.filter_by(id_utilisateur=current_user.id_utilisateur).count(),
         'total_membres': Membre.query.filter_by(id_utilisateur=current_user.id_utilisateur).count(),
-        'emprunts_actifs': Emprunt.query.join(Livre).filter(Livre.id_utilisateur == current_user.id_utilisateur, Emprunt.statut == 'en_cours').count(),
+        'emprunts_actifs': Emprunt.query.join(Livre).filter(Livre.id_utilisateur == current_user.id_utilisateur, Emprunt.statut.in_(STATUTS_EN_COURS)).count(),
         'amendes_impayees': Amende.query.join(Emprunt).join(Livre).filter(Livre.id_utilisateur == current_user.id_utilisateur, Amende.statut == 'impayee').count()
     })
 
+# ============ STATISTIQUES DE CIRCULATION ============
+
+@app.route('/api/analytics/circulation', methods=['GET'])
+@login_required
+def get_analytics_circulation():
+    """Emprunts, retours et recettes des amendes par ?periode=jour|semaine|mois entre ?depuis= et ?jusqu_au="""
+    try:
+        return jsonify(serie_circulation(
+            current_user.id_utilisateur,
+            depuis=request.args.get('depuis'),
+            jusqu_au=request.args.get('jusqu_au'),
+            periode=request.args.get('periode', 'jour')
+        ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/analytics/<axe>', methods=['GET'])
+@login_required
+def get_analytics_classement(axe):
+    """Livres, catégories ou membres les plus empruntés entre ?depuis= et ?jusqu_au= (?limite=)"""
+    if axe not in CLASSEMENTS:
+        return jsonify({'error': f"Analyse inconnue (circulation, {', '.join(CLASSEMENTS)})"}), 404
+    try:
+        return jsonify(classement(
+            current_user.id_utilisateur,
+            axe,
+            depuis=request.args.get('depuis'),
+            jusqu_au=request.args.get('jusqu_au'),
+            limite=_parametre_entier('limite') or CLASSEMENT_LIMITE
+        ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+# ============ SYNCHRONISATION ============
+
+@app.route('/api/sync', methods=['GET'])
+@login_required
+def sync_changes():
+    """Lignes créées, modifiées ou supprimées depuis le curseur ?since= (état complet sans curseur)"""
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({'error': 'Curseur invalide'}), 400
+    return jsonify(changes_since(current_user.id_utilisateur, since))
+
+# ============ EXPORT ============
+
+@app.route('/api/export/<collection>', methods=['GET'])
+@login_required
+def export_collection(collection):
+    """
+    Export complet en flux : ?format=csv|ndjson, ?fields=, ?compression=gzip (fichier .gz) ;
+    livres, membres, emprunts ou amendes
+    """
+    if collection not in EXPORT_SCHEMAS:
+        return jsonify({'error': 'Collection inconnue'}), 404
+    try:
+        export = Export(
+            current_user.id_utilisateur,
+            collection,
+            format_export=request.args.get('format', 'csv'),
+            fields=request.args.get('fields'),
+            compression=request.args.get('compression'),
+            taille_paquet=app.config.get('EXPORT_CHUNK_ROWS', 1000)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Le générateur garde le contexte de la requête (session DB) jusqu'au dernier morceau
+    return Response(
+        stream_with_context(export.morceaux()),
+        mimetype=export.mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename="{export.nom_fichier}"',
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+# ============ ÉVÈNEMENTS TEMPS RÉEL ============
+
+@app.route('/api/events', methods=['GET'])
+@login_required
+def events_stream():
+    """Flux SSE des écritures de la bibliothèque (disponibilités, emprunts, retours, amendes)"""
+    return Response(
+        event_broker.stream(current_user.id_utilisateur),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# ============ BATCH ============
+
+@app.route('/api/batch', methods=['POST'])
+@login_required
+def batch():
+    """Exécute plusieurs requêtes GET en un aller-retour (utilisateur et connexion DB partagés)"""
+    try:
+        subrequests = parse_batch(request.get_json(silent=True), app.config.get('BATCH_MAX_REQUESTS', 10))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'responses': [run_subrequest(sub) for sub in subrequests]})
+
 @app.route('/')
 def home():
     return jsonify({'message': 'API BiblioTech', 'version': '2.0', 'auth': 'Flask-Login'})
@@ -1,3 +1,4 @@
+import logging
 import shutil
 import os
 import threading
@@ -5,6 +6,10 @@ import time
 from datetime import datetime
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from logging_config import HIGH_VOLUME
+from metrics import BACKUP_DURATION
+
+logger = logging.getLogger(__name__)
 
 class AutoBackupService:
     """Service de sauvegarde automatique de la base de données"""
@@ -19,10 +24,16 @@ class AutoBackupService:
         os.makedirs(self.backup_folder, exist_ok=True)
         
     def create_backup(self):
-        """Crée une sauvegarde de la base de données"""
+        """Crée une sauvegarde de la base de données (durée exposée dans /metrics)"""
+        start = time.perf_counter()
+        success = self._create_backup()
+        BACKUP_DURATION.labels(status='ok' if success else 'erreur').observe(time.perf_counter() - start)
+        return success
+    
+    def _create_backup(self):
         try:
             if not os.path.exists(self.db_path):
-                print(f"  Base de données introuvable : {self.db_path}")
+                logger.warning("Base de données introuvable", extra={'db_path': self.db_path})
                 return False
             
             # Nom du fichier de sauvegarde avec date et heure
@@ -35,17 +46,19 @@ class AutoBackupService:
             # Taille du fichier
             size = os.path.getsize(backup_file) / 1024  # En KB
             
-            print(f" Sauvegarde automatique créée : {backup_file}")
-            print(f" Taille : {size:.2f} KB")
-            print(f" Date : {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            logger.info("Sauvegarde automatique créée", extra={
+                'backup_file': backup_file,
+                'taille_kb': round(size, 2),
+                **HIGH_VOLUME
+            })
             
             # Nettoyer les anciennes sauvegardes
             self.cleanup_old_backups()
             
             return True
             
-        except Exception as e:
-            print(f" Erreur lors de la sauvegarde automatique : {str(e)}")
+        except Exception:
+            logger.exception("Erreur lors de la sauvegarde automatique")
             return False
     
     def cleanup_old_backups(self):
@@ -66,13 +79,16 @@ class AutoBackupService:
             for old_backup in backups[self.keep_backups:]:
                 os.remove(old_backup)
                 deleted_count += 1
-                print(f"  Ancienne sauvegarde supprimée : {os.path.basename(old_backup)}")
+                logger.info("Ancienne sauvegarde supprimée", extra={'backup_file': os.path.basename(old_backup), **HIGH_VOLUME})
             
             if deleted_count > 0:
-                print(f" {len(backups[:self.keep_backups])} sauvegarde(s) conservée(s)")
+                logger.info("Nettoyage des sauvegardes terminé", extra={
+                    'supprimees': deleted_count,
+                    'conservees': len(backups[:self.keep_backups])
+                })
                 
-        except Exception as e:
-            print(f"  Erreur lors du nettoyage : {str(e)}")
+        except Exception:
+            logger.exception("Erreur lors du nettoyage des sauvegardes")
     
     def start_daily_backup(self, hour=2, minute=0):
         """
@@ -86,7 +102,7 @@ class AutoBackupService:
             name='Sauvegarde quotidienne',
             replace_existing=True
         )
-        print(f" Sauvegarde quotidienne programmée à {hour:02d}:{minute:02d}")
+        logger.info("Sauvegarde quotidienne programmée", extra={'heure': f"{hour:02d}:{minute:02d}"})
     
     def start_hourly_backup(self):
         """Lance une sauvegarde toutes les heures"""
@@ -98,7 +114,7 @@ class AutoBackupService:
             name='Sauvegarde horaire',
             replace_existing=True
         )
-        print(" Sauvegarde horaire activée")
+        logger.info("Sauvegarde horaire activée")
     
     def start_interval_backup(self, minutes=30):
         """
@@ -113,25 +129,25 @@ class AutoBackupService:
             name=f'Sauvegarde toutes les {minutes} minutes',
             replace_existing=True
         )
-        print(f" Sauvegarde automatique toutes les {minutes} minutes")
+        logger.info("Sauvegarde automatique programmée", extra={'intervalle_minutes': minutes})
     
     def start(self):
         """Démarre le service de sauvegarde"""
         if not self.scheduler.running:
             self.scheduler.start()
-            print(" Service de sauvegarde automatique démarré")
+            logger.info("Service de sauvegarde automatique démarré")
             
             # Créer une sauvegarde immédiate au démarrage
-            print("\n Création d'une sauvegarde initiale...")
+            logger.info("Création d'une sauvegarde initiale")
             self.create_backup()
         else:
-            print("  Le service de sauvegarde est déjà en cours d'exécution")
+            logger.warning("Le service de sauvegarde est déjà en cours d'exécution")
     
     def stop(self):
         """Arrête le service de sauvegarde"""
         if self.scheduler.running:
             self.scheduler.shutdown()
-            print(" Service de sauvegarde automatique arrêté")
+            logger.info("Service de sauvegarde automatique arrêté")
     
     def get_backup_info(self):
         """Retourne des informations sur les sauvegardes"""
@@ -151,8 +167,8 @@ class AutoBackupService:
                 'total_size_mb': round(total_size, 2),
                 'latest': max(backups) if backups else None
             }
-        except Exception as e:
-            print(f"  Erreur lors de la récupération des infos : {str(e)}")
+        except Exception:
+            logger.exception("Erreur lors de la récupération des infos de sauvegarde")
             return {'count': 0, 'total_size_mb': 0, 'latest': None}
 
 
@@ -188,19 +204,16 @@ def init_backup_service(app, mode='daily', **kwargs):
             backup_service.start_interval_backup(minutes=minutes)
         
         else:
-            print(f"  Mode de sauvegarde inconnu : {mode}")
+            logger.error("Mode de sauvegarde inconnu", extra={'mode': mode})
             return None
         
         backup_service.start()
         
-        print("\n" + "="*70)
-        print(" SERVICE DE SAUVEGARDE AUTOMATIQUE")
-        print("="*70)
         info = backup_service.get_backup_info()
-        print(f" Sauvegardes existantes : {info['count']}")
-        print(f" Espace utilisé : {info['total_size_mb']} MB")
-        if info['latest']:
-            print(f" Dernière sauvegarde : {info['latest']}")
-        print("="*70 + "\n")
+        logger.info("Service de sauvegarde automatique", extra={
+            'sauvegardes_existantes': info['count'],
+            'espace_utilise_mb': info['total_size_mb'],
+            'derniere_sauvegarde': info['latest']
+        })
         
         return backup_service
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""
+Exécution groupée de requêtes de lecture (/api/batch)
+
+Chaque sous-requête est distribuée dans un contexte de requête imbriqué au
+sein du contexte d'application de la requête batch : `g` (donc l'utilisateur
+déjà chargé par Flask-Login et les versions de collections mémorisées) et la
+session SQLAlchemy (donc une seule connexion) sont partagés. Les hooks
+before/after_request (CORS, session, compression, métriques) ne s'exécutent
+qu'une fois, pour la requête batch elle-même.
+
+Seules les requêtes GET sont acceptées, ce qui exclut aussi les batchs
+imbriqués (/api/batch n'accepte que POST).
+"""
+import logging
+from urllib.parse import urlsplit
+from flask import current_app, request
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+from models import db
+
+logger = logging.getLogger(__name__)
+
+# Headers de la sous-requête transmis à la route (les autres sont ignorés)
+FORWARDED_HEADERS = {'if-none-match', 'accept'}
+# Headers de la sous-réponse renvoyés au client
+RETURNED_HEADERS = ('ETag', 'Cache-Control')
+
+
+def parse_batch(data, max_requests):
+    """Valide le corps d'une requête batch ; lève ValueError si invalide"""
+    if not isinstance(data, dict) or not isinstance(data.get('requests'), list):
+        raise ValueError("Le corps doit contenir une liste 'requests'")
+    subrequests = data['requests']
+    if not subrequests:
+        raise ValueError("La liste 'requests' est vide")
+    if len(subrequests) > max_requests:
+        raise ValueError(f"Trop de sous-requêtes (maximum {max_requests})")
+
+    parsed = []
+    for index, sub in enumerate(subrequests):
+        if not isinstance(sub, dict) or not isinstance(sub.get('path'), str):
+            raise ValueError(f"Sous-requête {index} : 'path' manquant")
+        method = str(sub.get('method', 'GET')).upper()
+        if method != 'GET':
+            raise ValueError(f"Sous-requête {index} : seules les requêtes GET sont acceptées")
+        url = urlsplit(sub['path'])
+        if url.scheme or url.netloc or not url.path.startswith('/api/'):
+            raise ValueError(f"Sous-requête {index} : chemin invalide")
+        headers = {
+            name: str(value) for name, value in (sub.get('headers') or {}).items()
+            if name.lower() in FORWARDED_HEADERS
+        }
+        parsed.append({
+            'id': sub.get('id', index),
+            'path': url.path,
+            'query_string': url.query,
+            'headers': headers
+        })
+    return parsed
+
+
+def _body(response):
+    if response.status_code == 304 or not response.get_data():
+        return None
+    if response.is_json:
+        return current_app.json.loads(response.get_data())
+    return response.get_data(as_text=True)
+
+
+def run_subrequest(sub):
+    """Exécute une sous-requête dans le contexte courant et retourne son résultat sérialisable"""
+    app = current_app._get_current_object()
+    environ = EnvironBuilder(
+        path=sub['path'],
+        query_string=sub['query_string'],
+        method='GET',
+        headers=sub['headers'],
+        base_url=request.host_url,
+        environ_base={'REMOTE_ADDR': request.remote_addr}
+    ).get_environ()
+
+    # Le contexte d'application courant est réutilisé : g et la session DB sont partagés
+    with app.request_context(environ):
+        try:
+            response = app.make_response(app.dispatch_request())
+        except HTTPException as e:
+            response = app.make_response(({'error': e.description}, e.code))
+        except Exception:
+            logger.exception("Erreur dans une sous-requête batch", extra={'route': sub['path']})
+            db.session.rollback()
+            response = app.make_response(({'error': 'Erreur interne'}, 500))
+
+    result = {'id': sub['id'], 'status': response.status_code, 'body': _body(response)}
+    headers = {name: response.headers[name] for name in RETURNED_HEADERS if name in response.headers}
+    if headers:
+        result['headers'] = headers
+    return result
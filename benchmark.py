@@ -0,0 +1,591 @@
+"""
+Benchmark de l'API BiblioTech
+
+Usage:
+  python benchmark.py seed [--database URL] [--tenants N] [--livres N] [--membres N] [--emprunts N]
+  python benchmark.py run [--database URL] [--rounds N] [--concurrency N] [--url URL] [--output fichier.json]
+  python benchmark.py compression [--database URL] [--rounds N] [--debit 10]
+  python benchmark.py concurrence [--database URL] [--threads N] [--exemplaires N] [--tentatives N]
+  python benchmark.py compare ancien.json nouveau.json [--seuil 10]
+
+Par défaut la base de benchmark est SQLite (instance/bench.db). Pour PostgreSQL :
+  python benchmark.py seed --database postgresql://localhost/bibliotech_bench
+  python benchmark.py run --database postgresql://localhost/bibliotech_bench
+
+Sans --url, les routes sont appelées via le client de test Flask (in-process).
+Avec --url, un générateur de charge HTTP interroge un serveur déjà lancé
+(ex: gunicorn app:app) pointant sur la même base.
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+DEFAULT_DATABASE = 'sqlite:///bench.db'
+RESULTS_FOLDER = 'bench_results'
+
+
+def _load_app(database_url):
+    """Importe l'application sur la base de benchmark (la config lit DATABASE_URL à l'import)"""
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    import app as app_module
+    # Aucun email réellement envoyé pendant les benchmarks
+    app_module.app.extensions['mail'].suppress = True
+    return app_module.app
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(percent / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+# ============ CLIENTS ============
+
+class InProcessClient:
+    """Appelle l'application via le client de test Flask"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, json_body=None, headers=None, data=None):
+        response = self.client.open(path, method=method, json=json_body, data=data, headers=headers,
+                                    base_url='https://localhost')
+        return response.status_code, response.get_data(), dict(response.headers)
+
+
+class HTTPClient:
+    """Client HTTP keep-alive minimal (stdlib) qui conserve les cookies de session"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(parts.hostname, parts.port, timeout=60)
+        self.cookies = {}
+
+    def request(self, method, path, json_body=None, headers=None, data=None):
+        headers = dict(headers or {})
+        body = data
+        if json_body is not None:
+            body = json.dumps(json_body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f"{k}={v}" for k, v in self.cookies.items())
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+        except (http.client.HTTPException, ConnectionError):
+            self.connection.close()
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+        payload = response.read()
+        for header, value in response.getheaders():
+            if header.lower() == 'set-cookie':
+                name, _, rest = value.partition('=')
+                self.cookies[name.strip()] = rest.split(';', 1)[0]
+        return response.status, payload, dict(response.getheaders())
+
+
+# ============ SCÉNARIO ============
+
+class Session:
+    """Session d'un bibliothécaire : enregistre la latence de chaque appel par endpoint"""
+
+    def __init__(self, client, recorder, rng):
+        self.client = client
+        self.recorder = recorder
+        self.rng = rng
+
+    def call(self, name, method, path, json_body=None, headers=None, data=None):
+        start = time.perf_counter()
+        try:
+            status, payload, response_headers = self.client.request(method, path, json_body, headers, data)
+        except Exception:
+            self.recorder.record(name, (time.perf_counter() - start) * 1000, 0, 0)
+            return None
+        self.recorder.record(name, (time.perf_counter() - start) * 1000, status, len(payload))
+        if 200 <= status < 300 and response_headers.get('Content-Type', '').startswith('application/json'):
+            return json.loads(payload)
+        return None
+
+
+def _tiny_png():
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (59, 130, 246)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def run_round(s, ctx):
+    """Un passage sur toutes les routes de app.py, dans un ordre réaliste"""
+    rng = s.rng
+    mot = rng.choice(ctx['mots'])
+
+    s.call('home', 'GET', '/')
+    s.call('get_current_user', 'GET', '/api/auth/me')
+    s.call('get_profile', 'GET', '/api/profile')
+    s.call('update_profile', 'PUT', '/api/profile', {'prenom': rng.choice(['Awa', 'Paul', 'Claire'])})
+    s.call('get_stats', 'GET', '/api/stats')
+
+    # Catalogue
+    s.call('get_livres', 'GET', '/api/livres')
+    s.call('get_livres_search', 'GET', f'/api/livres?search={mot}')
+    livre = s.call('create_livre', 'POST', '/api/livres', {
+        'titre': f'Bench {mot} {rng.randint(1, 10**6)}', 'auteur': 'Benchmark', 'categorie': 'Test',
+        'annee_publication': 2024, 'nombre_exemplaires': 2
+    })
+    if livre:
+        s.call('update_livre', 'PUT', f"/api/livres/{livre['id_livre']}", {'categorie': 'Test modifié'})
+
+    # Membres
+    s.call('get_membres', 'GET', '/api/membres')
+    membre = s.call('create_membre', 'POST', '/api/membres', {
+        'nom': 'Bench', 'prenom': 'Membre', 'email': f'bench{rng.randint(1, 10**9)}@exemple.test'
+    })
+    if membre:
+        s.call('update_membre', 'PUT', f"/api/membres/{membre['id_membre']}", {'telephone': '+226 70000000'})
+
+    # Circulation
+    s.call('get_emprunts', 'GET', '/api/emprunts')
+    if livre and membre:
+        emprunt = s.call('create_emprunt', 'POST', '/api/emprunts',
+                         {'id_livre': livre['id_livre'], 'id_membre': membre['id_membre']})
+        if emprunt:
+            s.call('retourner_livre', 'POST', f"/api/emprunts/{emprunt['id_emprunt']}/retour")
+    amendes = s.call('get_amendes', 'GET', '/api/amendes') or []
+    impayees = [a for a in amendes if a['statut'] == 'impayee']
+    if impayees:
+        s.call('payer_amende', 'POST', f"/api/amendes/{rng.choice(impayees)['id_amende']}/payer")
+
+    # Suppressions sur des lignes temporaires (les autres gardent leur historique d'emprunts)
+    temp = s.call('create_livre', 'POST', '/api/livres', {'titre': 'Temporaire', 'auteur': 'Benchmark'})
+    if temp:
+        s.call('delete_livre', 'DELETE', f"/api/livres/{temp['id_livre']}")
+    temp = s.call('create_membre', 'POST', '/api/membres', {'nom': 'Temp', 'prenom': 'Membre', 'email': 'temp@exemple.test'})
+    if temp:
+        s.call('delete_membre', 'DELETE', f"/api/membres/{temp['id_membre']}")
+
+    # Photo de profil (upload multipart via le client de test uniquement)
+    if ctx['in_process']:
+        result = s.call('upload_profile_photo', 'POST', '/api/profile/photo',
+                        data={'photo': (io.BytesIO(ctx['png']), 'bench.png')})
+        if result:
+            s.call('uploaded_file', 'GET', f"/uploads/profiles/{result['photo_profil']}")
+
+    # Authentification (hors routes envoyant des emails en mode HTTP)
+    s.call('verify_reset_code', 'POST', '/api/auth/verify-reset-code', {'email': ctx['email'], 'code': '000000'})
+    s.call('reset_password_with_code', 'POST', '/api/auth/reset-password-with-code',
+           {'email': ctx['email'], 'code': '000000', 'mot_de_passe': 'invalide'})
+    s.call('verify_email', 'POST', '/api/auth/verify-email', {'token': 'jeton-invalide'})
+    if ctx['in_process']:
+        s.call('forgot_password', 'POST', '/api/auth/forgot-password', {'email': ctx['email']})
+        s.call('resend_verification', 'POST', '/api/auth/resend-verification', {'email': ctx['email']})
+        s.call('register', 'POST', '/api/auth/register', {
+            'nom': 'Bench', 'prenom': 'Inscription', 'email': f'inscription{rng.randint(1, 10**9)}@bibliotech.test',
+            'mot_de_passe': 'benchmark'
+        })
+    s.call('metrics', 'GET', '/metrics')
+    s.call('logout', 'POST', '/api/auth/logout')
+    s.call('login', 'POST', '/api/auth/login', {'email': ctx['email'], 'mot_de_passe': ctx['password']})
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def record(self, name, elapsed_ms, status, size):
+        with self.lock:
+            self.samples.setdefault(name, []).append((elapsed_ms, status, size))
+
+    def summary(self, wall_time):
+        endpoints = {}
+        for name, samples in sorted(self.samples.items()):
+            latencies = sorted(sample[0] for sample in samples)
+            endpoints[name] = {
+                'count': len(samples),
+                # Les 4xx sont attendus sur certaines routes (codes invalides) : seuls 5xx et échecs réseau comptent
+                'errors': sum(1 for sample in samples if sample[1] == 0 or sample[1] >= 500),
+                'throughput_rps': round(len(samples) / wall_time, 2),
+                'mean_ms': round(sum(latencies) / len(latencies), 3),
+                'p50_ms': round(_percentile(latencies, 50), 3),
+                'p95_ms': round(_percentile(latencies, 95), 3),
+                'p99_ms': round(_percentile(latencies, 99), 3),
+                'mean_bytes': int(sum(sample[2] for sample in samples) / len(samples))
+            }
+        total = sum(len(samples) for samples in self.samples.values())
+        return endpoints, {'requests': total, 'wall_time_s': round(wall_time, 3), 'throughput_rps': round(total / wall_time, 2)}
+
+
+# ============ COMMANDES ============
+
+def command_seed(args):
+    app = _load_app(args.database)
+    from seed_data import generate_dataset
+    with app.app_context():
+        counts = generate_dataset(tenants=args.tenants, livres=args.livres, membres=args.membres,
+                                  emprunts=args.emprunts, seed=args.seed)
+    print(f" Jeu de données généré : {counts}")
+
+
+def _bench_context(app):
+    """Bibliothèques générées par `seed`, volumétrie et dialecte de la base"""
+    from models import Utilisateur
+    from seed_data import BENCH_EMAIL, dataset_counts
+
+    with app.app_context():
+        tenant_ids = [row[0] for row in Utilisateur.query.with_entities(Utilisateur.id_utilisateur)
+                      .filter(Utilisateur.email.like(BENCH_EMAIL.format('%'))).all()]
+        counts = dataset_counts()
+        dialect = app.extensions['sqlalchemy'].engine.dialect.name
+    if not tenant_ids:
+        sys.exit(" Aucune bibliothèque de benchmark : lancez d'abord `python benchmark.py seed`")
+    return tenant_ids, counts, dialect
+
+
+def _write_results(results, output, suffix):
+    if not output:
+        os.makedirs(RESULTS_FOLDER, exist_ok=True)
+        output = os.path.join(RESULTS_FOLDER, f"{results['meta']['commit'] or 'local'}_{results['meta']['database']}_{suffix}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f" Résultats enregistrés : {output}")
+
+
+def command_run(args):
+    app = _load_app(args.database)
+    from seed_data import BENCH_EMAIL, BENCH_PASSWORD, MOTS
+
+    tenant_ids, counts, dialect = _bench_context(app)
+
+    recorder = Recorder()
+    in_process = not args.url
+    png = _tiny_png()
+
+    def worker(worker_index):
+        rng = random.Random(args.seed + worker_index)
+        tenant_id = rng.choice(tenant_ids)
+        ctx = {'email': BENCH_EMAIL.format(tenant_id), 'password': BENCH_PASSWORD, 'mots': MOTS,
+               'in_process': in_process, 'png': png}
+        client = InProcessClient(app) if in_process else HTTPClient(args.url)
+        session = Session(client, recorder, rng)
+        session.call('login', 'POST', '/api/auth/login', {'email': ctx['email'], 'mot_de_passe': ctx['password']})
+        for _ in range(args.rounds):
+            run_round(session, ctx)
+
+    print(f" Benchmark {'in-process' if in_process else args.url} sur {dialect} : "
+          f"{args.concurrency} session(s) x {args.rounds} passage(s)")
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    endpoints, total = recorder.summary(time.perf_counter() - started)
+
+    results = {
+        'meta': {
+            'commit': _git_commit(),
+            'date': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+            'database': dialect,
+            'mode': 'in-process' if in_process else 'http',
+            'concurrency': args.concurrency,
+            'rounds': args.rounds,
+            'dataset': counts
+        },
+        'total': total,
+        'endpoints': endpoints
+    }
+
+    print(f"\n {'endpoint':28s} {'n':>6s} {'err':>4s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'octets':>9s}")
+    for name, stats in endpoints.items():
+        print(f" {name:28s} {stats['count']:6d} {stats['errors']:4d} {stats['p50_ms']:9.2f} "
+              f"{stats['p95_ms']:9.2f} {stats['p99_ms']:9.2f} {stats['mean_bytes']:9d}")
+    print(f"\n Total : {total['requests']} requêtes en {total['wall_time_s']} s ({total['throughput_rps']} req/s)")
+
+    _write_results(results, args.output, results['meta']['mode'])
+
+
+def command_compression(args):
+    """Taille et latence des listes selon l'encodage négocié (identity, gzip, br)"""
+    app = _load_app(args.database)
+    from seed_data import BENCH_EMAIL, BENCH_PASSWORD
+
+    tenant_ids, counts, dialect = _bench_context(app)
+    # La bibliothèque la plus fournie donne les réponses les plus lourdes
+    with app.app_context():
+        from models import Emprunt, Livre, db
+        tenant_id = db.session.query(Livre.id_utilisateur).join(Emprunt) \
+            .filter(Livre.id_utilisateur.in_(tenant_ids)) \
+            .group_by(Livre.id_utilisateur).order_by(db.func.count().desc()).limit(1).scalar() or tenant_ids[0]
+
+    client = InProcessClient(app)
+    client.request('POST', '/api/auth/login', {'email': BENCH_EMAIL.format(tenant_id), 'mot_de_passe': BENCH_PASSWORD})
+
+    bytes_per_second = args.debit * 1_000_000 / 8
+    endpoints = {}
+    print(f"\n {'endpoint':16s} {'encodage':9s} {'octets':>10s} {'ratio':>7s} {'p50 ms':>8s} {'p95 ms':>8s} {'transfert ms':>13s}")
+    for path in ('/api/livres', '/api/membres', '/api/emprunts', '/api/amendes'):
+        endpoints[path] = {}
+        for encoding in ('identity', 'gzip', 'br'):
+            latencies, size = [], 0
+            for _ in range(args.rounds):
+                start = time.perf_counter()
+                status, payload, headers = client.request('GET', path, headers={'Accept-Encoding': encoding})
+                latencies.append((time.perf_counter() - start) * 1000)
+                size = len(payload)
+            if headers.get('Content-Encoding', 'identity') != encoding:
+                continue  # Encodage non disponible (ex: module brotli absent)
+            latencies.sort()
+            identity_size = endpoints[path].get('identity', {}).get('bytes', size)
+            stats = {
+                'bytes': size,
+                'ratio': round(size / identity_size, 4) if identity_size else 1,
+                'p50_ms': round(_percentile(latencies, 50), 3),
+                'p95_ms': round(_percentile(latencies, 95), 3),
+                # Latence serveur + temps de transfert estimé au débit donné
+                'transfer_ms': round(size / bytes_per_second * 1000, 3)
+            }
+            endpoints[path][encoding] = stats
+            print(f" {path:16s} {encoding:9s} {size:10d} {stats['ratio']:7.3f} {stats['p50_ms']:8.2f} "
+                  f"{stats['p95_ms']:8.2f} {stats['transfer_ms']:13.2f}")
+
+    results = {
+        'meta': {
+            'commit': _git_commit(),
+            'date': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+            'database': dialect,
+            'mode': 'compression',
+            'rounds': args.rounds,
+            'bandwidth_mbit_s': args.debit,
+            'dataset': counts
+        },
+        'endpoints': endpoints
+    }
+    _write_results(results, args.output, 'compression')
+
+
+# ============ CONCURRENCE DES PRÊTS ============
+
+def _checkout_naive(id_utilisateur, id_livre, id_membre):
+    """Ancienne implémentation : lecture, test et décrément en Python (lost update possible)"""
+    from models import db, Livre, Membre, Emprunt
+    livre = Livre.query.filter_by(id_livre=id_livre, id_utilisateur=id_utilisateur).first()
+    membre = Membre.query.filter_by(id_membre=id_membre, id_utilisateur=id_utilisateur).first()
+    if not livre or livre.disponibles <= 0 or not membre or membre.statut != 'actif':
+        return False
+    livre.disponibles -= 1
+    db.session.add(Emprunt(id_livre=id_livre, id_membre=id_membre, statut='en_cours',
+                           date_retour_prevue=datetime.utcnow().date()))
+    return True
+
+
+def _checkout_lock(id_utilisateur, id_livre, id_membre):
+    """Verrou de ligne : SELECT ... FOR UPDATE puis décrément (sans effet sur SQLite)"""
+    from models import db, Livre, Membre, Emprunt
+    livre = Livre.query.filter_by(id_livre=id_livre, id_utilisateur=id_utilisateur).with_for_update().first()
+    membre = Membre.query.filter_by(id_membre=id_membre, id_utilisateur=id_utilisateur).first()
+    if not livre or livre.disponibles <= 0 or not membre or membre.statut != 'actif':
+        return False
+    livre.disponibles -= 1
+    db.session.add(Emprunt(id_livre=id_livre, id_membre=id_membre, statut='en_cours',
+                           date_retour_prevue=datetime.utcnow().date()))
+    return True
+
+
+def _checkout_atomic(id_utilisateur, id_livre, id_membre):
+    """Implémentation actuelle : UPDATE conditionnel (circulation.emprunter)"""
+    from circulation import CirculationError, emprunter
+    try:
+        emprunter(id_utilisateur, id_livre, id_membre)
+    except CirculationError:
+        return False
+    return True
+
+
+CHECKOUT_STRATEGIES = {'naive': _checkout_naive, 'lock': _checkout_lock, 'atomic': _checkout_atomic}
+
+
+def command_concurrence(args):
+    """Prêts simultanés du même livre : exactitude du stock et débit selon la stratégie"""
+    app = _load_app(args.database)
+    from exemplaires import creer_exemplaires
+    from models import db, Livre, Membre, Emprunt
+
+    tenant_ids, counts, dialect = _bench_context(app)
+    tenant_id = tenant_ids[0]
+
+    print(f"\n {args.tentatives} tentatives de prêt sur {args.exemplaires} exemplaires, "
+          f"{args.threads} threads ({dialect})\n")
+    print(f" {'stratégie':10s} {'succès':>7s} {'refus':>6s} {'erreurs':>8s} {'stock final':>12s} "
+          f"{'emprunts':>9s} {'correct':>8s} {'prêts/s':>9s} {'p95 ms':>8s}")
+    strategies = {}
+    for name in args.strategies.split(','):
+        checkout = CHECKOUT_STRATEGIES[name]
+        with app.app_context():
+            livre = Livre(titre=f'Concurrence {name}', auteur='Benchmark', nombre_exemplaires=args.exemplaires,
+                          disponibles=args.exemplaires, id_utilisateur=tenant_id)
+            membre = Membre(nom='Concurrence', prenom=name, email=f'concurrence.{name}@exemple.test',
+                            statut='actif', id_utilisateur=tenant_id)
+            db.session.add_all([livre, membre])
+            db.session.flush()
+            # Exemplaires physiques : la stratégie atomic sort un exemplaire à chaque prêt
+            creer_exemplaires(tenant_id, livre.id_livre, args.exemplaires)
+            db.session.commit()
+            id_livre, id_membre = livre.id_livre, membre.id_membre
+
+        outcomes = {'succes': 0, 'refus': 0, 'erreurs': 0}
+        latencies = []
+        lock = threading.Lock()
+        remaining = iter(range(args.tentatives))
+
+        def worker():
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        return
+                start = time.perf_counter()
+                with app.app_context():
+                    try:
+                        result = 'succes' if checkout(tenant_id, id_livre, id_membre) else 'refus'
+                        db.session.commit()
+                    except Exception:
+                        db.session.rollback()
+                        result = 'erreurs'
+                with lock:
+                    outcomes[result] += 1
+                    latencies.append((time.perf_counter() - start) * 1000)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_time = time.perf_counter() - started
+
+        with app.app_context():
+            stock = db.session.get(Livre, id_livre).disponibles
+            emprunts = Emprunt.query.filter_by(id_livre=id_livre).count()
+        latencies.sort()
+        stats = dict(outcomes)
+        stats.update({
+            'stock_final': stock,
+            'emprunts': emprunts,
+            # Exact : aucun exemplaire survendu et le stock reflète les emprunts créés
+            'correct': stock >= 0 and emprunts <= args.exemplaires and stock + emprunts == args.exemplaires,
+            'checkouts_per_s': round(args.tentatives / wall_time, 2),
+            'p95_ms': round(_percentile(latencies, 95), 3)
+        })
+        strategies[name] = stats
+        print(f" {name:10s} {stats['succes']:7d} {stats['refus']:6d} {stats['erreurs']:8d} {stock:12d} "
+              f"{emprunts:9d} {'oui' if stats['correct'] else 'NON':>8s} {stats['checkouts_per_s']:9.1f} "
+              f"{stats['p95_ms']:8.2f}")
+
+    results = {
+        'meta': {
+            'commit': _git_commit(),
+            'date': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+            'database': dialect,
+            'mode': 'concurrence',
+            'threads': args.threads,
+            'copies': args.exemplaires,
+            'attempts': args.tentatives,
+            'dataset': counts
+        },
+        'strategies': strategies
+    }
+    _write_results(results, args.output, 'concurrence')
+
+
+def command_compare(args):
+    with open(args.old, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(args.new, encoding='utf-8') as f:
+        new = json.load(f)
+
+    print(f"\n {old['meta'].get('commit')} -> {new['meta'].get('commit')} (p95, seuil de régression {args.seuil}%)\n")
+    regressions = 0
+    for name in sorted(set(old['endpoints']) | set(new['endpoints'])):
+        before = old['endpoints'].get(name)
+        after = new['endpoints'].get(name)
+        if not before or not after:
+            print(f" {name:28s} {'(absent)':>30s}")
+            continue
+        change = (after['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0
+        flag = ''
+        if change > args.seuil:
+            flag = ' REGRESSION'
+            regressions += 1
+        print(f" {name:28s} {before['p95_ms']:9.2f} -> {after['p95_ms']:9.2f} ms ({change:+6.1f} %){flag}")
+    print(f"\n {regressions} régression(s)")
+    sys.exit(1 if regressions else 0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark de l\'API BiblioTech')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    seed = subparsers.add_parser('seed', help='Générer le jeu de données')
+    seed.add_argument('--database', default=DEFAULT_DATABASE)
+    seed.add_argument('--tenants', type=int, default=1000)
+    seed.add_argument('--livres', type=int, default=1000, help='Livres par bibliothèque')
+    seed.add_argument('--membres', type=int, default=300, help='Membres par bibliothèque')
+    seed.add_argument('--emprunts', type=int, default=2000, help='Emprunts par bibliothèque')
+    seed.add_argument('--seed', type=int, default=42)
+    seed.set_defaults(func=command_seed)
+
+    run = subparsers.add_parser('run', help='Lancer le benchmark')
+    run.add_argument('--database', default=DEFAULT_DATABASE)
+    run.add_argument('--url', help='Serveur HTTP à charger (ex: http://localhost:8000)')
+    run.add_argument('--rounds', type=int, default=20, help='Passages sur toutes les routes par session')
+    run.add_argument('--concurrency', type=int, default=4, help='Sessions simultanées')
+    run.add_argument('--seed', type=int, default=42)
+    run.add_argument('--output')
+    run.set_defaults(func=command_run)
+
+    compression = subparsers.add_parser('compression', help='Mesurer les gains de la compression')
+    compression.add_argument('--database', default=DEFAULT_DATABASE)
+    compression.add_argument('--rounds', type=int, default=10)
+    compression.add_argument('--debit', type=float, default=10.0, help='Débit client simulé (Mbit/s)')
+    compression.add_argument('--output')
+    compression.set_defaults(func=command_compression)
+
+    concurrence = subparsers.add_parser('concurrence', help='Prêts simultanés du même livre')
+    concurrence.add_argument('--database', default=DEFAULT_DATABASE)
+    concurrence.add_argument('--threads', type=int, default=16)
+    concurrence.add_argument('--exemplaires', type=int, default=50, help='Exemplaires du livre disputé')
+    concurrence.add_argument('--tentatives', type=int, default=400, help='Tentatives de prêt au total')
+    concurrence.add_argument('--strategies', default='naive,lock,atomic')
+    concurrence.add_argument('--output')
+    concurrence.set_defaults(func=command_concurrence)
+
+    compare = subparsers.add_parser('compare', help='Comparer deux résultats')
+    compare.add_argument('old')
+    compare.add_argument('new')
+    compare.add_argument('--seuil', type=float, default=10.0, help='Variation du p95 signalée comme régression (%%)')
+    compare.set_defaults(func=command_compare)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,390 @@
+"""
+Import en masse du catalogue (CSV, NDJSON, MARC21/UNIMARC, MARCXML, ONIX)
+
+Usage (ligne de commande) :
+  python catalogue_import.py livres.csv --email bibliothecaire@exemple.fr [--format csv|ndjson|marc|xml] [--lot 5000]
+
+Colonnes (CSV, séparateur , ou ;) ou clés (NDJSON, un objet par ligne) :
+titre, auteur (obligatoires), categorie, annee_publication, nombre_exemplaires.
+Les notices bibliographiques sont converties par notices.py.
+
+Le fichier est lu en flux : seul le lot courant est en mémoire. Chaque lot
+est validé, dédoublonné contre le fichier et contre les livres existants de
+la bibliothèque (index (id_utilisateur, empreinte), une requête IN par lot),
+puis inséré avec ses exemplaires par executemany et validé par un commit :
+une erreur n'annule que le lot en cours, et la progression est signalée
+après chaque lot. Aucun état ne grandit avec le fichier : un doublon d'un
+lot précédent est retrouvé dans la base, où ce lot a déjà été validé.
+
+Les lignes sont insérées sans la préparation des paramètres de SQLAlchemy,
+qui coûtait ~45 % de l'import : COPY sur PostgreSQL, executemany du pilote
+sur SQLite (voir _inserer) ; les ids des livres insérés sont relus par une
+seule requête pour créer leurs exemplaires.
+
+Débit mesuré sur SQLite (200 000 lignes CSV, un exemplaire par livre, lots
+de 5 000, mêmes conditions pour les deux mesures) : 30 000 à 38 000 livres/s,
+contre 17 000 à 27 000 en passant par SQLAlchemy Core ; environ 3 s pour
+réimporter le même fichier (200 000 doublons). La taille des lots change
+peu ce débit (~40 000 livres/s avec des lots de 50 000). Le profil restant :
+executemany SQLite ~40 % (maintenance des index des livres et des
+exemplaires), lecture CSV, validation et empreintes ~30 %, recherche des
+doublons, relecture des ids et commits ~20 % : l'objectif de 50 000 livres/s
+n'est pas atteint sur cette machine, le coût restant étant celui de SQLite
+et de la lecture du fichier plutôt que celui de SQLAlchemy.
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import sys
+import time
+from sqlalchemy import bindparam, func, insert, select
+from exemplaires import code_barres_defaut
+from notices import lire_marc, lire_xml
+from models import db, Livre, Exemplaire, cle_livre, empreinte_livre
+from sync import stamp
+from versioning import bump_versions
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # Repli sur le module json standard
+    _loads = json.loads
+
+# MARCXML et ONIX sont distingués par l'élément racine du document
+FORMATS = {
+    'csv': 'csv', 'ndjson': 'ndjson', 'jsonl': 'ndjson',
+    'marc': 'marc', 'mrc': 'marc', 'xml': 'xml', 'marcxml': 'xml', 'onix': 'xml'
+}
+MIMETYPES = {
+    'text/csv': 'csv', 'application/x-ndjson': 'ndjson', 'application/jsonl': 'ndjson',
+    'application/marc': 'marc', 'application/marcxml+xml': 'xml', 'application/xml': 'xml', 'text/xml': 'xml'
+}
+MAX_EXEMPLAIRES = 1000
+COMPTEURS = ('lignes', 'importes', 'doublons', 'rejetes')
+
+
+# ============ LECTURE EN FLUX ============
+
+def detecter_format(nom_fichier=None, mimetype=None, format_demande=None):
+    """Format du fichier : paramètre explicite, sinon extension, sinon type MIME ; lève ValueError"""
+    if format_demande:
+        if format_demande.lower() not in FORMATS:
+            raise ValueError("Format inconnu (csv, ndjson, marc ou xml)")
+        return FORMATS[format_demande.lower()]
+    extension = os.path.splitext(nom_fichier or '')[1].lstrip('.').lower()
+    if extension in FORMATS:
+        return FORMATS[extension]
+    if mimetype in MIMETYPES:
+        return MIMETYPES[mimetype]
+    raise ValueError("Format indéterminé : préciser format=csv, ndjson, marc ou xml")
+
+
+def lire_csv(flux, obligatoires=('titre', 'auteur')):
+    """(numéro de ligne, dict) pour chaque ligne d'un flux CSV binaire (en-tête avec les colonnes obligatoires)"""
+    texte = io.TextIOWrapper(flux, encoding='utf-8-sig', newline='')
+    entete = texte.readline()
+    if not entete.strip():
+        return
+    delimiteur = ';' if entete.count(';') > entete.count(',') else ','
+    lecteur = csv.reader(itertools.chain([entete], texte), delimiter=delimiteur)
+    colonnes = [colonne.strip().lower() for colonne in next(lecteur)]
+    manquantes = set(obligatoires) - set(colonnes)
+    if manquantes:
+        raise ValueError(f"Colonne(s) obligatoire(s) absente(s) : {', '.join(sorted(manquantes))}")
+    for valeurs in lecteur:
+        if ''.join(valeurs).strip():
+            yield lecteur.line_num, dict(zip(colonnes, valeurs))
+
+
+def lire_ndjson(flux):
+    """(numéro de ligne, objet ou ValueError si JSON invalide) pour chaque ligne d'un flux NDJSON binaire"""
+    for numero, ligne in enumerate(flux, 1):
+        if not ligne.strip():
+            continue
+        try:
+            yield numero, _loads(ligne)
+        except ValueError:
+            yield numero, ValueError('JSON invalide')
+
+
+LECTEURS = {'csv': lire_csv, 'ndjson': lire_ndjson, 'marc': lire_marc, 'xml': lire_xml}
+
+
+def lire_lignes(flux, format_fichier):
+    return LECTEURS[format_fichier](flux)
+
+
+# ============ VALIDATION ============
+
+def _entier(valeur):
+    """Entier d'une cellule CSV ou d'une valeur JSON ; None si vide ; lève ValueError si invalide"""
+    if valeur is None or valeur == '':
+        return None
+    if type(valeur) is str:
+        # Cas courant (cellule CSV) : int() ignore lui-même les espaces autour du nombre
+        return int(valeur)
+    if isinstance(valeur, bool):
+        raise ValueError
+    if isinstance(valeur, float) and valeur.is_integer():
+        return int(valeur)
+    if isinstance(valeur, int):
+        return valeur
+    return int(str(valeur).strip())
+
+
+def valider(donnees):
+    """Valeurs d'un livre à insérer, ou message d'erreur : retourne (valeurs, None) ou (None, erreur)"""
+    if isinstance(donnees, ValueError):
+        return None, str(donnees)
+    if not isinstance(donnees, dict):
+        return None, 'Objet JSON attendu'
+
+    titre = str(donnees.get('titre') or '').strip()
+    auteur = str(donnees.get('auteur') or '').strip()
+    categorie = str(donnees.get('categorie') or '').strip()
+    if not titre or not auteur:
+        return None, 'titre et auteur requis'
+    if len(titre) > 255 or len(auteur) > 255 or len(categorie) > 100:
+        return None, 'Texte trop long (titre et auteur : 255 caractères, categorie : 100)'
+
+    try:
+        annee = _entier(donnees.get('annee_publication'))
+    except ValueError:
+        return None, 'annee_publication invalide'
+    try:
+        nombre = _entier(donnees.get('nombre_exemplaires'))
+    except ValueError:
+        return None, 'nombre_exemplaires invalide'
+    nombre = 1 if nombre is None else nombre
+    if not 1 <= nombre <= MAX_EXEMPLAIRES:
+        return None, f'nombre_exemplaires doit être compris entre 1 et {MAX_EXEMPLAIRES}'
+
+    return {
+        'titre': titre,
+        'auteur': auteur,
+        'categorie': categorie,
+        'annee_publication': annee,
+        'nombre_exemplaires': nombre
+    }, None
+
+
+# ============ INSERTION ============
+
+# Colonnes écrites par l'import, valeurs par défaut des modèles comprises (l'insertion
+# au niveau du pilote ne les applique pas) ; l'ordre est celui des tuples de _importer_lot
+COLONNES_LIVRE = ('titre', 'auteur', 'categorie', 'annee_publication', 'nombre_exemplaires', 'disponibles',
+                  'id_utilisateur', 'empreinte', 'version', 'updated_at')
+COLONNES_EXEMPLAIRE = ('id_utilisateur', 'id_livre', 'code_barres', 'statut', 'date_ajout', 'version', 'updated_at')
+# Format de stockage des DateTime de SQLAlchemy sous SQLite, lu aussi par PostgreSQL
+FORMAT_HORODATAGE = '%Y-%m-%d %H:%M:%S.%f'
+_ECHAPPEMENTS_COPY = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _champ_copy(valeur):
+    """Valeur d'une colonne au format texte de COPY (NULL : \\N)"""
+    if valeur is None:
+        return '\\N'
+    if isinstance(valeur, str):
+        return valeur.translate(_ECHAPPEMENTS_COPY)
+    return str(valeur)
+
+
+def _inserer(table, colonnes, lignes):
+    """
+    Insère des tuples dans la transaction courante sans la préparation ligne par
+    ligne de SQLAlchemy : COPY sur PostgreSQL, executemany du pilote sur SQLite,
+    INSERT SQLAlchemy Core sur les autres bases
+    """
+    connexion = db.session.connection()
+    dialecte = connexion.dialect.name
+    if dialecte == 'postgresql':
+        tampon = io.StringIO()
+        tampon.writelines('\t'.join(map(_champ_copy, ligne)) + '\n' for ligne in lignes)
+        tampon.seek(0)
+        with connexion.connection.cursor() as curseur:
+            curseur.copy_expert(f"COPY {table.name} ({', '.join(colonnes)}) FROM STDIN", tampon)
+    elif dialecte == 'sqlite':
+        connexion.exec_driver_sql(
+            f"INSERT INTO {table.name} ({', '.join(colonnes)}) VALUES ({', '.join('?' * len(colonnes))})", lignes
+        )
+    else:
+        connexion.execute(insert(table), [dict(zip(colonnes, ligne)) for ligne in lignes])
+
+
+# ============ IMPORT ============
+
+class ImportCatalogue:
+    """Import d'un flux de lignes (numéro, données) dans le catalogue d'une bibliothèque"""
+
+    def __init__(self, id_utilisateur, taille_lot=5000, max_erreurs=100, progression=None,
+                 point_de_reprise=None, rapport=None):
+        """
+        `point_de_reprise(position, rapport)` est appelé dans la transaction de
+        chaque lot, avant son commit : la position (numéro de la dernière ligne
+        lue) enregistrée est donc toujours celle des lignes réellement importées.
+        `rapport` reprend les compteurs d'un import interrompu.
+        """
+        self.id_utilisateur = id_utilisateur
+        self.taille_lot = taille_lot
+        self.max_erreurs = max_erreurs
+        self.progression = progression
+        self.point_de_reprise = point_de_reprise
+        self.rapport = rapport or {'lignes': 0, 'importes': 0, 'doublons': 0, 'rejetes': 0, 'erreurs': []}
+        self.position = 0
+
+    def executer(self, lignes):
+        """Importe toutes les lignes ; retourne le rapport (compteurs et erreurs par ligne)"""
+        start = time.perf_counter()
+        importes = self.rapport['importes']
+        lot = []
+        for numero, donnees in lignes:
+            self.position = numero
+            self.rapport['lignes'] += 1
+            valeurs, erreur = valider(donnees)
+            if erreur:
+                self._rejeter(numero, erreur)
+                continue
+            lot.append((numero, valeurs))
+            if len(lot) >= self.taille_lot:
+                self._importer_lot(lot)
+                lot = []
+        if lot:
+            self._importer_lot(lot)
+
+        duree = time.perf_counter() - start
+        self.rapport['duree_ms'] = round(duree * 1000)
+        self.rapport['livres_par_seconde'] = round((self.rapport['importes'] - importes) / duree) if duree > 0 else None
+        return self.rapport
+
+    def _rejeter(self, numero, erreur, nombre=1):
+        self.rapport['rejetes'] += nombre
+        if len(self.rapport['erreurs']) < self.max_erreurs:
+            self.rapport['erreurs'].append({'ligne': numero, 'erreur': erreur})
+        else:
+            self.rapport['erreurs_tronquees'] = True
+
+    def _existants(self, empreintes):
+        """Clés des livres de la bibliothèque ayant l'une de ces empreintes"""
+        return {
+            cle_livre(titre, auteur, annee)
+            for titre, auteur, annee in db.session.execute(
+                select(Livre.titre, Livre.auteur, Livre.annee_publication).where(
+                    Livre.id_utilisateur == self.id_utilisateur,
+                    # Paramètre unique développé à l'exécution : pas de coercition de chaque valeur
+                    Livre.empreinte.in_(bindparam('empreintes', expanding=True))
+                ),
+                {'empreintes': list(empreintes)}
+            )
+        }
+
+    def _importer_lot(self, lot):
+        empreintes = [empreinte_livre(v['titre'], v['auteur'], v['annee_publication']) for _, v in lot]
+        livres, nouvelles, doublons = [], set(), 0
+        try:
+            existants = self._existants(set(empreintes))
+            valeurs = stamp(self.id_utilisateur)
+            # Valeurs communes au lot, au format attendu par le pilote
+            version, horodatage = valeurs['version'], valeurs['updated_at'].strftime(FORMAT_HORODATAGE)
+            jour = valeurs['updated_at'].date().isoformat()
+            for (_, livre), empreinte in zip(lot, empreintes):
+                if empreinte in nouvelles or (
+                        existants and cle_livre(livre['titre'], livre['auteur'], livre['annee_publication']) in existants):
+                    doublons += 1
+                    continue
+                nouvelles.add(empreinte)
+                livres.append((
+                    livre['titre'], livre['auteur'], livre['categorie'], livre['annee_publication'],
+                    livre['nombre_exemplaires'], livre['nombre_exemplaires'], self.id_utilisateur, empreinte,
+                    version, horodatage
+                ))
+
+            if livres:
+                dernier = db.session.scalar(select(func.max(Livre.id_livre))) or 0
+                _inserer(Livre.__table__, COLONNES_LIVRE, livres)
+                # Livres insérés par ce lot : ids au-delà du dernier existant (colonnes de la
+                # table plutôt que du modèle : lecture de tuples sans passer par l'ORM)
+                colonnes = Livre.__table__.c
+                ids = {
+                    empreinte: id_livre
+                    for empreinte, id_livre in db.session.execute(
+                        select(colonnes.empreinte, colonnes.id_livre)
+                        .where(colonnes.id_utilisateur == self.id_utilisateur, colonnes.id_livre > dernier)
+                    )
+                    if empreinte in nouvelles
+                }
+                exemplaires = []
+                for livre in livres:
+                    id_livre = ids[livre[7]]
+                    exemplaires += [
+                        (self.id_utilisateur, id_livre, code_barres_defaut(id_livre, numero), 'disponible', jour,
+                         version, horodatage)
+                        for numero in range(1, livre[4] + 1)
+                    ]
+                _inserer(Exemplaire.__table__, COLONNES_EXEMPLAIRE, exemplaires)
+                bump_versions(self.id_utilisateur, 'livres', 'exemplaires')
+            if self.point_de_reprise is not None:
+                self.point_de_reprise(self.position, {
+                    **self.rapport,
+                    'importes': self.rapport['importes'] + len(livres),
+                    'doublons': self.rapport['doublons'] + doublons
+                })
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self._rejeter(lot[0][0], f"Lot de {len(lot)} lignes non importé : {e}", nombre=len(lot))
+            if self.point_de_reprise is not None:
+                self.point_de_reprise(self.position, self.rapport)
+                db.session.commit()
+            return
+
+        self.rapport['importes'] += len(livres)
+        self.rapport['doublons'] += doublons
+        if self.progression is not None:
+            self.progression({compteur: self.rapport[compteur] for compteur in COMPTEURS})
+
+
+# ============ LIGNE DE COMMANDE ============
+
+def _afficher_progression(compteurs):
+    print(f"\r {compteurs['lignes']} lignes lues, {compteurs['importes']} importées, "
+          f"{compteurs['doublons']} doublons, {compteurs['rejetes']} rejetées", end='', file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import en masse du catalogue BiblioTech')
+    parser.add_argument('fichier')
+    parser.add_argument('--email', required=True, help='Compte de la bibliothèque destinataire')
+    parser.add_argument('--format', choices=sorted(FORMATS), help='Déduit de l\'extension par défaut')
+    parser.add_argument('--lot', type=int, default=5000, help='Livres insérés par transaction')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    from app import app
+    from models import Utilisateur
+
+    with app.app_context():
+        utilisateur = Utilisateur.query.filter_by(email=args.email).first()
+        if utilisateur is None:
+            sys.exit(f"Utilisateur inconnu : {args.email}")
+        try:
+            format_fichier = detecter_format(args.fichier, format_demande=args.format)
+            with open(args.fichier, 'rb') as flux:
+                rapport = ImportCatalogue(
+                    utilisateur.id_utilisateur, taille_lot=args.lot, progression=_afficher_progression
+                ).executer(lire_lignes(flux, format_fichier))
+        except ValueError as e:
+            sys.exit(f"Import impossible : {e}")
+
+    print(file=sys.stderr)
+    print(f" {rapport['importes']} livres importés en {rapport['duree_ms']} ms "
+          f"({rapport['livres_par_seconde']} livres/s), {rapport['doublons']} doublons, {rapport['rejetes']} rejetées")
+    for erreur in rapport['erreurs']:
+        print(f"  ligne {erreur['ligne']} : {erreur['erreur']}")
+    sys.exit(1 if rapport['rejetes'] else 0)
+
+
+if __name__ == '__main__':
+    main()
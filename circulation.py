@@ -0,0 +1,593 @@
+"""
+Prêts et retours par mises à jour conditionnelles
+
+Le stock n'est jamais lu puis réécrit en Python : `disponibles` est modifié
+par un UPDATE unique dont la clause WHERE porte la condition (exemplaire
+restant, emprunt encore en cours). La ligne modifiée (RETURNING) indique si
+l'opération a eu lieu. Deux prêts simultanés du dernier exemplaire, ou deux
+retours simultanés du même emprunt, ne peuvent donc pas réussir tous les
+deux, sans verrou explicite ni lecture préalable.
+
+Réservations : file FIFO par livre (ordre des id_reservation). Un exemplaire
+rendu est d'abord mis de côté pour la tête de file (statut `disponible`
+jusqu'à `date_expiration`) et ne revient en stock que si la file est vide.
+L'exemplaire physique mis de côté passe au statut `reserve` et la réservation
+le référence : un prêt ordinaire ne choisit que parmi les exemplaires `disponible`.
+La tête est lue par l'index (id_livre, statut, id_reservation), sans
+parcourir les réservations.
+
+Les fonctions n'effectuent pas le commit : la route appelante valide la
+transaction (ou l'annule sur CirculationError).
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import case, func, select, update
+from models import db, Livre, Membre, Exemplaire, Emprunt, Amende, Reservation
+from sync import stamp, transaction_version
+
+DUREE_EMPRUNT_JOURS = 14
+AMENDE_PAR_JOUR = 0.50
+AMENDE_PLAFOND = 20.00  # Montant maximal d'une amende de retard
+DELAI_RETRAIT_JOURS = 3  # Durée pendant laquelle un exemplaire réservé reste mis de côté
+# Emprunts non retournés (le job des retards fait passer les seconds de l'un à l'autre)
+STATUTS_EN_COURS = ('en_cours', 'en_retard')
+TENTATIVES_EXEMPLAIRE = 3  # Exemplaire pris par un prêt concurrent entre la sélection et l'UPDATE
+
+
+class CirculationError(Exception):
+    """Prêt ou retour refusé (message et code HTTP destinés au client)"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def prendre_exemplaire(id_utilisateur, id_livre):
+    """Décrémente `disponibles` s'il reste un exemplaire ; retourne le nouveau stock ou None"""
+    return db.session.execute(
+        update(Livre)
+        .where(Livre.id_livre == id_livre,
+               Livre.id_utilisateur == id_utilisateur,
+               Livre.disponibles > 0)
+        .values(disponibles=Livre.disponibles - 1, **stamp(id_utilisateur))
+        .returning(Livre.disponibles)
+    ).scalar()
+
+
+def rendre_exemplaire(id_utilisateur, id_livre, nombre=1):
+    """Incrémente `disponibles` ; retourne le nouveau stock"""
+    return db.session.execute(
+        update(Livre)
+        .where(Livre.id_livre == id_livre, Livre.id_utilisateur == id_utilisateur)
+        .values(disponibles=Livre.disponibles + nombre, **stamp(id_utilisateur))
+        .returning(Livre.disponibles)
+    ).scalar()
+
+
+def sortir_exemplaire(id_utilisateur, id_livre, id_exemplaire=None, statut='emprunte'):
+    """
+    Marque emprunté (ou `statut`) l'exemplaire physique scanné, ou à défaut le premier
+    disponible du livre ; retourne son id ou None (exemplaire déjà sorti ou mis de côté,
+    ou plus aucun exemplaire libre)
+
+    Le premier disponible est verrouillé (FOR UPDATE SKIP LOCKED sur PostgreSQL) :
+    deux prêts simultanés du même livre prennent chacun un exemplaire différent
+    au lieu de viser le même et de n'en obtenir aucun.
+    """
+    if id_exemplaire is not None:
+        return _changer_statut(id_utilisateur, id_livre, id_exemplaire, statut)
+    for _ in range(TENTATIVES_EXEMPLAIRE):
+        candidat = db.session.scalar(
+            select(Exemplaire.id_exemplaire)
+            .where(Exemplaire.id_livre == id_livre, Exemplaire.statut == 'disponible')
+            .order_by(Exemplaire.id_exemplaire)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        if candidat is None:
+            return None
+        id_exemplaire = _changer_statut(id_utilisateur, id_livre, candidat, statut)
+        if id_exemplaire is not None:
+            return id_exemplaire
+    return None
+
+
+def _changer_statut(id_utilisateur, id_livre, id_exemplaire, statut):
+    return db.session.execute(
+        update(Exemplaire)
+        .where(Exemplaire.id_exemplaire == id_exemplaire,
+               Exemplaire.id_livre == id_livre,
+               Exemplaire.statut == 'disponible')
+        .values(statut=statut, **stamp(id_utilisateur))
+        .returning(Exemplaire.id_exemplaire)
+    ).scalar()
+
+
+def rentrer_exemplaires(id_utilisateur, ids_exemplaires):
+    """Remet en rayon les exemplaires physiques des emprunts clôturés ou des réservations libérées"""
+    ids_exemplaires = [id_exemplaire for id_exemplaire in ids_exemplaires if id_exemplaire is not None]
+    if ids_exemplaires:
+        db.session.execute(
+            update(Exemplaire)
+            .where(Exemplaire.id_exemplaire.in_(ids_exemplaires), Exemplaire.id_utilisateur == id_utilisateur)
+            .values(statut='disponible', **stamp(id_utilisateur))
+        )
+
+
+def retirer_reservation(id_utilisateur, id_livre, id_membre):
+    """
+    Clôt la réservation mise de côté pour ce membre (l'exemplaire lui revient) ;
+    retourne (id_reservation, id de l'exemplaire mis de côté) ou None
+    """
+    # Une seule réservation active par membre et par livre (voir reserver)
+    return db.session.execute(
+        update(Reservation)
+        .where(Reservation.id_livre == id_livre,
+               Reservation.id_membre == id_membre,
+               Reservation.statut == 'disponible')
+        .values(statut='satisfaite', **stamp(id_utilisateur))
+        .returning(Reservation.id_reservation, Reservation.id_exemplaire)
+    ).first()
+
+
+def prendre_exemplaire_ou_reservation(id_utilisateur, id_livre, id_membre):
+    """
+    Exemplaire pour un prêt : celui mis de côté pour le membre s'il en a un,
+    sinon un exemplaire du stock. Retourne (stock ou None si aucun exemplaire,
+    id de l'exemplaire mis de côté ou None).
+
+    L'exemplaire mis de côté repasse `disponible` : sortir_exemplaire le prend
+    ensuite (ou prend l'exemplaire scanné, le premier revenant alors en rayon).
+    """
+    reservation = retirer_reservation(id_utilisateur, id_livre, id_membre)
+    if reservation is not None:
+        rentrer_exemplaires(id_utilisateur, [reservation.id_exemplaire])
+        return db.session.scalar(select(Livre.disponibles).where(Livre.id_livre == id_livre)), reservation.id_exemplaire
+    return prendre_exemplaire(id_utilisateur, id_livre), None
+
+
+def emprunter(id_utilisateur, id_livre, id_membre, code_barres=None):
+    """
+    Crée un emprunt ; retourne (emprunt, disponibles)
+
+    Avec `code_barres` (scan au comptoir), l'emprunt porte sur cet exemplaire
+    (et `id_livre` peut être omis) ; sinon sur le premier exemplaire disponible.
+    """
+    scanne = None
+    if code_barres is not None:
+        scanne = db.session.execute(
+            select(Exemplaire.id_exemplaire, Exemplaire.id_livre)
+            .where(Exemplaire.id_utilisateur == id_utilisateur, Exemplaire.code_barres == code_barres)
+        ).first()
+        if scanne is None:
+            raise CirculationError('Exemplaire non trouvé', 404)
+        if id_livre is not None and id_livre != scanne.id_livre:
+            raise CirculationError("L'exemplaire scanné appartient à un autre livre")
+        id_livre = scanne.id_livre
+
+    statut = db.session.query(Membre.statut).filter_by(id_membre=id_membre, id_utilisateur=id_utilisateur).scalar()
+    if statut != 'actif':
+        raise CirculationError('Membre invalide')
+
+    disponibles, reserve = prendre_exemplaire_ou_reservation(id_utilisateur, id_livre, id_membre)
+    if disponibles is None:
+        raise CirculationError('Livre non disponible')
+
+    id_exemplaire = sortir_exemplaire(id_utilisateur, id_livre, scanne.id_exemplaire if scanne else reserve)
+    if id_exemplaire is None:
+        # Le stock a été décrémenté : la route annule la transaction
+        if scanne is not None:
+            raise CirculationError('Exemplaire déjà emprunté')
+        raise CirculationError('Aucun exemplaire libre, réessayer', 409)
+
+    emprunt = _nouvel_emprunt(id_livre, id_membre, id_exemplaire)
+    db.session.add(emprunt)
+    return emprunt, disponibles
+
+
+def _nouvel_emprunt(id_livre, id_membre, id_exemplaire=None):
+    return Emprunt(
+        id_livre=id_livre,
+        id_membre=id_membre,
+        id_exemplaire=id_exemplaire,
+        date_retour_prevue=datetime.utcnow() + timedelta(days=DUREE_EMPRUNT_JOURS),
+        statut='en_cours'
+    )
+
+
+def calculer_amende(date_retour_prevue, date_retour):
+    """Montant dû pour un retour à `date_retour` (0 si dans les délais, AMENDE_PLAFOND au plus)"""
+    jours_retard = (date_retour - date_retour_prevue).days
+    return min(jours_retard * AMENDE_PAR_JOUR, AMENDE_PLAFOND) if jours_retard > 0 else 0
+
+
+def _solder_amendes(id_utilisateur, lignes, aujourd_hui):
+    """
+    Amendes des emprunts clôturés, à partir de (id_emprunt, date_retour_prevue) : {id_emprunt: amende}
+
+    L'amende ouverte par le job des retards (date_calcul renseignée) est arrêtée
+    au montant final ; à défaut, le reliquat non encore facturé (par exemple
+    après paiement d'une amende en cours de calcul) fait l'objet d'une nouvelle amende.
+    """
+    dus = {}
+    for id_emprunt, date_retour_prevue in lignes:
+        montant = calculer_amende(date_retour_prevue, aujourd_hui)
+        if montant:
+            dus[id_emprunt] = montant
+    if not dus:
+        return {}
+
+    factures, ouvertes = Counter(), {}
+    for id_amende, id_emprunt, montant, statut, date_calcul in db.session.execute(
+        select(Amende.id_amende, Amende.id_emprunt, Amende.montant, Amende.statut, Amende.date_calcul)
+        .where(Amende.id_emprunt.in_(dus))
+    ):
+        factures[id_emprunt] += montant
+        if date_calcul is not None and statut == 'impayee':
+            ouvertes[id_emprunt] = id_amende
+
+    amendes, reliquats = {}, {}
+    for id_emprunt, montant in dus.items():
+        reliquat = montant - factures[id_emprunt]
+        if id_emprunt in ouvertes:
+            reliquats[ouvertes[id_emprunt]] = reliquat
+        elif reliquat > 0:
+            amendes[id_emprunt] = Amende(id_emprunt=id_emprunt, montant=reliquat, statut='impayee')
+    db.session.add_all(amendes.values())
+
+    if reliquats:
+        for ligne in db.session.execute(
+            update(Amende)
+            .where(Amende.id_amende.in_(reliquats))
+            .values(montant=Amende.montant + case(reliquats, value=Amende.id_amende),
+                    date_calcul=None, **stamp(id_utilisateur))
+            .returning(Amende.id_amende, Amende.id_emprunt, Amende.montant)
+        ):
+            amendes[ligne.id_emprunt] = ligne
+    return amendes
+
+
+def retourner(id_utilisateur, id_emprunt):
+    """
+    Clôture un emprunt en cours ou en retard
+
+    Retourne (id_livre, amende ou None, disponibles, réservation servie ou None) :
+    l'exemplaire rendu est mis de côté pour la tête de file du livre s'il y en a une.
+    """
+    aujourd_hui = datetime.utcnow().date()
+    row = db.session.execute(
+        update(Emprunt)
+        .where(Emprunt.id_emprunt == id_emprunt,
+               Emprunt.statut.in_(STATUTS_EN_COURS),
+               Emprunt.id_livre.in_(select(Livre.id_livre).where(Livre.id_utilisateur == id_utilisateur)))
+        .values(statut='retourne', date_retour_reelle=aujourd_hui, **stamp(id_utilisateur))
+        .returning(Emprunt.id_livre, Emprunt.date_retour_prevue, Emprunt.id_exemplaire)
+    ).first()
+
+    if row is None:
+        existe = db.session.query(Emprunt.id_emprunt).join(Livre).filter(
+            Emprunt.id_emprunt == id_emprunt,
+            Livre.id_utilisateur == id_utilisateur
+        ).first()
+        if existe is None:
+            raise CirculationError('Emprunt non trouvé', 404)
+        raise CirculationError('Emprunt déjà retourné')
+
+    id_livre, date_retour_prevue, id_exemplaire = row
+    rentrer_exemplaires(id_utilisateur, [id_exemplaire])
+    amende = _solder_amendes(id_utilisateur, [(id_emprunt, date_retour_prevue)], aujourd_hui).get(id_emprunt)
+    servies, disponibles = liberer_exemplaires(id_utilisateur, id_livre, preferes=[id_exemplaire])
+
+    return id_livre, amende, disponibles, servies[0] if servies else None
+
+
+# ============ TRAITEMENT PAR LOT ============
+
+def _identifiant(valeur):
+    return valeur if isinstance(valeur, int) and not isinstance(valeur, bool) else None
+
+
+def emprunter_lot(id_utilisateur, demandes):
+    """
+    Crée plusieurs emprunts dans la transaction courante
+
+    Membres et livres sont validés par deux requêtes IN ; chaque exemplaire est
+    ensuite pris par un UPDATE conditionnel, dans l'ordre des demandes (si le
+    stock s'épuise, les demandes suivantes du même livre sont refusées), dans un
+    point de sauvegarde annulé si aucun exemplaire physique ne peut sortir (409).
+    Retourne un résultat par demande : {'status': 201, 'emprunt': {...}} ou {'status', 'error'}.
+    """
+    demandes = [(_identifiant(d.get('id_livre')), _identifiant(d.get('id_membre'))) if isinstance(d, dict)
+                else (None, None) for d in demandes]
+    ids_livres = {id_livre for id_livre, _ in demandes if id_livre is not None}
+    ids_membres = {id_membre for _, id_membre in demandes if id_membre is not None}
+
+    statuts = dict(db.session.execute(
+        select(Membre.id_membre, Membre.statut)
+        .where(Membre.id_utilisateur == id_utilisateur, Membre.id_membre.in_(ids_membres))
+    ).all()) if ids_membres else {}
+    livres = set(db.session.scalars(
+        select(Livre.id_livre).where(Livre.id_utilisateur == id_utilisateur, Livre.id_livre.in_(ids_livres))
+    )) if ids_livres else set()
+
+    # Séquence réservée hors des points de sauvegarde : leur annulation ne doit pas la libérer
+    transaction_version(id_utilisateur)
+    resultats, crees = [], []
+    for id_livre, id_membre in demandes:
+        if id_livre is None or id_membre is None:
+            resultats.append({'status': 400, 'error': 'id_livre et id_membre requis'})
+            continue
+        if statuts.get(id_membre) != 'actif':
+            resultats.append({'status': 400, 'error': 'Membre invalide'})
+            continue
+        if id_livre not in livres:
+            resultats.append({'status': 400, 'error': 'Livre non disponible'})
+            continue
+        # Point de sauvegarde : stock et réservation restaurés si aucun exemplaire ne peut sortir
+        point = db.session.begin_nested()
+        disponibles, reserve = prendre_exemplaire_ou_reservation(id_utilisateur, id_livre, id_membre)
+        id_exemplaire = sortir_exemplaire(id_utilisateur, id_livre, reserve) if disponibles is not None else None
+        if id_exemplaire is None:
+            point.rollback()
+            resultats.append({'status': 400, 'error': 'Livre non disponible'} if disponibles is None
+                             else {'status': 409, 'error': 'Aucun exemplaire libre, réessayer'})
+            continue
+        point.commit()
+        emprunt = _nouvel_emprunt(id_livre, id_membre, id_exemplaire)
+        crees.append(emprunt)
+        resultats.append({'status': 201, 'emprunt': emprunt, 'disponibles': disponibles})
+
+    db.session.add_all(crees)
+    # Flush (INSERT groupé) pour connaître les identifiants sans relire chaque emprunt après le commit
+    db.session.flush()
+    for resultat in resultats:
+        emprunt = resultat.get('emprunt')
+        if emprunt is not None:
+            resultat['emprunt'] = {
+                'id_emprunt': emprunt.id_emprunt,
+                'id_livre': emprunt.id_livre,
+                'id_membre': emprunt.id_membre,
+                'id_exemplaire': emprunt.id_exemplaire,
+                'date_retour_prevue': emprunt.date_retour_prevue.strftime('%Y-%m-%d'),
+                'statut': emprunt.statut,
+                'version': emprunt.version
+            }
+    return resultats
+
+
+def retourner_lot(id_utilisateur, ids_emprunts):
+    """
+    Clôture plusieurs emprunts dans la transaction courante
+
+    Un seul UPDATE conditionnel clôture tous les emprunts encore en cours, un
+    second remet les exemplaires en stock (un CASE par livre), et les amendes
+    de retard sont insérées ou soldées en une fois. Seuls les livres ayant une
+    file d'attente (une requête IN pour les trouver) passent par l'attribution. Retourne un résultat par identifiant.
+    """
+    aujourd_hui = datetime.utcnow().date()
+    ids = [_identifiant(id_emprunt) for id_emprunt in ids_emprunts]
+    demandes = {id_emprunt for id_emprunt in ids if id_emprunt is not None}
+
+    lignes = db.session.execute(
+        update(Emprunt)
+        .where(Emprunt.id_emprunt.in_(demandes),
+               Emprunt.statut.in_(STATUTS_EN_COURS),
+               Emprunt.id_livre.in_(select(Livre.id_livre).where(Livre.id_utilisateur == id_utilisateur)))
+        .values(statut='retourne', date_retour_reelle=aujourd_hui, **stamp(id_utilisateur))
+        .returning(Emprunt.id_emprunt, Emprunt.id_livre, Emprunt.id_membre, Emprunt.date_retour_prevue,
+                   Emprunt.id_exemplaire)
+    ).all() if demandes else []
+    retournes = {ligne.id_emprunt: ligne for ligne in lignes}
+    rentrer_exemplaires(id_utilisateur, [ligne.id_exemplaire for ligne in lignes])
+
+    manquants = demandes - set(retournes)
+    existants = set(db.session.scalars(
+        select(Emprunt.id_emprunt).join(Livre, Emprunt.id_livre == Livre.id_livre)
+        .where(Emprunt.id_emprunt.in_(manquants), Livre.id_utilisateur == id_utilisateur)
+    )) if manquants else set()
+
+    amendes = _solder_amendes(
+        id_utilisateur, [(ligne.id_emprunt, ligne.date_retour_prevue) for ligne in lignes], aujourd_hui
+    )
+
+    stock, servies = {}, {}
+    par_livre = Counter(ligne.id_livre for ligne in lignes)
+    if par_livre:
+        for id_livre in db.session.scalars(
+            select(Reservation.id_livre).distinct()
+            .where(Reservation.id_livre.in_(par_livre), Reservation.statut == 'en_attente')
+        ).all():
+            servies[id_livre] = attribuer_exemplaires(id_utilisateur, id_livre, par_livre[id_livre], [
+                ligne.id_exemplaire for ligne in lignes if ligne.id_livre == id_livre
+            ])
+        rendus = {id_livre: nombre - len(servies.get(id_livre, ())) for id_livre, nombre in par_livre.items()}
+        stock = dict(db.session.execute(
+            update(Livre)
+            .where(Livre.id_livre.in_(rendus), Livre.id_utilisateur == id_utilisateur)
+            .values(disponibles=Livre.disponibles + case(rendus, value=Livre.id_livre), **stamp(id_utilisateur))
+            .returning(Livre.id_livre, Livre.disponibles)
+        ).all())
+    db.session.flush()
+
+    resultats, vus = [], set()
+    for id_emprunt in ids:
+        if id_emprunt is None:
+            resultats.append({'status': 400, 'error': 'Identifiant invalide'})
+        elif id_emprunt in retournes and id_emprunt not in vus:
+            ligne = retournes[id_emprunt]
+            amende = amendes.get(id_emprunt)
+            resultats.append({
+                'status': 200,
+                'id_emprunt': id_emprunt,
+                'id_livre': ligne.id_livre,
+                'id_membre': ligne.id_membre,
+                'disponibles': stock.get(ligne.id_livre),
+                'amende': {'id_amende': amende.id_amende, 'montant': amende.montant} if amende else None,
+                # Réservations servies attribuées aux exemplaires du livre dans l'ordre des retours
+                'reservation': servies[ligne.id_livre].pop(0) if servies.get(ligne.id_livre) else None
+            })
+        elif id_emprunt in retournes or id_emprunt in existants:
+            resultats.append({'status': 400, 'id_emprunt': id_emprunt, 'error': 'Emprunt déjà retourné'})
+        else:
+            resultats.append({'status': 404, 'id_emprunt': id_emprunt, 'error': 'Emprunt non trouvé'})
+        vus.add(id_emprunt)
+    return resultats
+
+
+# ============ RÉSERVATIONS ============
+
+STATUTS_RESERVATION_ACTIFS = ('en_attente', 'disponible')
+
+
+def attribuer_exemplaires(id_utilisateur, id_livre, nombre=1, preferes=()):
+    """
+    Met de côté jusqu'à `nombre` exemplaires pour les premières réservations en attente
+
+    Retourne les réservations servies, dans l'ordre de la file. Le statut est
+    revérifié par l'UPDATE : une tête de file servie entre-temps par une
+    transaction concurrente est ignorée et la suivante est lue. Chaque réservation
+    servie reçoit un exemplaire `disponible` du livre, qui passe au statut `reserve` :
+    d'abord ceux de `preferes` (exemplaires rendus ou libérés, en main au comptoir).
+    """
+    preferes = [id_exemplaire for id_exemplaire in preferes if id_exemplaire is not None]
+    date_expiration = datetime.utcnow().date() + timedelta(days=DELAI_RETRAIT_JOURS)
+    servies = []
+    while len(servies) < nombre:
+        tete = db.session.scalars(
+            select(Reservation.id_reservation)
+            .where(Reservation.id_livre == id_livre, Reservation.statut == 'en_attente')
+            .order_by(Reservation.id_reservation)
+            .limit(nombre - len(servies))
+        ).all()
+        if not tete:
+            break
+        lignes = db.session.execute(
+            update(Reservation)
+            .where(Reservation.id_reservation.in_(tete), Reservation.statut == 'en_attente')
+            .values(statut='disponible', date_expiration=date_expiration, **stamp(id_utilisateur))
+            .returning(Reservation.id_reservation, Reservation.id_membre)
+        ).all()
+        for id_reservation, id_membre in sorted(lignes):
+            id_exemplaire = None
+            while id_exemplaire is None and preferes:
+                id_exemplaire = sortir_exemplaire(id_utilisateur, id_livre, preferes.pop(0), statut='reserve')
+            if id_exemplaire is None:
+                id_exemplaire = sortir_exemplaire(id_utilisateur, id_livre, statut='reserve')
+            if id_exemplaire is not None:
+                db.session.execute(
+                    update(Reservation).where(Reservation.id_reservation == id_reservation)
+                    .values(id_exemplaire=id_exemplaire)
+                )
+            servies.append({
+                'id_reservation': id_reservation,
+                'id_livre': id_livre,
+                'id_membre': id_membre,
+                'id_exemplaire': id_exemplaire,
+                'date_expiration': date_expiration.isoformat()
+            })
+    return servies
+
+
+def liberer_exemplaires(id_utilisateur, id_livre, nombre=1, preferes=()):
+    """
+    Exemplaires rendus ou libérés (`preferes` : leurs ids, mis de côté en premier) :
+    file d'attente d'abord, le reste en stock ; retourne (servies, disponibles)
+    """
+    servies = attribuer_exemplaires(id_utilisateur, id_livre, nombre, preferes)
+    if len(servies) < nombre:
+        return servies, rendre_exemplaire(id_utilisateur, id_livre, nombre - len(servies))
+    return servies, db.session.scalar(select(Livre.disponibles).where(Livre.id_livre == id_livre))
+
+
+def reserver(id_utilisateur, id_livre, id_membre):
+    """Place une réservation en fin de file ; retourne (réservation, position dans la file)"""
+    statut = db.session.query(Membre.statut).filter_by(id_membre=id_membre, id_utilisateur=id_utilisateur).scalar()
+    if statut != 'actif':
+        raise CirculationError('Membre invalide')
+
+    disponibles = db.session.scalar(
+        select(Livre.disponibles).where(Livre.id_livre == id_livre, Livre.id_utilisateur == id_utilisateur)
+    )
+    if disponibles is None:
+        raise CirculationError('Livre non trouvé', 404)
+    if disponibles > 0:
+        raise CirculationError('Livre disponible : emprunt direct possible')
+
+    active = db.session.scalar(
+        select(Reservation.id_reservation).where(
+            Reservation.id_livre == id_livre,
+            Reservation.id_membre == id_membre,
+            Reservation.statut.in_(STATUTS_RESERVATION_ACTIFS)
+        )
+    )
+    if active is not None:
+        raise CirculationError('Réservation déjà en cours pour ce membre')
+
+    reservation = Reservation(id_livre=id_livre, id_membre=id_membre, statut='en_attente')
+    db.session.add(reservation)
+    db.session.flush()
+    position = db.session.scalar(
+        select(func.count()).select_from(Reservation).where(
+            Reservation.id_livre == id_livre,
+            Reservation.statut == 'en_attente',
+            Reservation.id_reservation <= reservation.id_reservation
+        )
+    )
+    return reservation, position
+
+
+def annuler_reservation(id_utilisateur, id_reservation):
+    """
+    Annule une réservation active ; retourne (id_livre, réservations servies)
+
+    L'exemplaire d'une réservation déjà mise de côté passe à la suivante de la
+    file (ou revient en stock).
+    """
+    row = db.session.execute(
+        select(Reservation.id_livre, Reservation.statut, Reservation.id_exemplaire)
+        .join(Livre, Reservation.id_livre == Livre.id_livre)
+        .where(Reservation.id_reservation == id_reservation, Livre.id_utilisateur == id_utilisateur)
+    ).first()
+    if row is None:
+        raise CirculationError('Réservation non trouvée', 404)
+
+    annulee = db.session.execute(
+        update(Reservation)
+        .where(Reservation.id_reservation == id_reservation, Reservation.statut == row.statut,
+               Reservation.statut.in_(STATUTS_RESERVATION_ACTIFS))
+        .values(statut='annulee', **stamp(id_utilisateur))
+        .returning(Reservation.id_reservation)
+    ).scalar()
+    if annulee is None:
+        raise CirculationError('Réservation déjà clôturée')
+
+    servies = []
+    if row.statut == 'disponible':
+        rentrer_exemplaires(id_utilisateur, [row.id_exemplaire])
+        servies = liberer_exemplaires(id_utilisateur, row.id_livre, preferes=[row.id_exemplaire])[0]
+    return row.id_livre, servies
+
+
+def expirer_reservations(id_utilisateur, aujourd_hui):
+    """
+    Expire les exemplaires mis de côté et non retirés à temps, puis les passe
+    aux réservations suivantes ; retourne (ids expirés, réservations servies)
+    """
+    lignes = db.session.execute(
+        update(Reservation)
+        .where(Reservation.statut == 'disponible',
+               Reservation.date_expiration < aujourd_hui,
+               Reservation.id_livre.in_(select(Livre.id_livre).where(Livre.id_utilisateur == id_utilisateur)))
+        .values(statut='expiree', **stamp(id_utilisateur))
+        .returning(Reservation.id_reservation, Reservation.id_livre, Reservation.id_exemplaire)
+    ).all()
+
+    rentrer_exemplaires(id_utilisateur, [ligne.id_exemplaire for ligne in lignes])
+    servies = []
+    for id_livre, nombre in Counter(ligne.id_livre for ligne in lignes).items():
+        servies += liberer_exemplaires(id_utilisateur, id_livre, nombre, [
+            ligne.id_exemplaire for ligne in lignes if ligne.id_livre == id_livre
+        ])[0]
+    return sorted(ligne.id_reservation for ligne in lignes), servies
+
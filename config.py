@@ -26,6 +26,9 @@ class Config:
             "max_overflow": 20
         }
     
+    # Migrations de données (migrations.py) au démarrage ; sinon : flask --app app migrer
+    DATA_MIGRATIONS_ON_STARTUP = os.getenv('DATA_MIGRATIONS_ON_STARTUP', 'true').lower() == 'true'
+
     # ============ SESSIONS UTILISATEUR ============
     SESSION_COOKIE_SECURE = os.getenv('FLASK_ENV') == 'production'
     SESSION_COOKIE_HTTPONLY = True
@@ -53,6 +56,77 @@ class Config:
     MAIL_DEFAULT_SENDER = os.getenv('SMTP_USERNAME')
     MAIL_DEBUG = False
     
+    # ============ LOGS ============
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 1.0))  # Fraction conservée des messages à fort volume
+    
+    # ============ MÉTRIQUES ============
+    # Jeton Bearer exigé par /metrics (sans jeton, l'endpoint répond 403)
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    
+    # ============ INSTRUMENTATION SQL ============
+    SQL_SLOW_QUERY_MS = int(os.getenv('SQL_SLOW_QUERY_MS', 200))  # Seuil de log des requêtes lentes
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv('SQL_N_PLUS_ONE_THRESHOLD', 5))  # Répétitions d'une même forme
+    SQL_TOP_SLOWEST = 5
+    SQL_STATS_HEADER = os.getenv('SQL_STATS_HEADER', 'false').lower() == 'true'  # Toujours actif en debug
+    
+    # ============ PROFILAGE ============
+    # Header X-Profile: 1 (administrateurs) ou fraction de requêtes échantillonnées ; désactivé par défaut
+    PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+    PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0.0))
+    PROFILING_MODE = os.getenv('PROFILING_MODE', 'sampling')  # 'sampling' (.folded) ou 'cprofile' (.prof)
+    PROFILING_INTERVAL_MS = 1
+    PROFILING_FOLDER = os.getenv('PROFILING_FOLDER', 'profiles')
+    # Rétention, appliquée à chaque profil écrit : les plus anciens au-delà du nombre ou de l'âge maximal sont supprimés
+    PROFILING_MAX_FILES = int(os.getenv('PROFILING_MAX_FILES', 200))
+    PROFILING_MAX_AGE_HOURS = float(os.getenv('PROFILING_MAX_AGE_HOURS', 72))
+    
+    # ============ COMPRESSION DES RÉPONSES ============
+    COMPRESS_ENABLED = os.getenv('COMPRESS_ENABLED', 'true').lower() == 'true'
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))  # Octets ; les réponses streamées sont toujours compressées
+    COMPRESS_GZIP_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 4  # 0-11 : 4 offre un bon compromis CPU/taille pour du JSON
+
+    # ============ REQUÊTES CONDITIONNELLES (ETAG) ============
+    # À changer quand le format des réponses évolue, pour invalider les ETags déjà distribués
+    ETAG_SALT = os.getenv('ETAG_SALT', 'v2.0')
+
+    # ============ CACHE DE RÉPONSES ============
+    CACHE_TYPE = os.getenv('CACHE_TYPE', 'memory')  # memory | redis | null
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'memory://')  # memory:// : substitut local de Redis
+    CACHE_DEFAULT_TIMEOUT = int(os.getenv('CACHE_DEFAULT_TIMEOUT', 300))  # Secondes
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 2048))  # Par worker (backend memory)
+
+    # ============ REQUÊTES GROUPÉES (/api/batch, traitements par lot) ============
+    BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', 10))
+    BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', 100))  # Prêts/retours par lot (/api/emprunts/lot)
+
+    # ============ ÉVÈNEMENTS TEMPS RÉEL (SSE) ============
+    EVENTS_REDIS_URL = os.getenv('EVENTS_REDIS_URL')  # Non défini : diffusion limitée au worker courant
+    EVENTS_QUEUE_SIZE = 100  # Évènements en attente par client avant resynchronisation forcée
+    EVENTS_KEEPALIVE_SECONDS = 15
+
+    # ============ IMPORT DU CATALOGUE ============
+    IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 5000))  # Livres insérés par transaction
+    IMPORT_MAX_ERRORS = 100  # Erreurs détaillées dans le rapport (les suivantes sont seulement comptées)
+    # Imports en arrière-plan (MARC, ONIX...) : fichiers déposés dans UPLOAD_FOLDER/imports
+    IMPORT_WORKER_ENABLED = os.getenv('IMPORT_WORKER_ENABLED', 'true').lower() == 'true'
+    IMPORT_POLL_SECONDS = 30  # Recherche périodique des tâches en attente (en plus du réveil au dépôt)
+    IMPORT_STALE_MINUTES = 10  # Tâche en_cours sans progression depuis ce délai : reprise par un autre worker
+
+    # ============ EXPORT ============
+    EXPORT_CHUNK_ROWS = 1000  # Lignes lues par le curseur et envoyées par morceau de réponse
+
+    # ============ RETARDS ET AMENDES ============
+    OVERDUE_ENABLED = os.getenv('OVERDUE_ENABLED', 'true').lower() == 'true'
+    OVERDUE_HOUR = int(os.getenv('OVERDUE_HOUR', 1))  # Passe quotidienne (heure locale du serveur)
+    OVERDUE_MINUTE = int(os.getenv('OVERDUE_MINUTE', 0))
+
+    # ============ STATISTIQUES DE CIRCULATION ============
+    ANALYTICS_ENABLED = os.getenv('ANALYTICS_ENABLED', 'true').lower() == 'true'
+    ANALYTICS_HOUR = int(os.getenv('ANALYTICS_HOUR', 2))  # Agrégation de la veille (après la passe des retards)
+    ANALYTICS_MINUTE = int(os.getenv('ANALYTICS_MINUTE', 0))
+    
     # ============ SÉCURITÉ DES MOTS DE PASSE ============
     BCRYPT_LOG_ROUNDS = 12
     
@@ -1,7 +1,12 @@
+import logging
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
+from logging_config import HIGH_VOLUME
+from metrics import EMAILS_SENT, suivre_envoi_email
+
+logger = logging.getLogger(__name__)
 
 class EmailService:
     """Service d'envoi d'emails pour BiblioTech"""
@@ -38,16 +43,18 @@ class EmailService:
             message.attach(html_part)
             
             # Connexion et envoi
-            with smtplib.SMTP(smtp_server, smtp_port) as server:
+            with suivre_envoi_email(), smtplib.SMTP(smtp_server, smtp_port) as server:
                 server.starttls()  # Sécuriser la connexion
                 server.login(smtp_username, smtp_password)
                 server.send_message(message)
             
-            print(f" Email envoyé à {to_email}")
+            EMAILS_SENT.labels(status='ok').inc()
+            logger.info("Email envoyé", extra={'email': to_email, **HIGH_VOLUME})
             return True
             
-        except Exception as e:
-            print(f" Erreur lors de l'envoi de l'email: {str(e)}")
+        except Exception:
+            EMAILS_SENT.labels(status='erreur').inc()
+            logger.exception("Erreur lors de l'envoi de l'email", extra={'email': to_email})
             return False
     
     @staticmethod
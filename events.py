@@ -0,0 +1,186 @@
+"""
+Évènements temps réel par bibliothèque (Server-Sent Events sur /api/events)
+
+Les routes d'écriture publient un évènement après leur commit ; chaque worker
+le reçoit via le transport et le remet aux flux SSE ouverts de la bibliothèque
+concernée. Transports :
+- `LocalTransport` : distribution en mémoire entre les brokers d'un même
+  processus (développement, tests, ou un seul worker) ;
+- `RedisTransport` : pub/sub Redis pour diffuser à tous les workers et instances.
+
+Les évènements ne portent pas d'identifiant SSE : la version d'une écriture
+n'est pas un curseur de reprise sûr (sur PostgreSQL, une transaction plus
+ancienne peut valider après elle). Après une reconnexion ou un évènement
+`resync`, le client rattrape les changements manqués avec le dernier curseur
+renvoyé par /api/sync (/api/sync?since=<cursor>).
+"""
+import json
+import logging
+import queue
+import threading
+from collections import defaultdict
+from metrics import EVENTS_SUBSCRIBERS
+
+try:
+    import redis
+except ImportError:  # Redis optionnel : transport local uniquement
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+# ============ TRANSPORTS ============
+
+class LocalTransport:
+    """Distribue les messages aux brokers attachés dans le processus courant"""
+
+    def __init__(self):
+        self._brokers = []
+
+    def attach(self, broker):
+        self._brokers.append(broker)
+
+    def publish(self, message):
+        for broker in self._brokers:
+            broker.deliver(message)
+
+
+class RedisTransport:
+    """Diffuse les messages sur un canal Redis ; un thread par worker les remet au broker local"""
+
+    channel = 'bibliotech:events'
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+
+    def attach(self, broker):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        threading.Thread(target=self._listen, args=(pubsub, broker), name='events-redis', daemon=True).start()
+
+    def _listen(self, pubsub, broker):
+        for item in pubsub.listen():
+            try:
+                broker.deliver(json.loads(item['data']))
+            except Exception:
+                logger.exception("Message d'évènement invalide")
+
+    def publish(self, message):
+        self.client.publish(self.channel, json.dumps(message, default=str))
+
+
+# ============ BROKER ============
+
+class Subscription:
+    """File d'un flux SSE ; fermée si le client ne lit pas assez vite"""
+
+    def __init__(self, size):
+        self.queue = queue.Queue(maxsize=size)
+        self.overflowed = False
+
+
+class EventBroker:
+    """Abonnements SSE par bibliothèque et publication des évènements"""
+
+    def __init__(self, app=None, transport=None):
+        self.queue_size = 100
+        self.keepalive = 15
+        self.transport = transport
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.queue_size = app.config.get('EVENTS_QUEUE_SIZE', 100)
+        self.keepalive = app.config.get('EVENTS_KEEPALIVE_SECONDS', 15)
+
+        if self.transport is None:
+            url = app.config.get('EVENTS_REDIS_URL')
+            if url and redis is not None:
+                self.transport = RedisTransport(url)
+            else:
+                if url:
+                    logger.warning("Module redis non installé : évènements limités au worker courant")
+                self.transport = LocalTransport()
+        self.transport.attach(self)
+
+    def subscribe(self, id_utilisateur):
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            self._subscribers[id_utilisateur].add(subscription)
+        EVENTS_SUBSCRIBERS.inc()
+        return subscription
+
+    def unsubscribe(self, id_utilisateur, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(id_utilisateur)
+            if subscribers is not None and subscription in subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[id_utilisateur]
+                EVENTS_SUBSCRIBERS.dec()
+
+    def publish(self, id_utilisateur, event, data):
+        """Publie un évènement ; une panne du transport ne doit pas faire échouer l'écriture déjà validée"""
+        message = {'tenant': id_utilisateur, 'event': event, 'data': data}
+        try:
+            self.transport.publish(message)
+        except Exception:
+            logger.exception("Publication d'évènement impossible", extra={'evenement': event})
+
+    def deliver(self, message):
+        """Remet un message reçu du transport aux flux ouverts de sa bibliothèque"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(message['tenant'], ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                subscription.overflowed = True
+
+    def stream(self, id_utilisateur):
+        """
+        Générateur SSE d'un client
+
+        L'abonnement est pris au premier octet envoyé, dans le générateur : un flux
+        jamais démarré (client parti avant la réponse) ne laisse pas d'abonné orphelin.
+        """
+        subscription = self.subscribe(id_utilisateur)
+        try:
+            yield f"retry: {self.keepalive * 1000}\n\n"
+            while True:
+                if subscription.overflowed:
+                    # Évènements perdus : le client doit se resynchroniser via /api/sync
+                    yield "event: resync\ndata: {}\n\n"
+                    return
+                try:
+                    message = subscription.queue.get(timeout=self.keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_event(message)
+        finally:
+            self.unsubscribe(id_utilisateur, subscription)
+
+
+def format_event(message):
+    data = json.dumps(message['data'], default=str, separators=(',', ':'))
+    return f"event: {message['event']}\ndata: {data}\n\n"
+
+
+# Instance globale
+event_broker = None
+
+def init_events(app):
+    """Active la diffusion des évènements (transport Redis si EVENTS_REDIS_URL est défini)"""
+    global event_broker
+    event_broker = EventBroker(app)
+    return event_broker
+
+
+def publish(id_utilisateur, event, data):
+    """Publie un évènement pour une bibliothèque (sans effet si le broker n'est pas initialisé)"""
+    if event_broker is not None:
+        event_broker.publish(id_utilisateur, event, data)
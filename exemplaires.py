@@ -0,0 +1,125 @@
+"""
+Exemplaires physiques et codes-barres
+
+Chaque livre a une ligne `Exemplaire` par exemplaire physique. Le compteur
+`disponibles` reste la référence pour accorder un prêt (UPDATE conditionnels
+de circulation.py) ; l'exemplaire indique lequel est sorti et l'emprunt le
+référence. Le code-barres est unique dans une bibliothèque (index unique
+(id_utilisateur, code_barres)) : un scan au comptoir est une recherche d'index.
+"""
+from datetime import datetime
+from sqlalchemy import and_, func, insert, select, update
+from circulation import STATUTS_EN_COURS, CirculationError, liberer_exemplaires
+from models import db, Livre, Membre, Exemplaire, Emprunt
+from serializers import EXEMPLAIRE_SCHEMA, LIVRE_SCHEMA, EMPRUNT_SCHEMA, MEMBRE_SCHEMA, Resource, Selection
+from sync import stamp
+
+# Scan : exemplaire, livre, emprunt en cours éventuel et son membre (jointures externes)
+SCAN_RESOURCE = Resource(Exemplaire, EXEMPLAIRE_SCHEMA, embeds={
+    'livre': Resource(Livre, LIVRE_SCHEMA, onclause=Exemplaire.id_livre == Livre.id_livre),
+    'emprunt': Resource(Emprunt, EMPRUNT_SCHEMA, outer=True, onclause=and_(
+        Emprunt.id_exemplaire == Exemplaire.id_exemplaire,
+        Emprunt.statut.in_(STATUTS_EN_COURS)
+    ), embeds={
+        'membre': Resource(Membre, MEMBRE_SCHEMA, onclause=Emprunt.id_membre == Membre.id_membre, outer=True)
+    })
+})
+
+
+def code_barres_defaut(id_livre, numero):
+    """Code-barres attribué à défaut d'étiquette existante : BT + id du livre + numéro d'exemplaire"""
+    return f"BT{id_livre:08d}-{numero:03d}"
+
+
+def nouveaux_exemplaires(id_utilisateur, id_livre, nombre, premier=1, **valeurs):
+    """Lignes à insérer (executemany) pour `nombre` exemplaires numérotés à partir de `premier`"""
+    aujourd_hui = datetime.utcnow().date()
+    return [{
+        'id_utilisateur': id_utilisateur,
+        'id_livre': id_livre,
+        'code_barres': code_barres_defaut(id_livre, numero),
+        'statut': 'disponible',
+        'date_ajout': aujourd_hui,
+        **valeurs
+    } for numero in range(premier, premier + nombre)]
+
+
+def creer_exemplaires(id_utilisateur, id_livre, nombre):
+    """Crée les exemplaires d'un nouveau livre dans la transaction courante"""
+    if nombre > 0:
+        db.session.execute(insert(Exemplaire), nouveaux_exemplaires(
+            id_utilisateur, id_livre, nombre, **stamp(id_utilisateur)
+        ))
+
+
+def _prochain_numero(id_livre):
+    """Numéro suivant des codes-barres par défaut d'un livre (le plus grand existant + 1)"""
+    prefixe = code_barres_defaut(id_livre, 0)[:-3]
+    codes = db.session.scalars(
+        select(Exemplaire.code_barres).where(Exemplaire.id_livre == id_livre, Exemplaire.code_barres.like(f'{prefixe}%'))
+    )
+    return max((int(code[len(prefixe):]) for code in codes if code[len(prefixe):].isdigit()), default=0) + 1
+
+
+def ajouter_exemplaires(id_utilisateur, id_livre, nombre=1, code_barres=None):
+    """
+    Ajoute `nombre` exemplaires à un livre existant ; retourne (exemplaires, réservations servies)
+
+    Les nouveaux exemplaires servent d'abord la file de réservations du livre, comme
+    un retour. Sans étiquette fournie, ils sont numérotés après le plus grand numéro
+    par défaut du livre (les exemplaires ajoutés ou étiquetés depuis sa création
+    rendent le simple comptage faux) ; l'UPDATE du livre, fait d'abord, verrouille
+    sa ligne et sérialise deux ajouts simultanés au même livre.
+    """
+    ligne = db.session.execute(
+        update(Livre)
+        .where(Livre.id_livre == id_livre, Livre.id_utilisateur == id_utilisateur)
+        .values(nombre_exemplaires=func.coalesce(
+                    Livre.nombre_exemplaires,
+                    select(func.count()).where(Exemplaire.id_livre == id_livre).scalar_subquery()
+                ) + nombre, **stamp(id_utilisateur))
+        .returning(Livre.id_livre)
+    ).first()
+    if ligne is None:
+        raise CirculationError('Livre non trouvé', 404)
+
+    if code_barres:
+        codes = [code_barres]
+    else:
+        premier = _prochain_numero(id_livre)
+        codes = [code_barres_defaut(id_livre, numero) for numero in range(premier, premier + nombre)]
+    exemplaires = [
+        Exemplaire(id_livre=id_livre, id_utilisateur=id_utilisateur, code_barres=code, statut='disponible')
+        for code in codes
+    ]
+    db.session.add_all(exemplaires)
+    db.session.flush()
+    servies, _ = liberer_exemplaires(
+        id_utilisateur, id_livre, nombre, [exemplaire.id_exemplaire for exemplaire in exemplaires]
+    )
+    return exemplaires, servies
+
+
+def ajouter_exemplaire(id_utilisateur, id_livre, code_barres=None):
+    """Ajoute un exemplaire à un livre existant ; retourne (exemplaire, réservations servies)"""
+    exemplaires, servies = ajouter_exemplaires(id_utilisateur, id_livre, 1, code_barres)
+    return exemplaires[0], servies
+
+
+def lister_exemplaires(id_utilisateur, id_livre):
+    query = select(*EXEMPLAIRE_SCHEMA.columns).where(
+        Exemplaire.id_livre == id_livre,
+        Exemplaire.id_utilisateur == id_utilisateur
+    ).order_by(Exemplaire.id_exemplaire)
+    return [EXEMPLAIRE_SCHEMA.to_dict(row) for row in db.session.execute(query)]
+
+
+def scanner(id_utilisateur, code_barres):
+    """Exemplaire, livre et emprunt en cours d'un code-barres en une requête indexée (None si inconnu)"""
+    selection = Selection(SCAN_RESOURCE)
+    query = selection.join(select(*selection.columns())).where(
+        Exemplaire.id_utilisateur == id_utilisateur,
+        Exemplaire.code_barres == code_barres
+    )
+    row = db.session.execute(query).first()
+    return selection.serialize(row) if row is not None else None
@@ -0,0 +1,132 @@
+"""
+Export en flux des collections d'une bibliothèque (CSV ou NDJSON)
+
+Les lignes sont lues par un curseur côté serveur (`yield_per` : stream_results
+sur PostgreSQL) et converties par paquets : chaque paquet devient un morceau
+de la réponse chunkée, la mémoire utilisée ne dépend pas de la taille de la
+table. Les colonnes sont celles des routes de liste (sans ressources
+imbriquées : les emprunts et amendes exportent les identifiants liés).
+
+La compression de transport (Content-Encoding négocié par Accept-Encoding)
+est assurée par compression.py ; `compression=gzip` produit à la place un
+fichier .gz à télécharger.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from sqlalchemy import select
+from models import db, Livre
+from serializers import LIVRE_SCHEMA, MEMBRE_SCHEMA, EMPRUNT_SCHEMA, AMENDE_SCHEMA
+from sync import MODELS, TENANT_JOINS
+
+try:
+    import orjson
+except ImportError:  # Repli sur le module json standard
+    orjson = None
+
+SCHEMAS = {
+    'livres': LIVRE_SCHEMA,
+    'membres': MEMBRE_SCHEMA,
+    'emprunts': EMPRUNT_SCHEMA,
+    'amendes': AMENDE_SCHEMA
+}
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+COMPRESSIONS = ('gzip',)
+
+
+def _ndjson(schema, rows):
+    if orjson is not None:
+        return b''.join(orjson.dumps(schema.to_dict(row)) + b'\n' for row in rows)
+    return ''.join(json.dumps(schema.to_dict(row), ensure_ascii=False) + '\n' for row in rows).encode('utf-8')
+
+
+def _vider(tampon):
+    morceau = tampon.getvalue().encode('utf-8')
+    tampon.seek(0)
+    tampon.truncate()
+    return morceau
+
+
+def _gzip(morceaux, niveau):
+    compresseur = zlib.compressobj(niveau, zlib.DEFLATED, 31)  # 31 = en-tête gzip
+    for morceau in morceaux:
+        donnees = compresseur.compress(morceau)
+        if donnees:
+            yield donnees
+    yield compresseur.flush()
+
+
+class Export:
+    """
+    Export d'une collection : valide les paramètres à la construction (ValueError),
+    puis `morceaux()` produit le contenu par paquets de `taille_paquet` lignes
+    """
+
+    def __init__(self, id_utilisateur, collection, format_export='csv', fields=None, compression=None,
+                 taille_paquet=1000, niveau_gzip=6):
+        if format_export not in FORMATS:
+            raise ValueError("Format inconnu (csv ou ndjson)")
+        if compression not in (None, '') + COMPRESSIONS:
+            raise ValueError("Compression inconnue (gzip)")
+
+        schema = SCHEMAS[collection]
+        if fields:
+            demandes = {field.strip() for field in fields.split(',') if field.strip()}
+            inconnus = demandes - set(schema.fields)
+            if inconnus:
+                raise ValueError(f"Champ(s) inconnu(s) : {', '.join(sorted(inconnus))}")
+            schema = schema.subset(demandes)
+
+        self.id_utilisateur = id_utilisateur
+        self.collection = collection
+        self.format = format_export
+        self.schema = schema
+        self.compression = compression or None
+        self.taille_paquet = taille_paquet
+        self.niveau_gzip = niveau_gzip
+
+    @property
+    def mimetype(self):
+        return 'application/gzip' if self.compression else FORMATS[self.format]
+
+    @property
+    def nom_fichier(self):
+        nom = f"{self.collection}-{datetime.utcnow():%Y%m%d}.{self.format}"
+        return f"{nom}.gz" if self.compression else nom
+
+    def _query(self):
+        model = MODELS[self.collection]
+        query = select(*self.schema.columns)
+        for target, onclause in TENANT_JOINS.get(self.collection, ()):
+            query = query.join(target, onclause)
+        tenant = Livre.id_utilisateur if self.collection in TENANT_JOINS else model.id_utilisateur
+        # Ordre de la clé primaire : export stable et parcours d'index
+        return query.where(tenant == self.id_utilisateur).order_by(model.__mapper__.primary_key[0])
+
+    def _lignes(self):
+        result = db.session.execute(self._query(), execution_options={'yield_per': self.taille_paquet})
+        try:
+            if self.format == 'csv':
+                tampon = io.StringIO()
+                writer = csv.writer(tampon)
+                writer.writerow(self.schema.fields)
+                yield _vider(tampon)
+                for paquet in result.partitions():
+                    # Dates au même format qu'en JSON ; valeurs nulles vides
+                    if self.schema.date_fields:
+                        paquet = [self.schema.to_dict(row).values() for row in paquet]
+                    writer.writerows(paquet)
+                    yield _vider(tampon)
+            else:
+                for paquet in result.partitions():
+                    yield _ndjson(self.schema, paquet)
+        finally:
+            result.close()
+
+    def morceaux(self):
+        """Contenu de l'export (bytes), un morceau par paquet de lignes"""
+        if self.compression == 'gzip':
+            return _gzip(self._lignes(), self.niveau_gzip)
+        return self._lignes()
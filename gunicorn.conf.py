@@ -0,0 +1,27 @@
+import os
+import shutil
+
+# ============ MÉTRIQUES MULTI-PROCESSUS ============
+# Chaque worker gunicorn écrit ses métriques Prometheus dans ce dossier,
+# l'endpoint /metrics agrège les valeurs de tous les workers.
+# Doit être défini avant l'import de prometheus_client (donc avant app.py).
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/bibliotech_metrics')
+
+# ============ WORKERS ============
+# Workers à threads : les flux SSE (/api/events) restent ouverts longtemps
+# et bloqueraient entièrement un worker synchrone.
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 16))
+
+
+def on_starting(server):
+    """Repart d'un dossier de métriques vide à chaque démarrage"""
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Retire les jauges "live" d'un worker arrêté"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,101 @@
+"""
+Historique de circulation d'un membre ou d'un livre
+
+Les emprunts sont lus du plus récent au plus ancien dans l'index
+(id_membre, date_emprunt, id_emprunt) ou (id_livre, date_emprunt, id_emprunt) :
+le filtre de dates est une plage de l'index et la pagination par curseur
+reprend après le dernier (date_emprunt, id_emprunt) renvoyé, sans OFFSET.
+
+Les amendes impayées sont calculées par la même requête : une sous-requête
+corrélée par emprunt (`amendes_dues` de chaque ligne) et une sous-requête
+scalaire pour le total du membre ou du livre sur tout l'historique, quels
+que soient les filtres. Toutes deux trouvent les amendes par l'index
+(id_emprunt, statut, montant) et somment leur montant dû à ce jour (Amende.montant_du).
+"""
+from datetime import date
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import aliased
+from annuaire import LIMITE_MAX, decoder_curseur, encoder_curseur
+from models import db, Amende, Emprunt
+from serializers import EMPRUNT_RESOURCE, Selection
+
+LIMITE_DEFAUT = 50
+CLES = (Emprunt.date_emprunt, Emprunt.id_emprunt)
+# Valeur du curseur : l'historique n'a qu'un tri
+TRI = '-date_emprunt'
+
+
+def lire_date(valeur, nom):
+    """Date AAAA-MM-JJ d'un paramètre de requête (None si absent) ; lève ValueError si invalide"""
+    if not valeur:
+        return None
+    try:
+        return date.fromisoformat(valeur)
+    except ValueError:
+        raise ValueError(f"Paramètre '{nom}' invalide (AAAA-MM-JJ attendu)") from None
+
+
+def _amendes_dues(*conditions):
+    return select(func.coalesce(func.sum(Amende.montant_du), 0.0)).where(Amende.statut == 'impayee', *conditions)
+
+
+def historique_emprunts(colonne, identifiant, depuis=None, jusqu_au=None, statuts=None, limite=LIMITE_DEFAUT,
+                        curseur=None, fields=None, embed=None):
+    """
+    Page de l'historique des emprunts où `colonne` (Emprunt.id_membre ou Emprunt.id_livre)
+    vaut `identifiant` : {'emprunts': [...], 'amendes_dues': total, 'curseur_suivant': str ou None}
+
+    `depuis` et `jusqu_au` (AAAA-MM-JJ, inclus) bornent la date d'emprunt. Chaque
+    emprunt porte `amendes_dues` (sauf si `fields` ne le demande pas). L'appartenance
+    du membre ou du livre à la bibliothèque est vérifiée par l'appelant.
+    Lève ValueError pour une date, une limite, un curseur ou un champ invalides.
+    """
+    if not 1 <= limite <= LIMITE_MAX:
+        raise ValueError(f"limite doit être comprise entre 1 et {LIMITE_MAX}")
+    depuis, jusqu_au = lire_date(depuis, 'depuis'), lire_date(jusqu_au, 'jusqu_au')
+
+    # amendes_dues n'est pas une colonne du schéma : retiré de ?fields= avant la sélection
+    avec_dues = True
+    if fields is not None:
+        demandes = [field.strip() for field in fields.split(',') if field.strip()]
+        avec_dues = 'amendes_dues' in demandes
+        fields = ','.join(field for field in demandes if field != 'amendes_dues') or 'id_emprunt'
+    selection = Selection(EMPRUNT_RESOURCE, fields, embed)
+
+    # Total : amendes des emprunts du membre ou du livre, lus par l'index de l'historique
+    autre = aliased(Emprunt)
+    total = _amendes_dues(Amende.id_emprunt.in_(
+        select(autre.id_emprunt).where(getattr(autre, colonne.key) == identifiant)
+    ))
+    query = select(
+        *selection.columns(),
+        _amendes_dues(Amende.id_emprunt == Emprunt.id_emprunt).scalar_subquery().label('_dues'),
+        total.scalar_subquery().label('_total'),
+        *(cle.label(f'_tri_{i}') for i, cle in enumerate(CLES))
+    )
+    query = selection.join(query).where(colonne == identifiant)
+    if depuis:
+        query = query.where(Emprunt.date_emprunt >= depuis)
+    if jusqu_au:
+        query = query.where(Emprunt.date_emprunt <= jusqu_au)
+    if statuts:
+        query = query.where(Emprunt.statut.in_(statuts))
+    if curseur:
+        query = query.where(tuple_(*CLES) < tuple_(*decoder_curseur(curseur, TRI, CLES)))
+    query = query.order_by(*(cle.desc() for cle in CLES)).limit(limite + 1)
+
+    rows = db.session.execute(query).all()
+    suivant = None
+    if len(rows) > limite:
+        rows = rows[:limite]
+        suivant = encoder_curseur(TRI, rows[-1][-len(CLES):])
+
+    emprunts = []
+    for row in rows:
+        emprunt = selection.serialize(row)
+        if avec_dues:
+            emprunt['amendes_dues'] = row._dues
+        emprunts.append(emprunt)
+    # Page vide (filtres, fin de l'historique) : le total est lu seul
+    dues = rows[0]._total if rows else db.session.scalar(total)
+    return {'emprunts': emprunts, 'amendes_dues': dues, 'curseur_suivant': suivant}
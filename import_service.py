@@ -0,0 +1,255 @@
+"""
+Imports de catalogue en arrière-plan (MARC21/UNIMARC, MARCXML, ONIX, CSV, NDJSON)
+
+Le fichier déposé est enregistré sous UPLOAD_FOLDER/imports et une
+`TacheImport` en_attente est créée. Chaque worker de l'application exécute un
+planificateur qui réserve les tâches par un UPDATE conditionnel (une tâche
+n'est exécutée que par un seul worker) puis les importe avec ImportCatalogue.
+
+Point de reprise : chaque lot enregistre, dans sa propre transaction, le
+numéro de la dernière notice lue et les compteurs du rapport. Un import
+interrompu (arrêt du worker, plantage) reprend après cette notice : à l'arrêt
+propre la tâche repasse en_attente, sinon elle est reprise par un autre
+worker quand elle n'a plus progressé depuis IMPORT_STALE_MINUTES.
+Pendant la lecture, date_maj est rafraîchie au quart de ce délai, y compris
+quand les notices déjà importées sont relues avant la reprise.
+"""
+import logging
+import os
+import secrets
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+from apscheduler.schedulers.background import BackgroundScheduler
+from sqlalchemy import and_, func, or_, select, update
+from catalogue_import import COMPTEURS, ImportCatalogue, lire_lignes
+from events import publish
+from logging_config import HIGH_VOLUME
+from models import db, TacheImport
+
+logger = logging.getLogger(__name__)
+
+
+class ImportInterrompu(Exception):
+    """Arrêt du service demandé pendant un import"""
+
+
+class ImportService:
+    """Service d'exécution des imports de catalogue en arrière-plan"""
+
+    def __init__(self, app, dossier, taille_lot=5000, max_erreurs=100, poll_seconds=30, stale_minutes=10):
+        self.app = app
+        self.dossier = dossier
+        self.taille_lot = taille_lot
+        self.max_erreurs = max_erreurs
+        self.poll_seconds = poll_seconds
+        self.stale_minutes = stale_minutes
+        self.scheduler = BackgroundScheduler()
+        self._arret = threading.Event()
+
+        os.makedirs(self.dossier, exist_ok=True)
+
+    def deposer(self, id_utilisateur, flux, nom_fichier, format_fichier):
+        """Enregistre le fichier (copié en flux) et crée sa tâche d'import ; retourne la tâche"""
+        extension = os.path.splitext(nom_fichier or '')[1].lower()
+        chemin = os.path.join(self.dossier, f"{secrets.token_hex(16)}{extension}")
+        with open(chemin, 'wb') as fichier:
+            shutil.copyfileobj(flux, fichier, 1 << 20)
+
+        tache = TacheImport(
+            id_utilisateur=id_utilisateur,
+            nom_fichier=nom_fichier,
+            chemin=chemin,
+            format=format_fichier,
+            erreurs=[]
+        )
+        db.session.add(tache)
+        db.session.commit()
+        self.reveiller()
+        return tache
+
+    def reveiller(self):
+        """Avance la prochaine recherche de tâches à maintenant"""
+        if self.scheduler.running:
+            self.scheduler.modify_job('imports', next_run_time=datetime.now())
+
+    def traiter_taches(self):
+        """Exécute les tâches disponibles l'une après l'autre"""
+        with self.app.app_context():
+            while not self._arret.is_set():
+                id_tache = self._reserver()
+                if id_tache is None:
+                    return
+                self._executer(id_tache)
+
+    def _reserver(self):
+        """Réserve la plus ancienne tâche disponible (en_attente, ou en_cours abandonnée) ; None si aucune"""
+        limite = datetime.utcnow() - timedelta(minutes=self.stale_minutes)
+        disponible = or_(
+            TacheImport.statut == 'en_attente',
+            and_(TacheImport.statut == 'en_cours', TacheImport.date_maj < limite)
+        )
+        candidates = db.session.scalars(
+            select(TacheImport.id_tache).where(disponible).order_by(TacheImport.id_tache).limit(10)
+        ).all()
+        for id_tache in candidates:
+            # La condition est réévaluée par l'UPDATE : un autre worker a pu la réserver entre-temps
+            maintenant = datetime.utcnow()
+            reservee = db.session.execute(
+                update(TacheImport)
+                .where(TacheImport.id_tache == id_tache, disponible)
+                .values(statut='en_cours', date_maj=maintenant,
+                        date_debut=func.coalesce(TacheImport.date_debut, maintenant))
+                .returning(TacheImport.id_tache)
+            ).first()
+            db.session.commit()
+            if reservee is not None:
+                return id_tache
+        db.session.rollback()
+        return None
+
+    def _mettre_a_jour(self, id_tache, **valeurs):
+        db.session.execute(
+            update(TacheImport).where(TacheImport.id_tache == id_tache)
+            .values(date_maj=datetime.utcnow(), **valeurs)
+        )
+
+    def _signaler_activite(self, id_tache):
+        """Rafraîchit date_maj d'une tâche en_cours, dans sa propre transaction"""
+        db.session.execute(
+            update(TacheImport).where(TacheImport.id_tache == id_tache, TacheImport.statut == 'en_cours')
+            .values(date_maj=datetime.utcnow())
+        )
+        db.session.commit()
+
+    def _executer(self, id_tache):
+        tache = db.session.get(TacheImport, id_tache)
+        id_utilisateur, chemin, format_fichier, position = tache.id_utilisateur, tache.chemin, tache.format, tache.position
+        rapport = {compteur: getattr(tache, compteur) for compteur in COMPTEURS}
+        rapport['erreurs'] = list(tache.erreurs or [])
+        db.session.rollback()
+
+        def point_de_reprise(position, rapport):
+            self._mettre_a_jour(id_tache, position=position, erreurs=rapport['erreurs'],
+                                **{compteur: rapport[compteur] for compteur in COMPTEURS})
+
+        def progression(compteurs):
+            publish(id_utilisateur, 'livres.import', {'id_tache': id_tache, **compteurs})
+            if self._arret.is_set():
+                raise ImportInterrompu()
+
+        # Tâche signalée active pendant la lecture, même sans lot importé
+        intervalle = self.stale_minutes * 60 / 4
+        prochain = time.monotonic() + intervalle
+
+        def notices(flux):
+            nonlocal prochain
+            for numero, donnees in lire_lignes(flux, format_fichier):
+                if time.monotonic() >= prochain:
+                    self._signaler_activite(id_tache)
+                    prochain = time.monotonic() + intervalle
+                if numero > position:
+                    yield numero, donnees
+
+        logger.info("Import démarré", extra={'id_tache': id_tache, 'id_utilisateur': id_utilisateur, 'reprise': position})
+        import_catalogue = ImportCatalogue(
+            id_utilisateur,
+            taille_lot=self.taille_lot,
+            max_erreurs=self.max_erreurs,
+            progression=progression,
+            point_de_reprise=point_de_reprise,
+            rapport=rapport
+        )
+        try:
+            with open(chemin, 'rb') as flux:
+                # Les notices déjà importées sont relues (lecture en flux) mais pas retraitées
+                rapport = import_catalogue.executer(notices(flux))
+        except ImportInterrompu:
+            self._mettre_a_jour(id_tache, statut='en_attente')
+            db.session.commit()
+            logger.info("Import interrompu, reprise au prochain démarrage", extra={
+                'id_tache': id_tache, 'position': import_catalogue.position
+            })
+            return
+        except Exception as e:
+            db.session.rollback()
+            self._mettre_a_jour(id_tache, statut='echec', message=str(e)[:500], date_fin=datetime.utcnow())
+            db.session.commit()
+            logger.exception("Erreur lors de l'import", extra={'id_tache': id_tache})
+            publish(id_utilisateur, 'livres.importes', {'id_tache': id_tache, 'statut': 'echec', 'message': str(e)})
+            return
+
+        self._mettre_a_jour(
+            id_tache, statut='terminee', position=max(position, import_catalogue.position),
+            erreurs=rapport['erreurs'], date_fin=datetime.utcnow(),
+            **{compteur: rapport[compteur] for compteur in COMPTEURS}
+        )
+        db.session.commit()
+        try:
+            os.remove(chemin)
+        except OSError:
+            logger.warning("Fichier d'import non supprimé", extra={'chemin': chemin})
+
+        publish(id_utilisateur, 'livres.importes', {
+            'id_tache': id_tache, 'statut': 'terminee', **{compteur: rapport[compteur] for compteur in COMPTEURS}
+        })
+        logger.info("Import terminé", extra={
+            'id_tache': id_tache,
+            **{compteur: rapport[compteur] for compteur in COMPTEURS},
+            'livres_par_seconde': rapport['livres_par_seconde'],
+            **HIGH_VOLUME
+        })
+
+    def start_worker(self):
+        """Recherche des tâches au démarrage (reprise des imports interrompus) puis périodiquement"""
+        self.scheduler.add_job(
+            self.traiter_taches,
+            trigger='interval',
+            seconds=self.poll_seconds,
+            id='imports',
+            name='Imports du catalogue',
+            next_run_time=datetime.now(),
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True
+        )
+
+    def start(self):
+        """Démarre le planificateur"""
+        if not self.scheduler.running:
+            self.scheduler.start()
+            logger.info("Service d'import démarré")
+        else:
+            logger.warning("Le service d'import est déjà en cours d'exécution")
+
+    def stop(self):
+        """Arrête le planificateur ; un import en cours s'arrête après son lot et sera repris"""
+        if self.scheduler.running:
+            self._arret.set()
+            self.scheduler.shutdown()
+            logger.info("Service d'import arrêté")
+
+
+# Instance globale du service
+import_service = None
+
+def init_import_service(app):
+    """Initialise l'exécution des imports en arrière-plan (IMPORT_* dans la configuration)"""
+    global import_service
+
+    if not app.config.get('IMPORT_WORKER_ENABLED', True):
+        logger.info("Imports en arrière-plan désactivés")
+        return None
+
+    import_service = ImportService(
+        app,
+        dossier=os.path.join(app.config['UPLOAD_FOLDER'], 'imports'),
+        taille_lot=app.config.get('IMPORT_BATCH_SIZE', 5000),
+        max_erreurs=app.config.get('IMPORT_MAX_ERRORS', 100),
+        poll_seconds=app.config.get('IMPORT_POLL_SECONDS', 30),
+        stale_minutes=app.config.get('IMPORT_STALE_MINUTES', 10)
+    )
+    import_service.start_worker()
+    import_service.start()
+    return import_service
@@ -0,0 +1,125 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import uuid
+from datetime import datetime, timezone
+from flask import g, has_request_context, request
+
+# Attributs standards d'un LogRecord (tout le reste est considéré comme champ "extra")
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+# À passer en `extra` pour les messages à fort volume (emails, sauvegardes...)
+HIGH_VOLUME = {'sampled': True}
+
+
+class JSONFormatter(logging.Formatter):
+    """Formate chaque log en une ligne JSON"""
+
+    def format(self, record):
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and key != 'sampled':
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler qui conserve les champs et la trace d'exception séparés du message"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class RequestIdFilter(logging.Filter):
+    """Ajoute l'identifiant de la requête HTTP courante à chaque log"""
+
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = g.get('request_id') if has_request_context() else None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Ne conserve qu'une fraction des messages marqués `sampled` (jamais les warnings/erreurs)"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not getattr(record, 'sampled', False):
+            return True
+        return random.random() < self.rate
+
+
+# Listener global (un par processus)
+log_listener = None
+
+def setup_logging(app):
+    """
+    Configure des logs JSON non bloquants
+
+    Les handlers applicatifs ne font qu'un `put` dans une file ; un thread
+    d'arrière-plan (QueueListener) se charge de l'écriture sur stdout.
+    """
+    global log_listener
+
+    level = app.config.get('LOG_LEVEL', 'INFO')
+    sample_rate = app.config.get('LOG_SAMPLE_RATE', 1.0)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = StructuredQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JSONFormatter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, StructuredQueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    # Flask ajoute son propre handler stderr à app.logger : on passe par la file
+    app.logger.handlers.clear()
+    app.logger.propagate = True
+
+    if log_listener is not None:
+        log_listener.stop()
+    log_listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(log_listener.stop)
+
+    @app.before_request
+    def assign_request_id():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+
+    @app.after_request
+    def expose_request_id(response):
+        if 'request_id' in g:
+            response.headers['X-Request-ID'] = g.request_id
+        return response
+
+    return log_listener
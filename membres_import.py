@@ -0,0 +1,177 @@
+"""
+Import en masse des membres (CSV, NDJSON ou tableau JSON)
+
+Colonnes (CSV) ou clés : nom, prenom, email (obligatoires), telephone.
+
+Les membres sont dédoublonnés par email normalisé (sans espaces, en
+minuscules), comme l'index unique (id_utilisateur, lower(email)) :
+
+- un email déjà présent plus haut dans le fichier est un conflit ;
+- un email déjà inscrit met à jour le membre (`mode='maj'`, par défaut) ou
+  est signalé en conflit (`mode='ignorer'`). Seules les colonnes renseignées
+  dans la ligne sont écrites : un telephone absent ou vide conserve celui
+  du membre.
+
+Chaque lot fait une requête IN sur lower(email) (index), un INSERT par
+executemany et un UPDATE par executemany pour chaque jeu de colonnes
+modifiées, puis un commit. Un lot rejeté par l'index unique
+(membre créé entre-temps par une autre requête) n'annule que ce lot.
+"""
+import re
+import time
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from models import db, Membre, champs_recherche_membre, normaliser_email
+from sync import stamp
+from versioning import bump_versions
+
+COLONNES = ('nom', 'prenom', 'email')
+OPTIONNELLES = ('telephone',)
+MODES = ('maj', 'ignorer')
+COMPTEURS = ('lignes', 'crees', 'mis_a_jour', 'conflits', 'rejetes')
+EMAIL = re.compile(r'[^@\s]+@[^@\s]+\.[^@\s]+')
+
+
+def valider_membre(donnees):
+    """
+    Valeurs d'un membre, ou message d'erreur : retourne (valeurs, None) ou (None, erreur)
+
+    Les colonnes optionnelles absentes ou vides ne figurent pas dans les valeurs.
+    """
+    if isinstance(donnees, ValueError):
+        return None, str(donnees)
+    if not isinstance(donnees, dict):
+        return None, 'Objet JSON attendu'
+
+    valeurs = {champ: str(donnees.get(champ) or '').strip() for champ in COLONNES + OPTIONNELLES}
+    for champ in OPTIONNELLES:
+        if not valeurs[champ]:
+            del valeurs[champ]
+    if not all(valeurs[champ] for champ in COLONNES):
+        return None, 'nom, prenom et email requis'
+    if not EMAIL.fullmatch(valeurs['email']):
+        return None, 'email invalide'
+    if len(valeurs['nom']) > 100 or len(valeurs['prenom']) > 100 or len(valeurs['email']) > 255:
+        return None, 'Texte trop long (nom et prenom : 100 caractères, email : 255)'
+    if len(valeurs.get('telephone', '')) > 20:
+        return None, 'telephone trop long (20 caractères)'
+    return valeurs, None
+
+
+class ImportMembres:
+    """Import d'un flux de lignes (numéro, données) dans les membres d'une bibliothèque"""
+
+    def __init__(self, id_utilisateur, mode='maj', taille_lot=5000, max_erreurs=100):
+        if mode not in MODES:
+            raise ValueError("Mode inconnu (maj ou ignorer)")
+        self.id_utilisateur = id_utilisateur
+        self.mode = mode
+        self.taille_lot = taille_lot
+        self.max_erreurs = max_erreurs
+        self.rapport = {compteur: 0 for compteur in COMPTEURS}
+        self.rapport.update({'erreurs': [], 'details_conflits': []})
+        # Emails normalisés déjà lus dans le fichier
+        self._vus = set()
+
+    def executer(self, lignes):
+        """Importe toutes les lignes ; retourne le rapport (compteurs, erreurs et conflits par ligne)"""
+        start = time.perf_counter()
+        lot = []
+        for numero, donnees in lignes:
+            self.rapport['lignes'] += 1
+            valeurs, erreur = valider_membre(donnees)
+            if erreur:
+                self._signaler('erreurs', {'ligne': numero, 'erreur': erreur})
+                self.rapport['rejetes'] += 1
+                continue
+            cle = normaliser_email(valeurs['email'])
+            if cle in self._vus:
+                self._conflit(numero, valeurs['email'], 'Email en double dans le fichier')
+                continue
+            self._vus.add(cle)
+            lot.append((numero, cle, valeurs))
+            if len(lot) >= self.taille_lot:
+                self._importer_lot(lot)
+                lot = []
+        if lot:
+            self._importer_lot(lot)
+
+        self.rapport['duree_ms'] = round((time.perf_counter() - start) * 1000)
+        return self.rapport
+
+    def _signaler(self, liste, detail):
+        if len(self.rapport[liste]) < self.max_erreurs:
+            self.rapport[liste].append(detail)
+        else:
+            self.rapport[f'{liste}_tronquees'] = True
+
+    def _conflit(self, numero, email, raison, id_membre=None):
+        self.rapport['conflits'] += 1
+        detail = {'ligne': numero, 'email': email, 'raison': raison}
+        if id_membre is not None:
+            detail['id_membre'] = id_membre
+        self._signaler('details_conflits', detail)
+
+    def _existants(self, cles):
+        """id_membre des membres de la bibliothèque par email normalisé"""
+        email = func.lower(Membre.email)
+        return dict(db.session.execute(
+            select(email, Membre.id_membre).where(Membre.id_utilisateur == self.id_utilisateur, email.in_(cles))
+        ).all())
+
+    def _importer_lot(self, lot):
+        # Mises à jour groupées par jeu de colonnes : un executemany par groupe
+        nouveaux, modifies, conflits = [], {}, []
+        try:
+            existants = self._existants([cle for _, cle, _ in lot])
+            valeurs = stamp(self.id_utilisateur)
+            for numero, cle, membre in lot:
+                id_membre = existants.get(cle)
+                complet = {**dict.fromkeys(OPTIONNELLES, ''), **membre}
+                recherche = champs_recherche_membre(**complet)
+                if id_membre is None:
+                    nouveaux.append({
+                        **complet, **recherche, 'statut': 'actif',
+                        'date_inscription': valeurs['updated_at'].date(), 'id_utilisateur': self.id_utilisateur,
+                        **valeurs
+                    })
+                elif self.mode == 'maj':
+                    colonnes = tuple(sorted(membre))
+                    modifies.setdefault(colonnes, []).append({
+                        **membre, **{f'{champ}_recherche': recherche[f'{champ}_recherche'] for champ in membre},
+                        'b_id_membre': id_membre, **valeurs
+                    })
+                else:
+                    conflits.append((numero, membre['email'], id_membre))
+
+            if nouveaux:
+                db.session.execute(insert(Membre.__table__), nouveaux)
+            table = Membre.__table__
+            for groupe in modifies.values():
+                db.session.execute(
+                    update(table).where(table.c.id_membre == bindparam('b_id_membre')).values(
+                        **{colonne: bindparam(colonne) for colonne in groupe[0] if colonne != 'b_id_membre'}
+                    ),
+                    groupe
+                )
+            if nouveaux or modifies:
+                bump_versions(self.id_utilisateur, 'membres')
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            self.rapport['rejetes'] += len(lot)
+            self._signaler('erreurs', {
+                'ligne': lot[0][0],
+                'erreur': f"Lot de {len(lot)} lignes non importé : email inscrit pendant l'import, relancer l'import"
+            })
+            return
+        except Exception as e:
+            db.session.rollback()
+            self.rapport['rejetes'] += len(lot)
+            self._signaler('erreurs', {'ligne': lot[0][0], 'erreur': f"Lot de {len(lot)} lignes non importé : {e}"})
+            return
+
+        self.rapport['crees'] += len(nouveaux)
+        self.rapport['mis_a_jour'] += sum(len(groupe) for groupe in modifies.values())
+        for numero, email, id_membre in conflits:
+            self._conflit(numero, email, 'Email déjà inscrit', id_membre)
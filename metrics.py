@@ -0,0 +1,193 @@
+import hmac
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import Response, current_app, g, request
+from sqlalchemy import event
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+    REGISTRY, generate_latest, multiprocess
+)
+
+# En production (gunicorn), PROMETHEUS_MULTIPROC_DIR est défini par gunicorn.conf.py :
+# chaque worker écrit ses valeurs dans ce dossier et /metrics les agrège.
+MULTIPROCESS = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+
+# ============ HTTP ============
+HTTP_REQUESTS = Counter(
+    'bibliotech_http_requests_total',
+    'Nombre de requêtes HTTP',
+    ['endpoint', 'method', 'status']
+)
+HTTP_LATENCY = Histogram(
+    'bibliotech_http_request_duration_seconds',
+    'Durée des requêtes HTTP',
+    ['endpoint', 'method', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+# ============ POOL DE CONNEXIONS ============
+DB_CONNECT_DURATION = Histogram(
+    'bibliotech_db_connect_duration_seconds',
+    "Durée d'ouverture des nouvelles connexions à la base (connexions créées par le pool)",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+)
+DB_POOL_IN_USE = Gauge(
+    'bibliotech_db_pool_connections_in_use',
+    'Connexions actuellement empruntées au pool',
+    multiprocess_mode='livesum'
+)
+DB_POOL_SIZE = Gauge(
+    'bibliotech_db_pool_size',
+    'Taille configurée du pool (pool_size + max_overflow)',
+    multiprocess_mode='livesum'
+)
+
+# ============ EMAILS ============
+EMAIL_OUTBOX_DEPTH = Gauge(
+    'bibliotech_email_outbox_depth',
+    "Emails en cours d'envoi",
+    multiprocess_mode='livesum'
+)
+EMAILS_SENT = Counter(
+    'bibliotech_emails_total',
+    'Emails envoyés',
+    ['status']
+)
+
+# ============ SAUVEGARDES ============
+BACKUP_DURATION = Histogram(
+    'bibliotech_backup_duration_seconds',
+    'Durée des sauvegardes automatiques',
+    ['status'],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+)
+
+# ============ RETARDS ET AMENDES ============
+OVERDUE_RUN_DURATION = Histogram(
+    'bibliotech_overdue_run_duration_seconds',
+    'Durée des passes de détection des retards et de calcul des amendes',
+    ['status'],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+)
+
+# ============ CACHE DE RÉPONSES ============
+CACHE_REQUESTS = Counter(
+    'bibliotech_response_cache_requests_total',
+    'Consultations du cache de réponses',
+    ['endpoint', 'result']
+)
+
+# ============ ÉVÈNEMENTS (SSE) ============
+EVENTS_SUBSCRIBERS = Gauge(
+    'bibliotech_events_subscribers',
+    'Flux SSE ouverts',
+    multiprocess_mode='livesum'
+)
+
+# ============ BCRYPT ============
+BCRYPT_DURATION = Histogram(
+    'bibliotech_bcrypt_duration_seconds',
+    'Durée des opérations bcrypt',
+    ['operation'],
+    buckets=(0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 1, 2)
+)
+
+
+@contextmanager
+def suivre_envoi_email():
+    """Compte un email dans la file d'envoi le temps de l'envoi"""
+    EMAIL_OUTBOX_DEPTH.inc()
+    try:
+        yield
+    finally:
+        EMAIL_OUTBOX_DEPTH.dec()
+
+
+def mesurer_bcrypt(operation):
+    """Décorateur mesurant la durée d'une opération bcrypt"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                BCRYPT_DURATION.labels(operation=operation).observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def _instrumenter_pool(engine):
+    """
+    Suit les connexions empruntées et l'ouverture des connexions du pool SQLAlchemy
+
+    Uniquement par les évènements publics : un pool saturé se lit à
+    bibliotech_db_pool_connections_in_use rapporté à bibliotech_db_pool_size.
+    """
+    pool = engine.pool
+
+    if hasattr(pool, 'size'):
+        DB_POOL_SIZE.set(pool.size() + max(getattr(pool, '_max_overflow', 0), 0))
+
+    @event.listens_for(pool, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_IN_USE.inc()
+
+    @event.listens_for(pool, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        DB_POOL_IN_USE.dec()
+
+    @event.listens_for(engine, 'do_connect')
+    def before_connect(dialect, connection_record, cargs, cparams):
+        connection_record.info['metrics_connect_start'] = time.perf_counter()
+
+    @event.listens_for(pool, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        start = connection_record.info.pop('metrics_connect_start', None)
+        if start is not None:
+            DB_CONNECT_DURATION.observe(time.perf_counter() - start)
+
+
+def _metrics_view():
+    # Fermé par défaut : sans METRICS_TOKEN, les métriques ne sont pas exposées
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        return Response('METRICS_TOKEN non configuré\n', status=403, mimetype='text/plain')
+    # Comparaison en octets : compare_digest refuse les chaînes non ASCII
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'), f'Bearer {token}'.encode('utf-8')):
+        return Response('Non autorisé\n', status=401, mimetype='text/plain')
+
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_metrics(app, db):
+    """Enregistre les hooks de mesure et l'endpoint /metrics"""
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+
+        # Endpoint Flask (et non le chemin) pour borner la cardinalité des labels
+        endpoint = request.url_rule.endpoint if request.url_rule else 'inconnu'
+        labels = {'endpoint': endpoint, 'method': request.method, 'status': str(response.status_code)}
+        HTTP_REQUESTS.labels(**labels).inc()
+        HTTP_LATENCY.labels(**labels).observe(time.perf_counter() - start)
+        return response
+
+    with app.app_context():
+        _instrumenter_pool(db.engine)
+
+    app.add_url_rule('/metrics', 'metrics', _metrics_view)
@@ -0,0 +1,348 @@
+"""
+Migrations légères et idempotentes du schéma
+
+`db.create_all()` crée les tables manquantes mais ne modifie pas les tables
+existantes. `upgrade_schema` complète ces dernières : colonnes ajoutées aux
+modèles (ALTER TABLE ... ADD COLUMN) et index manquants (un index unique que
+des doublons existants empêchent de créer est signalé sans bloquer le
+démarrage). Les migrations de données (MIGRATIONS_DONNEES) traitent les
+lignes par lots et ne sont exécutées qu'une fois par base : `migrer_donnees`
+enregistre chacune dans la table migrations_donnees et ne parcourt plus les
+tables aux démarrages suivants. Elle est appelée au démarrage de l'application
+(DATA_MIGRATIONS_ON_STARTUP) ou explicitement avant un déploiement :
+
+  flask --app app migrer
+"""
+import logging
+from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
+from sqlalchemy import bindparam, func, insert, inspect, select, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateColumn
+from circulation import AMENDE_PAR_JOUR, AMENDE_PLAFOND, STATUTS_EN_COURS
+from exemplaires import nouveaux_exemplaires
+from models import (
+    Livre, Membre, Exemplaire, Emprunt, Amende, Reservation, MigrationDonnees, champs_recherche_membre, empreinte_livre
+)
+
+logger = logging.getLogger(__name__)
+
+
+class MigrationIncomplete(Exception):
+    """Migration de données partiellement appliquée : non enregistrée, reprise au prochain lancement"""
+
+
+def _noms_index(conn, inspector, table_name):
+    """Index existants d'une table (SQLite : lus dans sqlite_master, la réflexion ignore les index sur expression)"""
+    if conn.dialect.name == 'sqlite':
+        return set(conn.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"), {'table': table_name}
+        ).scalars())
+    return {index['name'] for index in inspector.get_indexes(table_name)}
+
+
+def upgrade_schema(db):
+    """Ajoute les colonnes et index définis dans les modèles mais absents de la base"""
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                # Une colonne NOT NULL ajoutée à une table existante doit avoir un server_default
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {ddl}'))
+                logger.info("Colonne ajoutée", extra={'table': table.name, 'colonne': column.name})
+
+            indexes = _noms_index(conn, inspector, table.name)
+            for index in table.indexes:
+                if index.name in indexes:
+                    continue
+                try:
+                    with conn.begin_nested():
+                        index.create(conn)
+                except IntegrityError:
+                    # Index unique sur des données existantes en double : l'application démarre quand même
+                    logger.error("Index unique non créé : doublons à résoudre", extra={
+                        'table': table.name, 'index': index.name
+                    })
+                    continue
+                logger.info("Index créé", extra={'table': table.name, 'index': index.name})
+
+
+# ============ DONNÉES ============
+
+def calculer_empreintes(db, batch_size=5000):
+    """Renseigne l'empreinte de dédoublonnage des livres créés avant son introduction (par lots)"""
+    dernier, total = 0, 0
+    while True:
+        with db.engine.begin() as conn:
+            livres = conn.execute(
+                select(Livre.id_livre, Livre.titre, Livre.auteur, Livre.annee_publication)
+                .where(Livre.id_livre > dernier, Livre.empreinte.is_(None))
+                .order_by(Livre.id_livre)
+                .limit(batch_size)
+            ).all()
+            if not livres:
+                break
+            dernier = livres[-1].id_livre
+            conn.execute(
+                update(Livre).where(Livre.id_livre == bindparam('b_livre'))
+                .values(empreinte=bindparam('b_empreinte')),
+                [{'b_livre': id_livre, 'b_empreinte': empreinte_livre(titre, auteur, annee)}
+                 for id_livre, titre, auteur, annee in livres]
+            )
+        total += len(livres)
+        logger.info("Empreintes calculées", extra={'livres': len(livres), 'dernier_livre': dernier})
+    return total
+
+
+def calculer_recherche_membres(db, batch_size=5000):
+    """Renseigne les colonnes de recherche de l'annuaire des membres créés avant leur introduction (par lots)"""
+    dernier, total = 0, 0
+    while True:
+        with db.engine.begin() as conn:
+            membres = conn.execute(
+                select(Membre.id_membre, Membre.nom, Membre.prenom, Membre.email, Membre.telephone)
+                .where(Membre.id_membre > dernier, Membre.nom_recherche.is_(None))
+                .order_by(Membre.id_membre)
+                .limit(batch_size)
+            ).all()
+            if not membres:
+                break
+            dernier = membres[-1].id_membre
+            lignes = []
+            for id_membre, nom, prenom, email, telephone in membres:
+                champs = champs_recherche_membre(nom, prenom, email, telephone)
+                lignes.append({'b_membre': id_membre, **{f'b_{champ}': valeur for champ, valeur in champs.items()}})
+            conn.execute(
+                update(Membre).where(Membre.id_membre == bindparam('b_membre'))
+                .values(**{champ: bindparam(f'b_{champ}') for champ in champs}),
+                lignes
+            )
+        total += len(membres)
+        logger.info("Colonnes de recherche calculées", extra={'membres': len(membres), 'dernier_membre': dernier})
+    return total
+
+
+def creer_exemplaires_manquants(db, batch_size=1000):
+    """
+    Crée les exemplaires physiques des livres qui n'en ont encore aucun
+
+    Les livres sont parcourus par id croissant, `batch_size` à la fois, et
+    chaque lot est validé séparément : une migration interrompue reprend où
+    elle s'était arrêtée. Les emprunts en cours sont rattachés aux premiers
+    exemplaires du livre (statut emprunte). Les exemplaires créés ont la
+    version 0 : les clients les reçoivent lors d'une synchronisation complète.
+
+    Un livre dont un code-barres par défaut est déjà attribué est laissé sans
+    exemplaires ; les autres sont traités, puis MigrationIncomplete est levée
+    pour que la migration soit reprise une fois le conflit résolu.
+    """
+    dernier, total, ignores = 0, 0, []
+    while True:
+        with db.engine.begin() as conn:
+            livres = conn.execute(
+                select(Livre.id_livre, Livre.id_utilisateur, Livre.nombre_exemplaires)
+                .where(Livre.id_livre > dernier,
+                       Livre.nombre_exemplaires > 0,
+                       ~select(Exemplaire.id_exemplaire).where(Exemplaire.id_livre == Livre.id_livre).exists())
+                .order_by(Livre.id_livre)
+                .limit(batch_size)
+            ).all()
+            if not livres:
+                break
+            dernier = livres[-1].id_livre
+            ids = [livre.id_livre for livre in livres]
+
+            prets = defaultdict(list)
+            for id_emprunt, id_livre in conn.execute(
+                select(Emprunt.id_emprunt, Emprunt.id_livre)
+                .where(Emprunt.id_livre.in_(ids), Emprunt.statut.in_(STATUTS_EN_COURS))
+                .order_by(Emprunt.id_emprunt)
+            ):
+                prets[id_livre].append(id_emprunt)
+
+            lignes = []
+            for id_livre, id_utilisateur, nombre in livres:
+                sortis = len(prets.get(id_livre, ()))
+                exemplaires = nouveaux_exemplaires(id_utilisateur, id_livre, max(nombre, sortis))
+                for exemplaire in exemplaires[:sortis]:
+                    exemplaire['statut'] = 'emprunte'
+                lignes += exemplaires
+            try:
+                with conn.begin_nested():
+                    conn.execute(insert(Exemplaire), lignes)
+            except IntegrityError:
+                # Code-barres par défaut déjà porté par un autre exemplaire : livre par livre, sans le fautif
+                inserees = []
+                for id_livre, groupe in groupby(lignes, key=itemgetter('id_livre')):
+                    groupe = list(groupe)
+                    try:
+                        with conn.begin_nested():
+                            conn.execute(insert(Exemplaire), groupe)
+                    except IntegrityError:
+                        ignores.append(id_livre)
+                        logger.error("Exemplaires non créés : code-barres déjà attribué", extra={'id_livre': id_livre})
+                        continue
+                    inserees += groupe
+                lignes = inserees
+
+            if prets:
+                sortis = defaultdict(list)
+                for id_exemplaire, id_livre in conn.execute(
+                    select(Exemplaire.id_exemplaire, Exemplaire.id_livre)
+                    .where(Exemplaire.id_livre.in_(list(prets)), Exemplaire.statut == 'emprunte')
+                    .order_by(Exemplaire.id_exemplaire)
+                ):
+                    sortis[id_livre].append(id_exemplaire)
+                rattachements = [{'b_emprunt': id_emprunt, 'b_exemplaire': id_exemplaire}
+                                 for id_livre, emprunts in prets.items()
+                                 for id_emprunt, id_exemplaire in zip(emprunts, sortis[id_livre])]
+                if rattachements:
+                    conn.execute(
+                        update(Emprunt).where(Emprunt.id_emprunt == bindparam('b_emprunt'))
+                        .values(id_exemplaire=bindparam('b_exemplaire')),
+                        rattachements
+                    )
+
+        total += len(lignes)
+        logger.info("Exemplaires créés", extra={'livres': len(livres), 'exemplaires': len(lignes), 'dernier_livre': dernier})
+    if ignores:
+        raise MigrationIncomplete(f"{len(ignores)} livre(s) sans exemplaires : codes-barres déjà attribués")
+    return total
+
+
+def mettre_de_cote_reservations(db):
+    """
+    Rattache un exemplaire (statut reserve) à chaque réservation mise de côté avant
+    le suivi des exemplaires réservés ; ces réservations sont peu nombreuses (un lot)
+    """
+    with db.engine.begin() as conn:
+        reservations = conn.execute(
+            select(Reservation.id_reservation, Reservation.id_livre)
+            .where(Reservation.statut == 'disponible', Reservation.id_exemplaire.is_(None))
+            .order_by(Reservation.id_reservation)
+        ).all()
+        if not reservations:
+            return 0
+        libres = defaultdict(list)
+        for id_exemplaire, id_livre in conn.execute(
+            select(Exemplaire.id_exemplaire, Exemplaire.id_livre)
+            .where(Exemplaire.id_livre.in_({reservation.id_livre for reservation in reservations}),
+                   Exemplaire.statut == 'disponible')
+            .order_by(Exemplaire.id_exemplaire)
+        ):
+            libres[id_livre].append(id_exemplaire)
+        paires = [{'b_reservation': id_reservation, 'b_exemplaire': libres[id_livre].pop(0)}
+                  for id_reservation, id_livre in reservations if libres[id_livre]]
+        if paires:
+            conn.execute(
+                update(Reservation).where(Reservation.id_reservation == bindparam('b_reservation'))
+                .values(id_exemplaire=bindparam('b_exemplaire')),
+                paires
+            )
+            conn.execute(
+                update(Exemplaire)
+                .where(Exemplaire.id_exemplaire.in_([paire['b_exemplaire'] for paire in paires]))
+                .values(statut='reserve')
+            )
+    logger.info("Exemplaires mis de côté rattachés", extra={'reservations': len(paires)})
+    return len(paires)
+
+
+def dater_paiements(db, batch_size=5000):
+    """
+    Renseigne le jour de paiement des amendes payées avant son introduction, pour
+    les recettes des statistiques : date de leur dernière modification (le paiement)
+
+    Les amendes payées avant le suivi des modifications (updated_at NULL) n'ont
+    aucune trace de leur date de paiement : date_paiement reste NULL et elles
+    sont absentes des recettes par jour (la date de l'amende serait celle du retour).
+    """
+    total = 0
+    while True:
+        with db.engine.begin() as conn:
+            ids = conn.scalars(
+                select(Amende.id_amende)
+                .where(Amende.statut == 'payee', Amende.date_paiement.is_(None), Amende.updated_at.is_not(None))
+                .limit(batch_size)
+            ).all()
+            if not ids:
+                break
+            conn.execute(
+                update(Amende).where(Amende.id_amende.in_(ids))
+                .values(date_paiement=func.date(Amende.updated_at))
+            )
+        total += len(ids)
+        logger.info("Dates de paiement renseignées", extra={'amendes': len(ids)})
+    return total
+
+
+def fixer_taux_amendes(db):
+    """
+    Renseigne taux journalier et plafond des amendes en cours de calcul ouvertes
+    avant le calcul à la lecture : sans eux, leur montant cesserait d'augmenter
+    """
+    with db.engine.begin() as conn:
+        total = conn.execute(
+            update(Amende)
+            .where(Amende.statut == 'impayee', Amende.date_calcul.is_not(None), Amende.taux_journalier.is_(None))
+            .values(taux_journalier=AMENDE_PAR_JOUR, plafond=AMENDE_PLAFOND)
+        ).rowcount
+    logger.info("Taux des amendes ouvertes renseignés", extra={'amendes': total})
+    return total
+
+
+# Dans l'ordre d'application (les exemplaires existent avant d'être mis de côté)
+MIGRATIONS_DONNEES = (
+    ('calculer_empreintes', calculer_empreintes),
+    ('calculer_recherche_membres', calculer_recherche_membres),
+    ('creer_exemplaires_manquants', creer_exemplaires_manquants),
+    ('mettre_de_cote_reservations', mettre_de_cote_reservations),
+    ('dater_paiements', dater_paiements),
+    ('fixer_taux_amendes', fixer_taux_amendes),
+)
+# Verrou consultatif PostgreSQL : un seul worker applique les migrations, les autres attendent
+VERROU_MIGRATIONS = 0x42494254
+
+
+def migrer_donnees(db):
+    """
+    Applique les migrations de données pas encore enregistrées ; retourne leurs noms
+
+    Une migration incomplète n'est pas enregistrée et interrompt les suivantes :
+    toutes sont reprises au prochain lancement.
+    """
+    appliquees = []
+    with db.engine.connect() as verrou:
+        if verrou.dialect.name == 'postgresql':
+            verrou.execute(text('SELECT pg_advisory_lock(:cle)'), {'cle': VERROU_MIGRATIONS})
+        try:
+            with db.engine.connect() as conn:
+                faites = set(conn.scalars(select(MigrationDonnees.nom)))
+            for nom, migration in MIGRATIONS_DONNEES:
+                if nom in faites:
+                    continue
+                try:
+                    lignes = migration(db)
+                except MigrationIncomplete as e:
+                    # Les migrations suivantes peuvent dépendre de celle-ci : elles attendent aussi
+                    logger.error("Migration de données incomplète", extra={'migration': nom, 'erreur': str(e)})
+                    break
+                with db.engine.begin() as conn:
+                    conn.execute(insert(MigrationDonnees).values(nom=nom))
+                logger.info("Migration de données appliquée", extra={'migration': nom, 'lignes': lignes})
+                appliquees.append(nom)
+        finally:
+            if verrou.dialect.name == 'postgresql':
+                verrou.execute(text('SELECT pg_advisory_unlock(:cle)'), {'cle': VERROU_MIGRATIONS})
+    return appliquees
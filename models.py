@@ -2,12 +2,23 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_login import UserMixin
 from datetime import datetime, timedelta
+from hashlib import blake2b
 import secrets
 import random
+import unicodedata
+from sqlalchemy import Integer, case, event, or_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import column_property
+from sqlalchemy.sql.functions import FunctionElement
+from metrics import mesurer_bcrypt
 
 db = SQLAlchemy()
 bcrypt = Bcrypt()
 
+# Texte normalisé pour la recherche par préfixe (plages d'index) : collation C
+# sous PostgreSQL pour que l'ordre de l'index soit celui des codes Unicode
+TexteRecherche = db.String(255).with_variant(db.String(255, collation='C'), 'postgresql')
+
 class Utilisateur(UserMixin, db.Model):
     __tablename__ = 'utilisateurs'
     id_utilisateur = db.Column(db.Integer, primary_key=True)
@@ -36,9 +47,11 @@ class Utilisateur(UserMixin, db.Model):
     def get_id(self):
         return str(self.id_utilisateur)
     
+    @mesurer_bcrypt('hash')
     def set_password(self, password):
         self.mot_de_passe = bcrypt.generate_password_hash(password).decode('utf-8')
     
+    @mesurer_bcrypt('check')
     def check_password(self, password):
         return bcrypt.check_password_hash(self.mot_de_passe, password)
     
@@ -85,9 +98,20 @@ class Livre(db.Model):
     nombre_exemplaires = db.Column(db.Integer, default=1)
     disponibles = db.Column(db.Integer, default=1)
     id_utilisateur = db.Column(db.Integer, db.ForeignKey('utilisateurs.id_utilisateur'), nullable=False)
+    # Hash de (titre, auteur, annee_publication) normalisés : détection des doublons à l'import
+    empreinte = db.Column(db.BigInteger)
+    # Synchronisation incrémentale (voir sync.py) : numéro de séquence de la dernière modification
+    version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_livres_sync', 'id_utilisateur', 'version'),
+        db.Index('ix_livres_empreinte', 'id_utilisateur', 'empreinte'),
+    )
     
     emprunts = db.relationship('Emprunt', backref='livre', lazy=True)
     reservations = db.relationship('Reservation', backref='livre', lazy=True)
+    exemplaires = db.relationship('Exemplaire', backref='livre', lazy=True, cascade='all, delete-orphan')
 
     def to_dict(self):
         return {
@@ -110,6 +134,24 @@ class Membre(db.Model):
     date_inscription = db.Column(db.Date, default=datetime.utcnow)
     statut = db.Column(db.String(20), default='actif')
     id_utilisateur = db.Column(db.Integer, db.ForeignKey('utilisateurs.id_utilisateur'), nullable=False)
+    # Annuaire (voir annuaire.py) : nom, prénom et email sans accents ni casse, chiffres du téléphone
+    nom_recherche = db.Column(TexteRecherche)
+    prenom_recherche = db.Column(TexteRecherche)
+    email_recherche = db.Column(TexteRecherche)
+    telephone_recherche = db.Column(TexteRecherche)
+    # Synchronisation incrémentale (voir sync.py) : numéro de séquence de la dernière modification
+    version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_membres_sync', 'id_utilisateur', 'version'),
+        # Recherche par préfixe et tri de l'annuaire (id_membre départage les égalités)
+        db.Index('ix_membres_nom', 'id_utilisateur', 'nom_recherche', 'prenom_recherche', 'id_membre'),
+        db.Index('ix_membres_prenom', 'id_utilisateur', 'prenom_recherche', 'nom_recherche', 'id_membre'),
+        db.Index('ix_membres_email_recherche', 'id_utilisateur', 'email_recherche', 'id_membre'),
+        db.Index('ix_membres_telephone', 'id_utilisateur', 'telephone_recherche', 'id_membre'),
+        db.Index('ix_membres_inscription', 'id_utilisateur', 'date_inscription', 'id_membre'),
+    )
     
     emprunts = db.relationship('Emprunt', backref='membre', lazy=True)
     reservations = db.relationship('Reservation', backref='membre', lazy=True)
@@ -126,15 +168,115 @@ class Membre(db.Model):
             'id_utilisateur': self.id_utilisateur
         }
 
+# Un email par membre dans une bibliothèque, sans tenir compte de la casse
+db.Index('ux_membres_email', Membre.id_utilisateur, db.func.lower(Membre.email), unique=True)
+
+
+def normaliser_email(email):
+    """Email comparé à l'index ux_membres_email (espaces retirés, minuscules)"""
+    return (email or '').strip().lower()
+
+
+def normaliser_recherche(texte):
+    """Texte sans accents ni casse, espaces réduits (« Hélène  Dupré » -> « helene dupre »)"""
+    decompose = unicodedata.normalize('NFKD', texte or '')
+    return ' '.join(''.join(c for c in decompose if not unicodedata.combining(c)).casefold().split())
+
+
+def chiffres(texte):
+    return ''.join(c for c in texte or '' if c.isdigit())
+
+
+def champs_recherche_membre(nom, prenom, email, telephone):
+    """Colonnes *_recherche d'un membre (à inclure dans les écritures en SQL direct)"""
+    return {
+        'nom_recherche': normaliser_recherche(nom),
+        'prenom_recherche': normaliser_recherche(prenom),
+        'email_recherche': normaliser_recherche(email),
+        'telephone_recherche': chiffres(telephone)
+    }
+
+
+@event.listens_for(Membre, 'before_insert')
+@event.listens_for(Membre, 'before_update')
+def _calculer_recherche(mapper, connection, membre):
+    for champ, valeur in champs_recherche_membre(membre.nom, membre.prenom, membre.email, membre.telephone).items():
+        setattr(membre, champ, valeur)
+
+
+def cle_livre(titre, auteur, annee_publication):
+    """Clé de dédoublonnage : titre et auteur sans casse ni espaces superflus, année"""
+    return (' '.join((titre or '').split()).casefold(), ' '.join((auteur or '').split()).casefold(), annee_publication)
+
+
+def empreinte_livre(titre, auteur, annee_publication):
+    """Hash 64 bits signé de la clé de dédoublonnage (colonne BigInteger indexée)"""
+    titre, auteur, annee = cle_livre(titre, auteur, annee_publication)
+    digest = blake2b(f"{titre}\x1f{auteur}\x1f{annee}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+@event.listens_for(Livre, 'before_insert')
+@event.listens_for(Livre, 'before_update')
+def _calculer_empreinte(mapper, connection, livre):
+    livre.empreinte = empreinte_livre(livre.titre, livre.auteur, livre.annee_publication)
+
+class Exemplaire(db.Model):
+    """Exemplaire physique d'un livre, identifié par son code-barres"""
+    __tablename__ = 'exemplaires'
+    id_exemplaire = db.Column(db.Integer, primary_key=True)
+    id_livre = db.Column(db.Integer, db.ForeignKey('livres.id_livre'), nullable=False)
+    id_utilisateur = db.Column(db.Integer, db.ForeignKey('utilisateurs.id_utilisateur'), nullable=False)
+    code_barres = db.Column(db.String(50), nullable=False)
+    # disponible | emprunte | reserve (mis de côté pour une réservation, voir Reservation.id_exemplaire)
+    statut = db.Column(db.String(20), nullable=False, default='disponible')
+    date_ajout = db.Column(db.Date, default=datetime.utcnow)
+    # Synchronisation incrémentale (voir sync.py) : numéro de séquence de la dernière modification
+    version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Scan au comptoir : un code-barres est unique dans une bibliothèque
+        db.Index('ux_exemplaires_code_barres', 'id_utilisateur', 'code_barres', unique=True),
+        db.Index('ix_exemplaires_livre', 'id_livre', 'statut'),
+        db.Index('ix_exemplaires_sync', 'id_utilisateur', 'version'),
+    )
+
+    def to_dict(self):
+        return {
+            'id_exemplaire': self.id_exemplaire,
+            'id_livre': self.id_livre,
+            'code_barres': self.code_barres,
+            'statut': self.statut,
+            'date_ajout': self.date_ajout.strftime('%Y-%m-%d') if self.date_ajout else None
+        }
+
 class Emprunt(db.Model):
     __tablename__ = 'emprunts'
     id_emprunt = db.Column(db.Integer, primary_key=True)
     id_livre = db.Column(db.Integer, db.ForeignKey('livres.id_livre'), nullable=False)
     id_membre = db.Column(db.Integer, db.ForeignKey('membres.id_membre'), nullable=False)
+    id_exemplaire = db.Column(db.Integer, db.ForeignKey('exemplaires.id_exemplaire'))
     date_emprunt = db.Column(db.Date, default=datetime.utcnow)
     date_retour_prevue = db.Column(db.Date, nullable=False)
     date_retour_reelle = db.Column(db.Date)
     statut = db.Column(db.String(20), default='en_cours')
+    # Synchronisation incrémentale (voir sync.py) : numéro de séquence de la dernière modification
+    version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_emprunts_sync', 'id_livre', 'version'),
+        # Détection des retards : seuls les emprunts en cours arrivés à échéance sont parcourus
+        db.Index('ix_emprunts_echeance', 'statut', 'date_retour_prevue'),
+        db.Index('ix_emprunts_exemplaire', 'id_exemplaire', 'statut'),
+        # Historique d'un membre ou d'un livre : plage de dates et pagination par (date_emprunt, id_emprunt)
+        db.Index('ix_emprunts_membre', 'id_membre', 'date_emprunt', 'id_emprunt'),
+        db.Index('ix_emprunts_livre', 'id_livre', 'date_emprunt', 'id_emprunt'),
+        # Agrégation quotidienne des statistiques (emprunts et retours d'un jour, toutes bibliothèques)
+        db.Index('ix_emprunts_date', 'date_emprunt'),
+        db.Index('ix_emprunts_date_retour', 'date_retour_reelle'),
+    )
     
     amendes = db.relationship('Amende', backref='emprunt', lazy=True)
 
@@ -143,6 +285,7 @@ class Emprunt(db.Model):
             'id_emprunt': self.id_emprunt,
             'id_livre': self.id_livre,
             'id_membre': self.id_membre,
+            'id_exemplaire': self.id_exemplaire,
             'livre': self.livre.to_dict() if self.livre else None,
             'membre': self.membre.to_dict() if self.membre else None,
             'date_emprunt': self.date_emprunt.strftime('%Y-%m-%d') if self.date_emprunt else None,
@@ -151,6 +294,22 @@ class Emprunt(db.Model):
             'statut': self.statut
         }
 
+class jours_ecoules(FunctionElement):
+    """Jours écoulés entre une date et aujourd'hui (UTC, comme datetime.utcnow de l'application)"""
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(jours_ecoules)
+def _jours_ecoules(element, compiler, **kw):
+    return f"(CAST(timezone('utc', now()) AS DATE) - {compiler.process(element.clauses, **kw)})"
+
+
+@compiles(jours_ecoules, 'sqlite')
+def _jours_ecoules_sqlite(element, compiler, **kw):
+    return f"CAST(julianday(date('now')) - julianday({compiler.process(element.clauses, **kw)}) AS INTEGER)"
+
+
 class Amende(db.Model):
     __tablename__ = 'amendes'
     id_amende = db.Column(db.Integer, primary_key=True)
@@ -158,13 +317,39 @@ class Amende(db.Model):
     montant = db.Column(db.Float, nullable=False)
     statut = db.Column(db.String(20), default='impayee')
     date_creation = db.Column(db.Date, default=datetime.utcnow)
+    # Amende d'un emprunt en retard : date jusqu'à laquelle `montant` a été calculé (NULL une fois soldée
+    # ou payée) ; le montant dû croît ensuite de `taux_journalier` par jour, jusqu'à `plafond`
+    date_calcul = db.Column(db.Date)
+    taux_journalier = db.Column(db.Float)
+    plafond = db.Column(db.Float)
+    # Jour du paiement (recettes des statistiques de circulation)
+    date_paiement = db.Column(db.Date)
+    # Synchronisation incrémentale (voir sync.py) : numéro de séquence de la dernière modification
+    version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_amendes_sync', 'id_emprunt', 'version'),
+        db.Index('ix_amendes_calcul', 'statut', 'date_calcul'),
+        # Amendes impayées des emprunts d'un historique (total dû par membre ou par livre)
+        db.Index('ix_amendes_emprunt', 'id_emprunt', 'statut', 'montant'),
+        db.Index('ix_amendes_paiement', 'date_paiement'),
+    )
+
+    # Montant dû à ce jour, calculé à la lecture : le job des retards ne réécrit pas les amendes ouvertes
+    montant_du = column_property(case(
+        (or_(date_calcul.is_(None), taux_journalier.is_(None)), montant),
+        (montant >= plafond, montant),
+        (montant + taux_journalier * jours_ecoules(date_calcul) > plafond, plafond),
+        else_=montant + taux_journalier * jours_ecoules(date_calcul)
+    ))
 
     def to_dict(self):
         return {
             'id_amende': self.id_amende,
             'id_emprunt': self.id_emprunt,
             'emprunt': self.emprunt.to_dict() if self.emprunt else None,
-            'montant': self.montant,
+            'montant': self.montant_du,
             'statut': self.statut,
             'date_creation': self.date_creation.strftime('%Y-%m-%d') if self.date_creation else None
         }
@@ -175,7 +360,20 @@ class Reservation(db.Model):
     id_livre = db.Column(db.Integer, db.ForeignKey('livres.id_livre'), nullable=False)
     id_membre = db.Column(db.Integer, db.ForeignKey('membres.id_membre'), nullable=False)
     date_reservation = db.Column(db.Date, default=datetime.utcnow)
+    # en_attente -> disponible (exemplaire mis de côté) -> satisfaite | expiree ; ou annulee
     statut = db.Column(db.String(20), default='en_attente')
+    date_expiration = db.Column(db.Date)  # Dernier jour de retrait d'un exemplaire mis de côté
+    id_exemplaire = db.Column(db.Integer, db.ForeignKey('exemplaires.id_exemplaire'))  # Exemplaire mis de côté
+    # Synchronisation incrémentale (voir sync.py) : numéro de séquence de la dernière modification
+    version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_reservations_sync', 'id_livre', 'version'),
+        # File d'attente d'un livre : tête = plus petit id_reservation en_attente
+        db.Index('ix_reservations_file', 'id_livre', 'statut', 'id_reservation'),
+        db.Index('ix_reservations_expiration', 'statut', 'date_expiration'),
+    )
 
     def to_dict(self):
         return {
@@ -185,5 +383,127 @@ class Reservation(db.Model):
             'livre': self.livre.to_dict() if self.livre else None,
             'membre': self.membre.to_dict() if self.membre else None,
             'date_reservation': self.date_reservation.strftime('%Y-%m-%d') if self.date_reservation else None,
-            'statut': self.statut
-        }
\ No newline at end of file
+            'statut': self.statut,
+            'date_expiration': self.date_expiration.strftime('%Y-%m-%d') if self.date_expiration else None,
+            'id_exemplaire': self.id_exemplaire
+        }
+
+class VersionCollection(db.Model):
+    """Compteur de version par bibliothèque et par collection, incrémenté à chaque écriture"""
+    __tablename__ = 'versions_collections'
+    id_utilisateur = db.Column(db.Integer, db.ForeignKey('utilisateurs.id_utilisateur'), primary_key=True)
+    collection = db.Column(db.String(30), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Suppression(db.Model):
+    """Trace d'une ligne supprimée, pour que la synchronisation incrémentale la propage"""
+    __tablename__ = 'suppressions'
+    id_suppression = db.Column(db.Integer, primary_key=True)
+    id_utilisateur = db.Column(db.Integer, db.ForeignKey('utilisateurs.id_utilisateur'), nullable=False)
+    collection = db.Column(db.String(30), nullable=False)
+    id_objet = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.BigInteger, nullable=False)
+    date_suppression = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_suppressions_sync', 'id_utilisateur', 'version'),)
+
+
+class MigrationDonnees(db.Model):
+    """Migration de données déjà appliquée à cette base (voir migrations.migrer_donnees)"""
+    __tablename__ = 'migrations_donnees'
+    nom = db.Column(db.String(100), primary_key=True)
+    date_application = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class TacheImport(db.Model):
+    """Import de catalogue exécuté en arrière-plan (voir import_service.py), repris là où il s'est arrêté"""
+    __tablename__ = 'taches_import'
+    id_tache = db.Column(db.Integer, primary_key=True)
+    id_utilisateur = db.Column(db.Integer, db.ForeignKey('utilisateurs.id_utilisateur'), nullable=False)
+    nom_fichier = db.Column(db.String(255))
+    chemin = db.Column(db.String(500), nullable=False)
+    format = db.Column(db.String(20), nullable=False)
+    # en_attente -> en_cours -> terminee | echec ; un import interrompu repasse en_attente
+    statut = db.Column(db.String(20), nullable=False, default='en_attente')
+    # Point de reprise : numéro de la dernière notice (ou ligne) traitée, enregistré avec chaque lot
+    position = db.Column(db.Integer, nullable=False, default=0)
+    lignes = db.Column(db.Integer, nullable=False, default=0)
+    importes = db.Column(db.Integer, nullable=False, default=0)
+    doublons = db.Column(db.Integer, nullable=False, default=0)
+    rejetes = db.Column(db.Integer, nullable=False, default=0)
+    erreurs = db.Column(db.JSON)
+    message = db.Column(db.String(500))
+    date_creation = db.Column(db.DateTime, default=datetime.utcnow)
+    date_debut = db.Column(db.DateTime)
+    # Mise à jour à chaque lot : une tâche en_cours qui n'avance plus est reprise par un autre worker
+    date_maj = db.Column(db.DateTime, default=datetime.utcnow)
+    date_fin = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_taches_import_file', 'statut', 'id_tache'),
+        db.Index('ix_taches_import_utilisateur', 'id_utilisateur', 'id_tache'),
+    )
+
+    def to_dict(self):
+        return {
+            'id_tache': self.id_tache,
+            'nom_fichier': self.nom_fichier,
+            'format': self.format,
+            'statut': self.statut,
+            'position': self.position,
+            'lignes': self.lignes,
+            'importes': self.importes,
+            'doublons': self.doublons,
+            'rejetes': self.rejetes,
+            'erreurs': self.erreurs or [],
+            'message': self.message,
+            'date_creation': self.date_creation.strftime('%Y-%m-%d %H:%M:%S') if self.date_creation else None,
+            'date_debut': self.date_debut.strftime('%Y-%m-%d %H:%M:%S') if self.date_debut else None,
+            'date_fin': self.date_fin.strftime('%Y-%m-%d %H:%M:%S') if self.date_fin else None
+        }
+
+
+# ============ STATISTIQUES DE CIRCULATION ============
+# Agrégats quotidiens des jours clôturés (voir analytics.py), recalculés par le job nocturne.
+# Livres et membres sans clé étrangère : l'historique survit à leur suppression.
+
+class StatistiqueJour(db.Model):
+    """Circulation d'une bibliothèque pour un jour"""
+    __tablename__ = 'statistiques_jour'
+    id_utilisateur = db.Column(db.Integer, db.ForeignKey('utilisateurs.id_utilisateur'), primary_key=True)
+    jour = db.Column(db.Date, primary_key=True)
+    emprunts = db.Column(db.Integer, nullable=False, default=0)
+    retours = db.Column(db.Integer, nullable=False, default=0)
+    amendes_payees = db.Column(db.Integer, nullable=False, default=0)
+    recettes = db.Column(db.Float, nullable=False, default=0)
+
+    # Dernier jour agrégé (toutes bibliothèques) : les jours suivants sont lus dans les emprunts
+    __table_args__ = (db.Index('ix_statistiques_jour_jour', 'jour'),)
+
+
+class StatistiqueLivreJour(db.Model):
+    """Emprunts d'un livre pour un jour"""
+    __tablename__ = 'statistiques_livres_jour'
+    id_utilisateur = db.Column(db.Integer, db.ForeignKey('utilisateurs.id_utilisateur'), primary_key=True)
+    jour = db.Column(db.Date, primary_key=True)
+    id_livre = db.Column(db.Integer, primary_key=True)
+    emprunts = db.Column(db.Integer, nullable=False, default=0)
+
+
+class StatistiqueCategorieJour(db.Model):
+    """Emprunts d'une catégorie (celle du livre le jour de l'agrégation ; '' sans catégorie) pour un jour"""
+    __tablename__ = 'statistiques_categories_jour'
+    id_utilisateur = db.Column(db.Integer, db.ForeignKey('utilisateurs.id_utilisateur'), primary_key=True)
+    jour = db.Column(db.Date, primary_key=True)
+    categorie = db.Column(db.String(100), primary_key=True)
+    emprunts = db.Column(db.Integer, nullable=False, default=0)
+
+
+class StatistiqueMembreJour(db.Model):
+    """Emprunts d'un membre pour un jour"""
+    __tablename__ = 'statistiques_membres_jour'
+    id_utilisateur = db.Column(db.Integer, db.ForeignKey('utilisateurs.id_utilisateur'), primary_key=True)
+    jour = db.Column(db.Date, primary_key=True)
+    id_membre = db.Column(db.Integer, primary_key=True)
+    emprunts = db.Column(db.Integer, nullable=False, default=0)
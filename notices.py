@@ -0,0 +1,279 @@
+"""
+Lecture en flux des notices bibliographiques (MARC21, UNIMARC, MARCXML, ONIX)
+
+Chaque lecteur produit (numéro de notice, données) comme les lecteurs CSV et
+NDJSON de catalogue_import.py : les données sont un dict titre, auteur,
+categorie, annee_publication, nombre_exemplaires, ou une ValueError si la
+notice est illisible. La mémoire utilisée est constante :
+
+- ISO 2709 (.mrc) : le fichier est lu par blocs et découpé sur le terminateur
+  de notice (0x1D) ;
+- XML (MARCXML ou ONIX 2.1/3.0, balises longues ou courtes) : iterparse, chaque
+  notice est libérée dès qu'elle est convertie.
+
+Correspondance des champs :
+
+=============== =================== =============== ======================
+Livre           MARC21              UNIMARC         ONIX
+=============== =================== =============== ======================
+titre           245 $a $b           200 $a $e       TitleText (TitleType 01)
+auteur          100/110/111/700 $a  700/710/701 $a  Contributor (rôle A01)
+annee           264/260 $c, 008     210/214 $d      PublishingDate (rôle 01)
+categorie       650/651/655 $a      606/607/608 $a  SubjectHeadingText
+exemplaires     nb de 952/949/852   nb de 995       1
+=============== =================== =============== ======================
+"""
+import re
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+
+FIN_NOTICE = b'\x1d'
+FIN_CHAMP = b'\x1e'
+SOUS_CHAMP = b'\x1f'
+TAILLE_BLOC = 1 << 16
+
+ANNEE = re.compile(r'\d{4}')
+# Ponctuation ISBD en fin de sous-champ ; le point est conservé dans les noms (initiales)
+PONCTUATION = ' /:;,.=+'
+PONCTUATION_NOM = ' /:;,=+'
+MAX_CATEGORIE = 100
+
+# Champs à essayer dans l'ordre (étiquette, sous-champs) ; exemplaires : champs d'exemplaire
+MARC21 = {
+    'titre': [('245', 'ab')],
+    'auteur': [('100', 'a'), ('110', 'a'), ('111', 'a'), ('700', 'a'), ('710', 'a')],
+    'annee': [('264', 'c'), ('260', 'c')],
+    'categorie': [('650', 'a'), ('651', 'a'), ('655', 'a')],
+    'exemplaires': ('952', '949', '852')
+}
+UNIMARC = {
+    'titre': [('200', 'ae')],
+    'auteur': [('700', 'ab'), ('710', 'a'), ('701', 'ab')],
+    'annee': [('210', 'd'), ('214', 'd')],
+    'categorie': [('606', 'a'), ('607', 'a'), ('608', 'a')],
+    'exemplaires': ('995',)
+}
+# Séparateur des sous-champs retenus : « titre : complément », « Nom, Prénom »
+SEPARATEURS = {'titre': ' : ', 'auteur': ', '}
+
+# Balises courtes ONIX utilisées (2.1 et 3.0) -> balises longues
+ONIX_COURTES = {
+    'product': 'Product', 'title': 'Title', 'titledetail': 'TitleDetail', 'titleelement': 'TitleElement',
+    'b202': 'TitleType', 'b203': 'TitleText', 'b030': 'TitlePrefix', 'b031': 'TitleWithoutPrefix',
+    'b029': 'Subtitle', 'b028': 'DistinctiveTitle', 'contributor': 'Contributor', 'b035': 'ContributorRole',
+    'b036': 'PersonName', 'b037': 'PersonNameInverted', 'b039': 'NamesBeforeKey', 'b040': 'KeyNames',
+    'b047': 'CorporateName', 'b003': 'PublicationDate', 'publishingdate': 'PublishingDate',
+    'x448': 'PublishingDateRole', 'b306': 'Date', 'subject': 'Subject', 'b070': 'SubjectHeadingText'
+}
+
+
+# ============ MARC (ISO 2709 ET MARCXML) ============
+
+def _nettoyer(texte, ponctuation=PONCTUATION):
+    """Texte d'un sous-champ sans la ponctuation ISBD finale (« Les misérables / » -> « Les misérables »)"""
+    return ' '.join(texte.split()).rstrip(ponctuation)
+
+
+def _valeur(champs, grille, cle):
+    """Premier champ présent parmi les candidats de la grille : ses sous-champs retenus, joints"""
+    ponctuation = PONCTUATION_NOM if cle == 'auteur' else PONCTUATION
+    for etiquette, codes in grille[cle]:
+        for sous_champs in champs.get(etiquette, ()):
+            morceaux = [_nettoyer(valeur, ponctuation) for code, valeur in sous_champs if code in codes]
+            morceaux = [morceau for morceau in morceaux if morceau]
+            if morceaux:
+                return SEPARATEURS.get(cle, ' ').join(morceaux)
+    return ''
+
+
+def livre_depuis_marc(controle, champs):
+    """
+    Données d'un livre à partir d'une notice MARC
+
+    `controle` : zones de contrôle (étiquette -> texte) ; `champs` : étiquette ->
+    liste de champs, chaque champ étant une liste (code, valeur) de sous-champs.
+    Une notice sans 245 mais avec un 200 est lue comme de l'UNIMARC.
+    """
+    grille = UNIMARC if '245' not in champs and '200' in champs else MARC21
+
+    annee = ANNEE.search(_valeur(champs, grille, 'annee'))
+    if annee is None and grille is MARC21 and len(controle.get('008', '')) >= 11:
+        annee = ANNEE.fullmatch(controle['008'][7:11])
+
+    exemplaires = next((len(champs[etiquette]) for etiquette in grille['exemplaires'] if champs.get(etiquette)), None)
+    return {
+        'titre': _valeur(champs, grille, 'titre'),
+        'auteur': _valeur(champs, grille, 'auteur'),
+        'categorie': _valeur(champs, grille, 'categorie')[:MAX_CATEGORIE],
+        'annee_publication': int(annee.group()) if annee else None,
+        'nombre_exemplaires': exemplaires
+    }
+
+
+def _decoder(octets, utf8):
+    if utf8:
+        return octets.decode('utf-8', errors='replace')
+    # MARC-8 n'est pas décodé : ASCII identique, repli latin-1 pour les caractères étendus
+    try:
+        return octets.decode('utf-8')
+    except UnicodeDecodeError:
+        return octets.decode('latin-1')
+
+
+def lire_iso2709(octets):
+    """(zones de contrôle, champs) d'une notice ISO 2709 ; lève ValueError si elle est mal formée"""
+    try:
+        base = int(octets[12:17])
+        repertoire = octets[24:base - 1]
+    except ValueError:
+        raise ValueError('Notice MARC mal formée (guide)') from None
+    if base > len(octets) or len(repertoire) % 12:
+        raise ValueError('Notice MARC mal formée (répertoire)')
+
+    utf8 = octets[9:10] == b'a'
+    controle, champs = {}, defaultdict(list)
+    for i in range(0, len(repertoire), 12):
+        entree = repertoire[i:i + 12]
+        try:
+            etiquette = entree[:3].decode('ascii')
+            longueur, debut = int(entree[3:7]), int(entree[7:12])
+        except ValueError:
+            raise ValueError('Notice MARC mal formée (répertoire)') from None
+        donnees = octets[base + debut:base + debut + longueur].rstrip(FIN_CHAMP)
+        if etiquette < '010':
+            controle[etiquette] = _decoder(donnees, utf8)
+        else:
+            # Deux indicateurs, puis un sous-champ par délimiteur : code (1 octet) et valeur
+            champs[etiquette].append([
+                (chr(sous_champ[0]), _decoder(sous_champ[1:], utf8))
+                for sous_champ in donnees.split(SOUS_CHAMP)[1:] if sous_champ
+            ])
+    return controle, champs
+
+
+def lire_marc(flux):
+    """(numéro, données ou ValueError) pour chaque notice d'un flux binaire ISO 2709"""
+    numero, reste = 0, b''
+    while True:
+        bloc = flux.read(TAILLE_BLOC)
+        notices = (reste + bloc).split(FIN_NOTICE) if bloc else [reste, b'']
+        reste = notices.pop()
+        for octets in notices:
+            octets = octets.lstrip(b'\r\n ')
+            if not octets:
+                continue
+            numero += 1
+            try:
+                yield numero, livre_depuis_marc(*lire_iso2709(octets))
+            except ValueError as e:
+                yield numero, e
+        if not bloc:
+            return
+
+
+# ============ XML (MARCXML ET ONIX) ============
+
+def _nom(element):
+    """Nom local d'un élément (sans espace de noms), balises courtes ONIX converties"""
+    nom = element.tag.rpartition('}')[2]
+    return ONIX_COURTES.get(nom, nom)
+
+
+def _texte(element, *noms):
+    """Texte du premier enfant portant l'un de ces noms ('' si aucun)"""
+    for enfant in element:
+        if _nom(enfant) in noms and enfant.text and enfant.text.strip():
+            return ' '.join(enfant.text.split())
+    return ''
+
+
+def _descendants(element, nom):
+    return [descendant for descendant in element.iter() if _nom(descendant) == nom]
+
+
+def _preferer(elements, nom_role, role):
+    """Éléments dont le rôle (TitleType, ContributorRole...) vaut `role` en premier"""
+    return sorted(elements, key=lambda element: _texte(element, nom_role) != role)
+
+
+def livre_depuis_marcxml(notice):
+    controle, champs = {}, defaultdict(list)
+    for element in notice:
+        nom = _nom(element)
+        if nom == 'controlfield':
+            controle[element.get('tag', '')] = element.text or ''
+        elif nom == 'datafield':
+            champs[element.get('tag', '')].append([
+                (sous_champ.get('code', ''), sous_champ.text or '') for sous_champ in element
+            ])
+    return livre_depuis_marc(controle, champs)
+
+
+def livre_depuis_onix(produit):
+    titre = ''
+    for element in _preferer(_descendants(produit, 'TitleDetail') + _descendants(produit, 'Title'), 'TitleType', '01'):
+        parties = element.iter() if _nom(element) == 'TitleDetail' else [element]
+        for partie in parties:
+            titre = _texte(partie, 'TitleText') or ' '.join(
+                filter(None, (_texte(partie, 'TitlePrefix'), _texte(partie, 'TitleWithoutPrefix')))
+            )
+            if titre:
+                break
+        if titre:
+            break
+    titre = titre or _texte(produit, 'DistinctiveTitle')
+
+    auteur = ''
+    for contributeur in _preferer(_descendants(produit, 'Contributor'), 'ContributorRole', 'A01'):
+        auteur = (_texte(contributeur, 'PersonName')
+                  or ' '.join(filter(None, (_texte(contributeur, 'NamesBeforeKey'), _texte(contributeur, 'KeyNames'))))
+                  or _texte(contributeur, 'PersonNameInverted')
+                  or _texte(contributeur, 'CorporateName'))
+        if auteur:
+            break
+
+    dates = [_texte(date, 'Date') for date in _preferer(_descendants(produit, 'PublishingDate'), 'PublishingDateRole', '01')]
+    annee = ANNEE.search(' '.join(dates) or _texte(produit, 'PublicationDate'))
+    sujets = [_texte(sujet, 'SubjectHeadingText') for sujet in _descendants(produit, 'Subject')]
+    return {
+        'titre': titre,
+        'auteur': auteur,
+        'categorie': next(filter(None, sujets), '')[:MAX_CATEGORIE],
+        'annee_publication': int(annee.group()) if annee else None,
+        'nombre_exemplaires': None
+    }
+
+
+def lire_xml(flux):
+    """
+    (numéro, données ou ValueError) pour chaque notice d'un flux MARCXML
+    (<collection>/<record>) ou ONIX (<ONIXMessage>/<Product>) ; le format est
+    déduit de l'élément racine
+    """
+    racine, conversion, element_notice = None, None, None
+    numero = 0
+    try:
+        for evenement, element in ET.iterparse(flux, events=('start', 'end')):
+            if racine is None:
+                racine = element
+                nom = _nom(racine)
+                if nom in ('collection', 'record'):
+                    conversion, element_notice = livre_depuis_marcxml, 'record'
+                elif nom.lower() == 'onixmessage':
+                    conversion, element_notice = livre_depuis_onix, 'Product'
+                else:
+                    raise ValueError(f"Document XML non reconnu (<{nom}>) : MARCXML ou ONIX attendu")
+            if evenement != 'end' or _nom(element) != element_notice:
+                continue
+            numero += 1
+            try:
+                yield numero, conversion(element)
+            except ValueError as e:
+                yield numero, e
+            # Libère les notices déjà converties
+            racine.clear()
+    except ET.ParseError as e:
+        if numero == 0:
+            raise ValueError(f"XML invalide : {e}") from None
+        # Le reste du document est illisible : l'erreur est rapportée sur la notice suivante
+        yield numero + 1, ValueError(f"XML invalide : {e}")
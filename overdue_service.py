@@ -0,0 +1,220 @@
+"""
+Détection des retards, calcul des amendes et expiration des réservations (job planifié)
+
+Chaque exécution :
+1. signale le changement quotidien des amendes ouvertes (version de la
+   collection `amendes`) : leur montant n'est pas réécrit, il est calculé à la
+   lecture depuis date_calcul, le taux journalier et le plafond (Amende.montant_du) ;
+2. passe au statut `en_retard` les emprunts `en_cours` arrivés à échéance et
+   leur ouvre une amende (date_calcul = aujourd'hui), soldée au retour ;
+3. expire les exemplaires réservés non retirés et les passe à la réservation
+   suivante de la file (index (statut, date_expiration)).
+
+Seules les lignes dont l'état change sont lues : l'index (statut,
+date_retour_prevue) limite la détection aux emprunts encore `en_cours` échus,
+l'index (statut, date_calcul) trouve les bibliothèques ayant des amendes
+ouvertes. Les écritures sont des UPDATE/INSERT ensemblistes, une
+transaction par bibliothèque, horodatées avec `stamp()` pour /api/sync.
+
+Relancer le job le même jour (redémarrage, un planificateur par worker) ne
+fait qu'incrémenter à nouveau des versions : chaque UPDATE ne retient que des
+lignes pas encore traitées, et cette condition est réévaluée après l'attente
+d'un verrou concurrent.
+"""
+import logging
+import time
+from datetime import datetime
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+from sqlalchemy import insert, select, update
+from circulation import AMENDE_PAR_JOUR, AMENDE_PLAFOND, calculer_amende, expirer_reservations
+from events import publish
+from logging_config import HIGH_VOLUME
+from metrics import OVERDUE_RUN_DURATION
+from models import db, Livre, Emprunt, Amende, Reservation
+from sync import stamp
+from versioning import bump_versions
+
+logger = logging.getLogger(__name__)
+
+
+class OverdueService:
+    """Service de détection des retards et de calcul des amendes"""
+
+    def __init__(self, app):
+        self.app = app
+        self.scheduler = BackgroundScheduler()
+
+    def run(self, aujourd_hui=None):
+        """Exécute une passe complète (durée exposée dans /metrics) ; retourne le nombre de lignes traitées par étape"""
+        start = time.perf_counter()
+        status = 'ok'
+        try:
+            with self.app.app_context():
+                aujourd_hui = aujourd_hui or datetime.utcnow().date()
+                resultat = {
+                    'amendes_majorees': self.majorer_amendes(aujourd_hui),
+                    'emprunts_en_retard': self.marquer_retards(aujourd_hui),
+                    'reservations_expirees': self.expirer_reservations(aujourd_hui)
+                }
+            logger.info("Retards et amendes mis à jour", extra={
+                **resultat,
+                'duree_ms': round((time.perf_counter() - start) * 1000)
+            })
+            return resultat
+        except Exception:
+            status = 'erreur'
+            logger.exception("Erreur lors du traitement des retards")
+            return None
+        finally:
+            OVERDUE_RUN_DURATION.labels(status=status).observe(time.perf_counter() - start)
+
+    def majorer_amendes(self, aujourd_hui):
+        """
+        Signale le changement quotidien des amendes ouvertes (le montant dû est calculé à la lecture)
+
+        Aucune amende n'est réécrite : seule la version de la collection `amendes`
+        des bibliothèques concernées est incrémentée, pour que les ETag et le cache
+        de réponses ne servent pas les montants de la veille.
+        """
+        bibliotheques = db.session.scalars(
+            select(Livre.id_utilisateur).distinct()
+            .select_from(Amende)
+            .join(Emprunt, Amende.id_emprunt == Emprunt.id_emprunt)
+            .join(Livre, Emprunt.id_livre == Livre.id_livre)
+            .where(Amende.statut == 'impayee', Amende.date_calcul < aujourd_hui)
+        ).all()
+        for id_utilisateur in bibliotheques:
+            bump_versions(id_utilisateur, 'amendes')
+        db.session.commit()
+
+        for id_utilisateur in bibliotheques:
+            publish(id_utilisateur, 'amendes.majorees', {'date': aujourd_hui.isoformat()})
+        return len(bibliotheques)
+
+    def marquer_retards(self, aujourd_hui):
+        """Passe en retard les emprunts échus et leur ouvre une amende"""
+        echus = (Emprunt.statut == 'en_cours', Emprunt.date_retour_prevue < aujourd_hui)
+        bibliotheques = db.session.scalars(
+            select(Livre.id_utilisateur).distinct()
+            .join(Emprunt, Emprunt.id_livre == Livre.id_livre)
+            .where(*echus)
+        ).all()
+        db.session.rollback()
+
+        total = 0
+        for id_utilisateur in bibliotheques:
+            try:
+                valeurs = stamp(id_utilisateur)
+                lignes = db.session.execute(
+                    update(Emprunt)
+                    .where(*echus,
+                           Emprunt.id_livre.in_(select(Livre.id_livre).where(Livre.id_utilisateur == id_utilisateur)))
+                    .values(statut='en_retard', **valeurs)
+                    .returning(Emprunt.id_emprunt, Emprunt.date_retour_prevue)
+                ).all()
+                if lignes:
+                    db.session.execute(insert(Amende), [{
+                        'id_emprunt': id_emprunt,
+                        'montant': calculer_amende(date_retour_prevue, aujourd_hui),
+                        'statut': 'impayee',
+                        'date_creation': aujourd_hui,
+                        'date_calcul': aujourd_hui,
+                        'taux_journalier': AMENDE_PAR_JOUR,
+                        'plafond': AMENDE_PLAFOND,
+                        **valeurs
+                    } for id_emprunt, date_retour_prevue in lignes])
+                    bump_versions(id_utilisateur, 'emprunts', 'amendes')
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                logger.exception("Erreur lors de la détection des retards", extra={'id_utilisateur': id_utilisateur})
+                continue
+
+            if lignes:
+                total += len(lignes)
+                publish(id_utilisateur, 'emprunts.en_retard', {
+                    'ids_emprunts': [id_emprunt for id_emprunt, _ in lignes]
+                })
+                logger.info("Emprunts passés en retard", extra={
+                    'id_utilisateur': id_utilisateur, 'nombre': len(lignes), **HIGH_VOLUME
+                })
+        return total
+
+    def expirer_reservations(self, aujourd_hui):
+        """Expire les réservations mises de côté et non retirées, et sert les suivantes"""
+        bibliotheques = db.session.scalars(
+            select(Livre.id_utilisateur).distinct()
+            .join(Reservation, Reservation.id_livre == Livre.id_livre)
+            .where(Reservation.statut == 'disponible', Reservation.date_expiration < aujourd_hui)
+        ).all()
+        db.session.rollback()
+
+        total = 0
+        for id_utilisateur in bibliotheques:
+            try:
+                expirees, servies = expirer_reservations(id_utilisateur, aujourd_hui)
+                if expirees:
+                    bump_versions(id_utilisateur, 'reservations', 'livres')
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                logger.exception("Erreur lors de l'expiration des réservations", extra={'id_utilisateur': id_utilisateur})
+                continue
+
+            if expirees:
+                total += len(expirees)
+                publish(id_utilisateur, 'reservations.expirees', {'ids_reservations': expirees})
+                for reservation in servies:
+                    publish(id_utilisateur, 'reservation.disponible', reservation)
+        return total
+
+    def start_daily_run(self, hour=1, minute=0):
+        """
+        Lance le traitement tous les jours à une heure précise, ainsi qu'une
+        première passe immédiate (rattrapage après un arrêt)
+        """
+        self.scheduler.add_job(
+            self.run,
+            trigger=CronTrigger(hour=hour, minute=minute),
+            id='overdue_daily',
+            name='Retards et amendes',
+            next_run_time=datetime.now(),
+            coalesce=True,
+            replace_existing=True
+        )
+        logger.info("Traitement des retards programmé", extra={'heure': f"{hour:02d}:{minute:02d}"})
+
+    def start(self):
+        """Démarre le planificateur"""
+        if not self.scheduler.running:
+            self.scheduler.start()
+            logger.info("Service des retards démarré")
+        else:
+            logger.warning("Le service des retards est déjà en cours d'exécution")
+
+    def stop(self):
+        """Arrête le planificateur"""
+        if self.scheduler.running:
+            self.scheduler.shutdown()
+            logger.info("Service des retards arrêté")
+
+
+# Instance globale du service
+overdue_service = None
+
+def init_overdue_service(app):
+    """Initialise le traitement quotidien des retards (OVERDUE_* dans la configuration)"""
+    global overdue_service
+
+    if not app.config.get('OVERDUE_ENABLED', True):
+        logger.info("Traitement des retards désactivé")
+        return None
+
+    overdue_service = OverdueService(app)
+    overdue_service.start_daily_run(
+        hour=app.config.get('OVERDUE_HOUR', 1),
+        minute=app.config.get('OVERDUE_MINUTE', 0)
+    )
+    overdue_service.start()
+    return overdue_service
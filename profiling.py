@@ -0,0 +1,175 @@
+import cProfile
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from flask import g, jsonify, request, send_from_directory
+from flask_login import current_user, login_required
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+# Identifiant de profil généré par le serveur (uuid4 hexadécimal) : seul nom de fichier accepté
+_PROFILE_ID_RE = re.compile(r'[0-9a-f]{32}')
+_PROFILE_FILE_RE = re.compile(r'[0-9a-f]{32}\.(folded|prof)')
+
+
+class SamplingProfiler:
+    """
+    Échantillonne la pile d'un thread à intervalle régulier
+
+    Le résultat est au format "collapsed stacks" (une pile par ligne suivie
+    du nombre d'échantillons), directement exploitable par flamegraph.pl ou speedscope.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class RequestProfiler:
+    """Profilage à la demande de requêtes individuelles"""
+
+    def __init__(self, app=None):
+        self.folder = 'profiles'
+        self.mode = 'sampling'
+        self.sample_rate = 0.0
+        self.interval = 0.001
+        self.max_files = 200
+        self.max_age = 72 * 3600
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.folder = app.config.get('PROFILING_FOLDER', 'profiles')
+        self.mode = app.config.get('PROFILING_MODE', 'sampling')
+        self.sample_rate = app.config.get('PROFILING_SAMPLE_RATE', 0.0)
+        self.interval = app.config.get('PROFILING_INTERVAL_MS', 1) / 1000
+        self.max_files = app.config.get('PROFILING_MAX_FILES', 200)
+        self.max_age = app.config.get('PROFILING_MAX_AGE_HOURS', 72) * 3600
+
+        # Désactivé : aucun hook enregistré, donc aucun surcoût
+        if not app.config.get('PROFILING_ENABLED', False):
+            return
+
+        os.makedirs(self.folder, exist_ok=True)
+        app.before_request(self._start)
+        app.after_request(self._stop)
+        app.add_url_rule('/api/admin/profiles/<profile_id>', 'get_profile_output', self._download)
+
+    def _should_profile(self):
+        if request.headers.get(PROFILE_HEADER):
+            # Réservé aux administrateurs : le header déclenche seul le chargement de l'utilisateur
+            return current_user.is_authenticated and current_user.role == 'admin'
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _start(self):
+        if not self._should_profile():
+            return
+
+        if self.mode == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            profiler = SamplingProfiler(threading.get_ident(), self.interval)
+            profiler.start()
+        g.profiler = (profiler, time.perf_counter())
+
+    def _stop(self, response):
+        started = g.pop('profiler', None)
+        if started is None:
+            return response
+        profiler, start = started
+
+        # Nom de fichier généré par le serveur : X-Request-ID vient du client et n'est que journalisé
+        profile_id = uuid.uuid4().hex
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            filename = f"{profile_id}.prof"
+            profiler.dump_stats(os.path.join(self.folder, filename))
+        else:
+            profiler.stop()
+            filename = f"{profile_id}.folded"
+            profiler.write(os.path.join(self.folder, filename))
+        self._prune()
+
+        logger.info("Requête profilée", extra={
+            'route': f"{request.method} {request.path}",
+            'duree_ms': round((time.perf_counter() - start) * 1000, 2),
+            'fichier': filename
+        })
+        response.headers['X-Profile-Id'] = profile_id
+        return response
+
+    def _prune(self):
+        """Supprime les profils trop anciens, puis les plus anciens au-delà du nombre maximal"""
+        profiles = []
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if _PROFILE_FILE_RE.fullmatch(entry.name):
+                    try:
+                        profiles.append((entry.stat().st_mtime, entry.path))
+                    except FileNotFoundError:
+                        continue  # Supprimé entre-temps par un autre worker
+        profiles.sort(reverse=True)
+        limit = time.time() - self.max_age
+        for rank, (mtime, path) in enumerate(profiles):
+            if rank >= self.max_files or mtime < limit:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    @login_required
+    def _download(self, profile_id):
+        if current_user.role != 'admin':
+            return jsonify({'error': 'Accès réservé aux administrateurs'}), 403
+        if not _PROFILE_ID_RE.fullmatch(profile_id):
+            return jsonify({'error': 'Profil non trouvé'}), 404
+        for extension in ('.folded', '.prof'):
+            filename = f"{profile_id}{extension}"
+            if os.path.exists(os.path.join(self.folder, filename)):
+                return send_from_directory(os.path.abspath(self.folder), filename, as_attachment=True)
+        return jsonify({'error': 'Profil non trouvé'}), 404
+
+
+# Instance globale
+request_profiler = None
+
+def init_profiling(app):
+    """Active le profilage à la demande (header X-Profile pour les admins, ou échantillonnage)"""
+    global request_profiler
+    request_profiler = RequestProfiler(app)
+    return request_profiler
@@ -0,0 +1,212 @@
+"""
+Cache de réponses côté serveur, cloisonné par bibliothèque
+
+La clé combine la bibliothèque, la route, les paramètres de la requête et les
+versions des collections lues (voir versioning.py). Les routes d'écriture
+signalent les collections qu'elles modifient et leurs versions sont
+incrémentées juste après le commit : une écriture rend alors inaccessibles
+les seules entrées qu'elle périme, y compris dans le cache des autres
+workers. Entre le commit et l'incrément (ou jusqu'au commit suivant si
+l'incrément échoue malgré les nouvelles tentatives), l'ancienne entrée peut
+encore être servie. Les entrées obsolètes sortent ensuite par LRU ou expiration.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request
+from flask_login import current_user
+from metrics import CACHE_REQUESTS
+from versioning import get_versions
+
+try:
+    import redis
+except ImportError:  # Redis optionnel : seul le backend mémoire est alors disponible
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+# ============ BACKENDS ============
+
+class MemoryBackend:
+    """Cache LRU en mémoire du processus (un par worker)"""
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + timeout)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class LocalRedis:
+    """Substitut local d'un client Redis (get/set avec expiration), pour le développement et les tests"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                self._data.pop(key, None)
+                return None
+            return entry[0]
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ex if ex else float('inf'))
+        return True
+
+    def flushdb(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisBackend:
+    """Cache partagé entre workers et instances ; une panne de Redis se traduit par un miss"""
+
+    prefix = 'bibliotech:cache:'
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key):
+        try:
+            return self.client.get(self.prefix + key)
+        except Exception as e:
+            logger.warning("Cache partagé indisponible", extra={'erreur': str(e)})
+            return None
+
+    def set(self, key, value, timeout):
+        try:
+            self.client.set(self.prefix + key, value, ex=timeout)
+        except Exception as e:
+            logger.warning("Cache partagé indisponible", extra={'erreur': str(e)})
+
+    def clear(self):
+        self.client.flushdb()
+
+
+# ============ CACHE ============
+
+class ResponseCache:
+    """Cache des réponses JSON des routes de lecture"""
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.timeout = 300
+        self.salt = ''
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.timeout = app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+        self.salt = app.config.get('ETAG_SALT', '')
+        cache_type = app.config.get('CACHE_TYPE', 'memory')
+
+        if cache_type == 'redis':
+            url = app.config.get('CACHE_REDIS_URL', 'memory://')
+            if url == 'memory://':
+                self.backend = RedisBackend(LocalRedis())
+            elif redis is not None:
+                self.backend = RedisBackend(redis.Redis.from_url(url, socket_timeout=0.5))
+            else:
+                logger.warning("Module redis non installé : cache de réponses en mémoire")
+                cache_type = 'memory'
+
+        if cache_type == 'memory':
+            self.backend = MemoryBackend(app.config.get('CACHE_MAX_ENTRIES', 2048))
+
+        logger.info("Cache de réponses initialisé", extra={'backend': cache_type})
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def make_key(self, id_utilisateur, collections):
+        versions = get_versions(id_utilisateur, collections)
+        parts = [
+            self.salt,
+            str(id_utilisateur),
+            request.endpoint,
+            repr(sorted(request.args.items(multi=True))),
+            ','.join(f"{collection}:{version}" for collection, version in zip(collections, versions))
+        ]
+        return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            return None
+        mimetype, _, body = value.partition(b'\n')
+        return mimetype.decode('ascii'), body
+
+    def set(self, key, response):
+        self.backend.set(key, response.mimetype.encode('ascii') + b'\n' + response.get_data(), self.timeout)
+
+
+def cached(*collections, unless=None):
+    """
+    Décorateur de route GET : sert la réponse depuis le cache tant que les
+    collections dont elle dépend n'ont pas changé
+
+    `unless` : fonction sans argument ; si elle retourne vrai, la requête n'est pas mise en cache.
+    À placer sous @login_required (et sous @conditional le cas échéant).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if response_cache is None or not response_cache.enabled or (unless and unless()):
+                return view(*args, **kwargs)
+
+            key = response_cache.make_key(current_user.id_utilisateur, collections)
+            hit = response_cache.get(key)
+            if hit is not None:
+                CACHE_REQUESTS.labels(endpoint=request.endpoint, result='hit').inc()
+                mimetype, body = hit
+                return current_app.response_class(body, mimetype=mimetype)
+
+            CACHE_REQUESTS.labels(endpoint=request.endpoint, result='miss').inc()
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                response_cache.set(key, response)
+            return response
+        return wrapper
+    return decorator
+
+
+# Instance globale
+response_cache = None
+
+def init_response_cache(app):
+    """Active le cache de réponses (backend mémoire, Redis ou désactivé selon CACHE_TYPE)"""
+    global response_cache
+    response_cache = ResponseCache(app)
+    return response_cache
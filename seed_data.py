@@ -0,0 +1,202 @@
+"""
+Générateur de jeu de données multi-bibliothèques pour les benchmarks
+
+Les lignes sont insérées en masse (executemany par paquets) avec des
+identifiants pré-calculés, ce qui permet de générer des millions
+d'emprunts en quelques minutes sur SQLite comme sur PostgreSQL.
+
+Ces insertions ne passent pas par les évènements before_insert des modèles :
+les colonnes qu'ils calculent (empreinte des livres, colonnes *_recherche des
+membres) et les exemplaires physiques sont produits ici, comme le ferait
+l'application (les migrations de données sont déjà enregistrées comme appliquées).
+"""
+import random
+import time
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, insert, text
+from exemplaires import nouveaux_exemplaires
+from models import (
+    db, bcrypt, Utilisateur, Livre, Membre, Exemplaire, Emprunt, Amende, champs_recherche_membre, empreinte_livre
+)
+
+BENCH_PASSWORD = 'benchmark'
+BENCH_EMAIL = 'bench{}@bibliotech.test'
+CHUNK_SIZE = 10000
+
+CATEGORIES = ['Roman', 'Science', 'Histoire', 'Jeunesse', 'Policier', 'Philosophie', 'Informatique', 'Art', 'BD', 'Poésie']
+MOTS = ['nuit', 'mer', 'temps', 'ombre', 'ville', 'jardin', 'guerre', 'voyage', 'secret', 'lumière',
+        'enfant', 'roi', 'monde', 'histoire', 'chemin', 'maison', 'silence', 'feu', 'rêve', 'étoile']
+PRENOMS = ['Awa', 'Issaka', 'Marie', 'Jean', 'Fatou', 'Moussa', 'Claire', 'Paul', 'Aminata', 'Louis', 'Salif', 'Emma']
+NOMS = ['Ouedraogo', 'Traoré', 'Diallo', 'Martin', 'Bernard', 'Sawadogo', 'Kaboré', 'Dubois', 'Zongo', 'Petit']
+
+
+def _next_id(column):
+    return (db.session.query(func.max(column)).scalar() or 0) + 1
+
+
+def _bulk_insert(model, rows):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        db.session.execute(insert(model), rows[start:start + CHUNK_SIZE])
+
+
+def _reset_sequences():
+    """Réaligne les séquences PostgreSQL après insertion avec identifiants explicites"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for table, column in [('utilisateurs', 'id_utilisateur'), ('livres', 'id_livre'), ('membres', 'id_membre'),
+                          ('exemplaires', 'id_exemplaire'), ('emprunts', 'id_emprunt'), ('amendes', 'id_amende')]:
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), COALESCE(MAX({column}), 1)) FROM {table}"
+        ))
+
+
+def generate_dataset(tenants=100, livres=200, membres=100, emprunts=500, seed=42, progress=print):
+    """
+    Génère `tenants` bibliothèques avec, pour chacune, `livres` livres,
+    `membres` membres et `emprunts` emprunts (dont une partie en retard avec amende)
+
+    Doit être appelé dans un contexte d'application. Retourne le nombre de lignes créées par table.
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    started = time.perf_counter()
+    # Un seul hash bcrypt pour tous les comptes : le hachage dominerait sinon la génération
+    password_hash = bcrypt.generate_password_hash(BENCH_PASSWORD).decode('utf-8')
+
+    next_user = _next_id(Utilisateur.id_utilisateur)
+    next_livre = _next_id(Livre.id_livre)
+    next_membre = _next_id(Membre.id_membre)
+    next_exemplaire = _next_id(Exemplaire.id_exemplaire)
+    next_emprunt = _next_id(Emprunt.id_emprunt)
+    next_amende = _next_id(Amende.id_amende)
+    counts = {'utilisateurs': 0, 'livres': 0, 'membres': 0, 'exemplaires': 0, 'emprunts': 0, 'amendes': 0}
+
+    for tenant_index in range(tenants):
+        user_id = next_user
+        next_user += 1
+        _bulk_insert(Utilisateur, [{
+            'id_utilisateur': user_id,
+            'nom': rng.choice(NOMS),
+            'prenom': rng.choice(PRENOMS),
+            'email': BENCH_EMAIL.format(user_id),
+            'mot_de_passe': password_hash,
+            'role': 'utilisateur',
+            'email_verified': True,
+            'date_creation': datetime.utcnow()
+        }])
+
+        livre_rows, exemplaire_rows, libres = [], [], {}
+        for _ in range(livres):
+            copies = rng.randint(1, 5)
+            titre = ' '.join(rng.sample(MOTS, rng.randint(2, 4))).capitalize()
+            auteur = f"{rng.choice(PRENOMS)} {rng.choice(NOMS)}"
+            annee = rng.randint(1850, today.year)
+            livre_rows.append({
+                'id_livre': next_livre,
+                'titre': titre,
+                'auteur': auteur,
+                'categorie': rng.choice(CATEGORIES),
+                'annee_publication': annee,
+                'nombre_exemplaires': copies,
+                'disponibles': copies,
+                'id_utilisateur': user_id,
+                'empreinte': empreinte_livre(titre, auteur, annee)
+            })
+            copies_rows = nouveaux_exemplaires(user_id, next_livre, copies)
+            for copie in copies_rows:
+                copie['id_exemplaire'] = next_exemplaire
+                next_exemplaire += 1
+            exemplaire_rows += copies_rows
+            # Exemplaires encore en rayon, sortis par les emprunts en cours
+            libres[next_livre] = list(copies_rows)
+            next_livre += 1
+
+        membre_rows = []
+        for _ in range(membres):
+            prenom, nom = rng.choice(PRENOMS), rng.choice(NOMS)
+            membre_rows.append({
+                'id_membre': next_membre,
+                'nom': nom,
+                'prenom': prenom,
+                'email': f"{prenom.lower()}.{nom.lower()}.{next_membre}@exemple.test",
+                'telephone': f"+226 {rng.randint(10000000, 99999999)}",
+                'date_inscription': today - timedelta(days=rng.randint(0, 1500)),
+                'statut': 'actif' if rng.random() < 0.95 else 'inactif',
+                'id_utilisateur': user_id
+            })
+            membre_rows[-1].update(champs_recherche_membre(
+                nom, prenom, membre_rows[-1]['email'], membre_rows[-1]['telephone']
+            ))
+            next_membre += 1
+
+        emprunt_rows, amende_rows = [], []
+        for _ in range(emprunts if livre_rows and membre_rows else 0):
+            livre = rng.choice(livre_rows)
+            date_emprunt = today - timedelta(days=rng.randint(0, 730))
+            date_retour_prevue = date_emprunt + timedelta(days=14)
+            row = {
+                'id_emprunt': next_emprunt,
+                'id_livre': livre['id_livre'],
+                'id_membre': rng.choice(membre_rows)['id_membre'],
+                'id_exemplaire': None,
+                'date_emprunt': date_emprunt,
+                'date_retour_prevue': date_retour_prevue,
+                'date_retour_reelle': None,
+                'statut': 'en_cours'
+            }
+            # Emprunts récents toujours en cours, plus ~10 % des anciens (en retard)
+            still_out = date_retour_prevue >= today or rng.random() < 0.1
+            if still_out and livre['disponibles'] > 0:
+                livre['disponibles'] -= 1
+                copie = libres[livre['id_livre']].pop()
+                copie['statut'] = 'emprunte'
+                row['id_exemplaire'] = copie['id_exemplaire']
+            else:
+                retard = rng.randint(1, 30) if rng.random() < 0.2 else -rng.randint(0, 10)
+                row['date_retour_reelle'] = min(date_retour_prevue + timedelta(days=retard), today)
+                row['statut'] = 'retourne'
+                if row['date_retour_reelle'] > date_retour_prevue:
+                    amende_rows.append({
+                        'id_amende': next_amende,
+                        'id_emprunt': next_emprunt,
+                        'montant': (row['date_retour_reelle'] - date_retour_prevue).days * 0.50,
+                        'statut': 'payee' if rng.random() < 0.6 else 'impayee',
+                        'date_creation': row['date_retour_reelle']
+                    })
+                    next_amende += 1
+            emprunt_rows.append(row)
+            next_emprunt += 1
+
+        _bulk_insert(Livre, livre_rows)
+        _bulk_insert(Exemplaire, exemplaire_rows)
+        _bulk_insert(Membre, membre_rows)
+        _bulk_insert(Emprunt, emprunt_rows)
+        _bulk_insert(Amende, amende_rows)
+        db.session.commit()
+
+        counts['utilisateurs'] += 1
+        counts['livres'] += len(livre_rows)
+        counts['membres'] += len(membre_rows)
+        counts['exemplaires'] += len(exemplaire_rows)
+        counts['emprunts'] += len(emprunt_rows)
+        counts['amendes'] += len(amende_rows)
+
+        if progress and ((tenant_index + 1) % 50 == 0 or tenant_index + 1 == tenants):
+            elapsed = time.perf_counter() - started
+            progress(f" {tenant_index + 1}/{tenants} bibliothèques générées ({sum(counts.values())} lignes, {elapsed:.1f} s)")
+
+    _reset_sequences()
+    db.session.commit()
+    return counts
+
+
+def dataset_counts():
+    """Nombre de lignes par table (pour les métadonnées des résultats)"""
+    return {
+        'utilisateurs': Utilisateur.query.count(),
+        'livres': Livre.query.count(),
+        'membres': Membre.query.count(),
+        'exemplaires': Exemplaire.query.count(),
+        'emprunts': Emprunt.query.count(),
+        'amendes': Amende.query.count()
+    }
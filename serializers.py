@@ -0,0 +1,299 @@
+"""
+Sérialisation rapide des listes : JSON via orjson et lignes SQL sans objets ORM
+
+Les routes de liste sélectionnent directement les colonnes utiles (un seul
+SELECT avec jointures, sans hydrater d'objets ni déclencher de lazy loads)
+et produisent des dicts identiques à ceux des méthodes `to_dict` des modèles.
+Les paramètres `?fields=` et `?embed=` restreignent colonnes et jointures.
+"""
+import decimal
+from datetime import date
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+from sqlalchemy import select
+from models import db, Livre, Membre, Exemplaire, Emprunt, Amende, Reservation
+
+try:
+    import orjson
+except ImportError:  # Repli sur le module json standard
+    orjson = None
+
+
+# ============ FOURNISSEUR JSON ============
+
+def _default(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError(f"Type non sérialisable en JSON : {type(value).__name__}")
+
+
+class OrjsonProvider(JSONProvider):
+    """Fournisseur JSON Flask basé sur orjson (encodeur en C, sortie directement en bytes)"""
+
+    mimetype = 'application/json'
+
+    def _options(self):
+        options = orjson.OPT_NON_STR_KEYS
+        if self._app.debug:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=self._options()).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=_default, option=self._options()),
+            mimetype=self.mimetype
+        )
+
+
+def init_json_provider(app):
+    """Installe orjson comme encodeur JSON de l'application (si disponible)"""
+    app.json_provider_class = OrjsonProvider if orjson is not None else DefaultJSONProvider
+    app.json = app.json_provider_class(app)
+
+
+# ============ LIGNES -> DICTS ============
+
+class RowSchema:
+    """Colonnes d'un modèle et conversion d'un tuple de valeurs en dict"""
+
+    def __init__(self, model, fields, date_fields=(), expressions=None):
+        # `expressions` : champ -> expression SQL lue à la place de la colonne du même nom
+        self.fields = tuple(fields)
+        self.expressions = expressions or {}
+        self.columns = [self.expressions.get(field, getattr(model, field)) for field in self.fields]
+        self.date_fields = tuple(field for field in self.fields if field in date_fields)
+        self._subsets = {}
+
+    def __len__(self):
+        return len(self.fields)
+
+    def subset(self, fields):
+        """Schéma restreint aux champs demandés (dans l'ordre du schéma complet)"""
+        key = frozenset(fields)
+        if key not in self._subsets:
+            schema = RowSchema.__new__(RowSchema)
+            schema.fields = tuple(field for field in self.fields if field in key)
+            schema.columns = [column for field, column in zip(self.fields, self.columns) if field in key]
+            schema.date_fields = tuple(field for field in self.date_fields if field in key)
+            schema.expressions = self.expressions
+            schema._subsets = {}
+            self._subsets[key] = schema
+        return self._subsets[key]
+
+    def to_dict(self, values):
+        data = dict(zip(self.fields, values))
+        for field in self.date_fields:
+            value = data[field]
+            if value is not None:
+                data[field] = value.isoformat() if isinstance(value, date) else str(value)
+        return data
+
+
+LIVRE_SCHEMA = RowSchema(Livre, [
+    'id_livre', 'titre', 'auteur', 'categorie', 'annee_publication', 'nombre_exemplaires', 'disponibles'
+])
+MEMBRE_SCHEMA = RowSchema(Membre, [
+    'id_membre', 'nom', 'prenom', 'email', 'telephone', 'date_inscription', 'statut', 'id_utilisateur'
+], date_fields={'date_inscription'})
+EMPRUNT_SCHEMA = RowSchema(Emprunt, [
+    'id_emprunt', 'id_livre', 'id_membre', 'id_exemplaire', 'date_emprunt', 'date_retour_prevue',
+    'date_retour_reelle', 'statut'
+], date_fields={'date_emprunt', 'date_retour_prevue', 'date_retour_reelle'})
+AMENDE_SCHEMA = RowSchema(Amende, [
+    'id_amende', 'id_emprunt', 'montant', 'statut', 'date_creation'
+], date_fields={'date_creation'}, expressions={'montant': Amende.montant_du})
+EXEMPLAIRE_SCHEMA = RowSchema(Exemplaire, [
+    'id_exemplaire', 'id_livre', 'code_barres', 'statut', 'date_ajout'
+], date_fields={'date_ajout'})
+RESERVATION_SCHEMA = RowSchema(Reservation, [
+    'id_reservation', 'id_livre', 'id_membre', 'date_reservation', 'statut', 'date_expiration', 'id_exemplaire'
+], date_fields={'date_reservation', 'date_expiration'})
+
+
+class Resource:
+    """Ressource sérialisable : schéma, jointure depuis la ressource parente et ressources imbriquables"""
+
+    def __init__(self, model, schema, onclause=None, outer=False, embeds=None):
+        self.model = model
+        self.schema = schema
+        self.onclause = onclause
+        self.outer = outer
+        self.embeds = embeds or {}
+
+
+def _emprunt_embeds():
+    return {
+        'livre': Resource(Livre, LIVRE_SCHEMA, onclause=Emprunt.id_livre == Livre.id_livre),
+        # Jointure externe : le membre vaut None si la ligne n'existe plus (comme to_dict)
+        'membre': Resource(Membre, MEMBRE_SCHEMA, onclause=Emprunt.id_membre == Membre.id_membre, outer=True)
+    }
+
+
+LIVRE_RESOURCE = Resource(Livre, LIVRE_SCHEMA)
+MEMBRE_RESOURCE = Resource(Membre, MEMBRE_SCHEMA)
+EMPRUNT_RESOURCE = Resource(Emprunt, EMPRUNT_SCHEMA, embeds=_emprunt_embeds())
+AMENDE_RESOURCE = Resource(Amende, AMENDE_SCHEMA, embeds={
+    'emprunt': Resource(Emprunt, EMPRUNT_SCHEMA, onclause=Amende.id_emprunt == Emprunt.id_emprunt,
+                        embeds=_emprunt_embeds())
+})
+RESERVATION_RESOURCE = Resource(Reservation, RESERVATION_SCHEMA, embeds={
+    'livre': Resource(Livre, LIVRE_SCHEMA, onclause=Reservation.id_livre == Livre.id_livre),
+    'membre': Resource(Membre, MEMBRE_SCHEMA, onclause=Reservation.id_membre == Membre.id_membre, outer=True)
+})
+
+
+def _split_param(value):
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+class Selection:
+    """
+    Colonnes et jointures à charger pour une ressource selon `?fields=` et `?embed=`
+
+    - sans paramètre : tous les champs et toutes les ressources imbriquées (format historique)
+    - `fields=id_emprunt,statut,livre.titre` : champs de la racine et des ressources imbriquées
+      (un champ pointé embarque implicitement sa ressource)
+    - `embed=livre,membre` (ou `emprunt.livre` pour les amendes) : ressources imbriquées
+      embarquées ; avec `fields` seul, aucune ressource n'est embarquée hors champs pointés
+
+    Lève ValueError pour un champ ou une ressource inconnus.
+    """
+
+    def __init__(self, root, fields=None, embed=None):
+        self.root = root
+        requested = {}
+        for item in _split_param(fields):
+            *path, field = item.split('.')
+            requested.setdefault(tuple(path), set()).add(field)
+
+        if fields is None and embed is None:
+            embedded = self._all_paths(root)
+        else:
+            embedded = {tuple(item.split('.')) for item in _split_param(embed)}
+            embedded |= {path for path in requested if path}
+            # Les ancêtres d'une ressource embarquée sont embarqués aussi
+            embedded |= {path[:i] for path in list(embedded) for i in range(1, len(path))}
+
+        # (chemin, ressource, schéma restreint) dans l'ordre des colonnes sélectionnées
+        self.nodes = []
+        for path in sorted({()} | embedded, key=lambda p: (len(p), p)):
+            resource = self._resolve(path)
+            schema = resource.schema
+            if path in requested:
+                unknown = requested[path] - set(schema.fields)
+                if unknown:
+                    raise ValueError(f"Champ(s) inconnu(s) : {', '.join(sorted('.'.join(path + (f,)) for f in unknown))}")
+                schema = schema.subset(requested[path])
+            self.nodes.append((path, resource, schema))
+        self.paths = {path for path, _, _ in self.nodes}
+
+    def _all_paths(self, resource, prefix=()):
+        paths = set()
+        for name, child in resource.embeds.items():
+            paths.add(prefix + (name,))
+            paths |= self._all_paths(child, prefix + (name,))
+        return paths
+
+    def _resolve(self, path):
+        resource = self.root
+        for name in path:
+            if name not in resource.embeds:
+                raise ValueError(f"Ressource imbriquée inconnue : {'.'.join(path)}")
+            resource = resource.embeds[name]
+        return resource
+
+    def columns(self):
+        columns = []
+        for index, (_, resource, schema) in enumerate(self.nodes):
+            if resource.outer:
+                # Clé primaire en tête pour détecter une jointure externe vide
+                columns.append(resource.schema.columns[0].label(f'_present_{index}'))
+            columns.extend(schema.columns)
+        return columns
+
+    def join(self, query, required=()):
+        """Ajoute les jointures des ressources embarquées et de celles requises pour filtrer"""
+        needed = self.paths | set(required)
+        for path in sorted(needed - {()}, key=lambda p: (len(p), p)):
+            resource = self._resolve(path)
+            if resource.outer:
+                query = query.outerjoin(resource.model, resource.onclause)
+            else:
+                query = query.join(resource.model, resource.onclause)
+        return query
+
+    def serialize(self, row):
+        position = 0
+        root = None
+        objects = {}
+        for path, resource, schema in self.nodes:
+            if resource.outer:
+                present = row[position] is not None
+                position += 1
+            else:
+                present = True
+            values = row[position:position + len(schema)]
+            position += len(schema)
+
+            obj = schema.to_dict(values) if present else None
+            if not path:
+                root = obj
+            elif objects.get(path[:-1]) is not None:
+                objects[path[:-1]][path[-1]] = obj
+            objects[path] = obj
+        return root
+
+
+# ============ REQUÊTES DE LISTE ============
+
+def list_livres(id_utilisateur, search='', fields=None):
+    selection = Selection(LIVRE_RESOURCE, fields)
+    query = select(*selection.columns()).where(Livre.id_utilisateur == id_utilisateur)
+    if search:
+        query = query.where(Livre.titre.contains(search) | Livre.auteur.contains(search))
+    return [selection.serialize(row) for row in db.session.execute(query)]
+
+
+def list_membres(id_utilisateur, fields=None):
+    selection = Selection(MEMBRE_RESOURCE, fields)
+    query = select(*selection.columns()).where(Membre.id_utilisateur == id_utilisateur)
+    return [selection.serialize(row) for row in db.session.execute(query)]
+
+
+def list_emprunts(id_utilisateur, fields=None, embed=None):
+    selection = Selection(EMPRUNT_RESOURCE, fields, embed)
+    query = selection.join(select(*selection.columns()), required=[('livre',)])
+    query = query.where(Livre.id_utilisateur == id_utilisateur)
+    return [selection.serialize(row) for row in db.session.execute(query)]
+
+
+def list_amendes(id_utilisateur, fields=None, embed=None):
+    selection = Selection(AMENDE_RESOURCE, fields, embed)
+    query = selection.join(select(*selection.columns()), required=[('emprunt',), ('emprunt', 'livre')])
+    query = query.where(Livre.id_utilisateur == id_utilisateur)
+    return [selection.serialize(row) for row in db.session.execute(query)]
+
+
+def list_reservations(id_utilisateur, fields=None, embed=None, id_livre=None, id_membre=None, statuts=None):
+    """Réservations dans l'ordre de la file (id_reservation croissant), filtrables par livre, membre et statut"""
+    selection = Selection(RESERVATION_RESOURCE, fields, embed)
+    query = selection.join(select(*selection.columns()), required=[('livre',)])
+    query = query.where(Livre.id_utilisateur == id_utilisateur)
+    if id_livre is not None:
+        query = query.where(Reservation.id_livre == id_livre)
+    if id_membre is not None:
+        query = query.where(Reservation.id_membre == id_membre)
+    if statuts:
+        query = query.where(Reservation.statut.in_(statuts))
+    query = query.order_by(Reservation.id_reservation)
+    return [selection.serialize(row) for row in db.session.execute(query)]
@@ -0,0 +1,140 @@
+import json
+import logging
+import re
+import time
+from collections import Counter
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from models import db
+
+logger = logging.getLogger(__name__)
+
+# Normalisation des requêtes : littéraux et listes IN remplacés pour comparer les "formes"
+_WHITESPACE_RE = re.compile(r'\s+')
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r'\bIN\s*\((?:[^()]*)\)', re.IGNORECASE)
+
+
+def normaliser_requete(statement):
+    """Retourne la "forme" d'une requête SQL (sans littéraux ni valeurs de liste IN)"""
+    shape = _WHITESPACE_RE.sub(' ', statement).strip()
+    shape = _IN_LIST_RE.sub('IN (?)', shape)
+    return _LITERAL_RE.sub('?', shape)
+
+
+class SQLInstrumentation:
+    """Mesure les requêtes SQL émises pendant chaque requête HTTP"""
+
+    def __init__(self, app=None):
+        self.slow_query_ms = 200
+        self.n_plus_one_threshold = 5
+        self.top_slowest = 5
+        self.expose_header = False
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.slow_query_ms = app.config.get('SQL_SLOW_QUERY_MS', 200)
+        self.n_plus_one_threshold = app.config.get('SQL_N_PLUS_ONE_THRESHOLD', 5)
+        self.top_slowest = app.config.get('SQL_TOP_SLOWEST', 5)
+        self.expose_header = app.debug or app.config.get('SQL_STATS_HEADER', False)
+
+        with app.app_context():
+            engine = db.engine
+
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    # ---------- Événements SQLAlchemy ----------
+
+    # Début de l'exécution porté par le contexte de l'instruction : une requête en
+    # erreur (pas d'after_cursor_execute) ne laisse rien sur la connexion
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_start_time = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_query_start_time', None)
+        if start is None:
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        if elapsed_ms >= self.slow_query_ms:
+            logger.warning("Requête SQL lente", extra={
+                'duree_ms': round(elapsed_ms, 2),
+                'route': request.path if has_request_context() else None,
+                'sql': _WHITESPACE_RE.sub(' ', statement)[:500]
+            })
+
+        if not has_request_context():
+            return
+        stats = g.get('sql_stats')
+        if stats is None:
+            return
+
+        stats['count'] += 1
+        stats['total_ms'] += elapsed_ms
+        stats['shapes'][normaliser_requete(statement)] += 1
+
+        slowest = stats['slowest']
+        if len(slowest) < self.top_slowest or elapsed_ms > slowest[-1][0]:
+            slowest.append((elapsed_ms, statement))
+            slowest.sort(key=lambda item: item[0], reverse=True)
+            del slowest[self.top_slowest:]
+
+    # ---------- Cycle de vie de la requête HTTP ----------
+
+    def _start_request(self):
+        g.sql_stats = {
+            'count': 0,
+            'total_ms': 0.0,
+            'slowest': [],
+            'shapes': Counter()
+        }
+
+    def _finish_request(self, response):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return response
+
+        suspects = self.detect_n_plus_one(stats)
+        for shape, count in suspects:
+            logger.warning("N+1 probable", extra={
+                'route': f"{request.method} {request.path}",
+                'repetitions': count,
+                'sql': shape[:300]
+            })
+
+        if self.expose_header:
+            response.headers['X-SQL-Count'] = str(stats['count'])
+            response.headers['X-SQL-Time-Ms'] = f"{stats['total_ms']:.2f}"
+            response.headers['X-SQL-Slowest'] = json.dumps([
+                {'ms': round(ms, 2), 'sql': _WHITESPACE_RE.sub(' ', statement)[:200]}
+                for ms, statement in stats['slowest']
+            ])
+            if suspects:
+                response.headers['X-SQL-N-Plus-One'] = str(len(suspects))
+
+        return response
+
+    def detect_n_plus_one(self, stats):
+        """Formes de requêtes répétées au moins `n_plus_one_threshold` fois dans la même requête"""
+        return [
+            (shape, count)
+            for shape, count in stats['shapes'].most_common()
+            if count >= self.n_plus_one_threshold
+        ]
+
+
+# Instance globale
+sql_instrumentation = None
+
+def init_sql_instrumentation(app):
+    """Active l'instrumentation SQL pour l'application Flask"""
+    global sql_instrumentation
+    sql_instrumentation = SQLInstrumentation(app)
+    return sql_instrumentation
@@ -0,0 +1,187 @@
+"""
+Synchronisation incrémentale (/api/sync)
+
+Chaque ligne suivie porte `version` (numéro de séquence de la transaction qui
+l'a modifiée en dernier, voir versioning.next_sequence) et `updated_at`. Un hook before_flush
+les renseigne pour toute écriture passant par la session ORM et enregistre
+une `Suppression` pour chaque ligne supprimée. Le client conserve le curseur
+renvoyé et ne demande ensuite que les lignes dont la version le dépasse.
+
+Les écritures en SQL direct (UPDATE conditionnels ou ensemblistes, imports
+en masse) doivent renseigner elles-mêmes ces colonnes avec `stamp()`.
+"""
+from datetime import datetime
+from sqlalchemy import event, select
+from models import db, Livre, Membre, Exemplaire, Emprunt, Amende, Reservation, Suppression
+from serializers import (
+    RowSchema, LIVRE_SCHEMA, MEMBRE_SCHEMA, EXEMPLAIRE_SCHEMA, EMPRUNT_SCHEMA, AMENDE_SCHEMA, RESERVATION_SCHEMA
+)
+from versioning import next_sequence, sequence_validee
+
+SYNC_FIELDS = ('version', 'updated_at')
+
+COLLECTIONS = {
+    Livre: 'livres',
+    Membre: 'membres',
+    Exemplaire: 'exemplaires',
+    Emprunt: 'emprunts',
+    Amende: 'amendes',
+    Reservation: 'reservations'
+}
+
+MODELS = {collection: model for model, collection in COLLECTIONS.items()}
+
+# Jointures menant à la bibliothèque propriétaire (livres, membres et exemplaires la portent directement)
+TENANT_JOINS = {
+    'emprunts': [(Livre, Emprunt.id_livre == Livre.id_livre)],
+    'amendes': [(Emprunt, Amende.id_emprunt == Emprunt.id_emprunt), (Livre, Emprunt.id_livre == Livre.id_livre)],
+    'reservations': [(Livre, Reservation.id_livre == Livre.id_livre)]
+}
+
+SCHEMAS = {
+    'livres': RowSchema(Livre, LIVRE_SCHEMA.fields + SYNC_FIELDS, date_fields={'updated_at'}),
+    'membres': RowSchema(Membre, MEMBRE_SCHEMA.fields + SYNC_FIELDS, date_fields={'date_inscription', 'updated_at'}),
+    'exemplaires': RowSchema(Exemplaire, EXEMPLAIRE_SCHEMA.fields + SYNC_FIELDS, date_fields={'date_ajout', 'updated_at'}),
+    'emprunts': RowSchema(Emprunt, EMPRUNT_SCHEMA.fields + SYNC_FIELDS, date_fields={
+        'date_emprunt', 'date_retour_prevue', 'date_retour_reelle', 'updated_at'
+    }),
+    # Montant du jour, et de quoi le faire croître hors ligne tant que l'amende est ouverte
+    'amendes': RowSchema(Amende, AMENDE_SCHEMA.fields + ('date_calcul', 'taux_journalier', 'plafond') + SYNC_FIELDS,
+                         date_fields={'date_creation', 'date_calcul', 'updated_at'},
+                         expressions=AMENDE_SCHEMA.expressions),
+    'reservations': RowSchema(Reservation, RESERVATION_SCHEMA.fields + SYNC_FIELDS, date_fields={
+        'date_reservation', 'date_expiration', 'updated_at'
+    })
+}
+
+
+# ============ SUIVI DES ÉCRITURES ============
+
+def _tenant_of(session, obj, cache):
+    """
+    Bibliothèque propriétaire d'une ligne (via le livre pour les emprunts, amendes et réservations)
+
+    `cache` mémorise la bibliothèque de chaque livre et emprunt parent le temps
+    d'un flush : un lot de N emprunts du même livre ne relit ce livre qu'une fois.
+    """
+    if isinstance(obj, (Livre, Membre, Exemplaire)):
+        return obj.id_utilisateur
+    if isinstance(obj, Amende):
+        parent, model, key = obj.emprunt, Emprunt, ('emprunt', obj.id_emprunt)
+    else:
+        parent, model, key = obj.livre, Livre, ('livre', obj.id_livre)
+
+    if key[1] is None or key not in cache:
+        parent = parent or (session.get(model, key[1]) if key[1] is not None else None)
+        tenant = _tenant_of(session, parent, cache) if parent is not None else None
+        if key[1] is None:
+            return tenant
+        cache[key] = tenant
+    return cache[key]
+
+
+def transaction_version(id_utilisateur, session=None):
+    """
+    Numéro de séquence de la transaction en cours pour une bibliothèque
+
+    Réservé au premier appel puis partagé par toutes les écritures de la
+    transaction (flushs ORM comme UPDATE/INSERT en SQL direct).
+    """
+    session = session or db.session
+    versions = session.info.setdefault('sync_versions', {})
+    if id_utilisateur not in versions:
+        versions[id_utilisateur] = next_sequence(id_utilisateur)
+    return versions[id_utilisateur]
+
+
+def stamp(id_utilisateur):
+    """Valeurs `version` et `updated_at` à inclure dans une écriture en SQL direct"""
+    return {'version': transaction_version(id_utilisateur), 'updated_at': datetime.utcnow()}
+
+
+def _primary_key(obj):
+    return getattr(obj, obj.__mapper__.primary_key[0].key)
+
+
+def _before_flush(session, flush_context, instances):
+    changed = [(obj, False) for obj in list(session.new) + list(session.dirty)
+               if type(obj) in COLLECTIONS and (obj in session.new or session.is_modified(obj))]
+    changed += [(obj, True) for obj in session.deleted if type(obj) in COLLECTIONS]
+    if not changed:
+        return
+
+    now = datetime.utcnow()
+    tenants = {}
+    with session.no_autoflush:
+        for obj, deleted in changed:
+            id_utilisateur = _tenant_of(session, obj, tenants)
+            if id_utilisateur is None:
+                continue
+            version = transaction_version(id_utilisateur, session)
+            if deleted:
+                session.add(Suppression(
+                    id_utilisateur=id_utilisateur,
+                    collection=COLLECTIONS[type(obj)],
+                    id_objet=_primary_key(obj),
+                    version=version,
+                    date_suppression=now
+                ))
+            else:
+                obj.version = version
+                obj.updated_at = now
+
+
+def _after_transaction_end(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('sync_versions', None)
+
+
+def init_sync(app):
+    """Active le suivi des versions sur la session de l'application"""
+    event.listen(db.session, 'before_flush', _before_flush)
+    event.listen(db.session, 'after_transaction_end', _after_transaction_end)
+
+
+# ============ LECTURE DES CHANGEMENTS ============
+
+def _changes_query(collection, id_utilisateur):
+    model = MODELS[collection]
+    query = select(*SCHEMAS[collection].columns)
+    for target, onclause in TENANT_JOINS.get(collection, ()):
+        query = query.join(target, onclause)
+    tenant = Livre.id_utilisateur if collection in TENANT_JOINS else model.id_utilisateur
+    return query.where(tenant == id_utilisateur), model
+
+
+def changes_since(id_utilisateur, since=None):
+    """
+    Lignes créées, modifiées ou supprimées depuis le curseur `since`
+
+    Sans curseur (ou avec un curseur inconnu de cette base), renvoie l'état
+    complet avec `full: true` : le client remplace alors son cache local.
+    """
+    # Le curseur est lu avant les lignes : une écriture validée entre-temps sera vue au prochain appel
+    cursor = sequence_validee(id_utilisateur)
+    full = since is None or since > cursor
+
+    changes = {}
+    for collection, schema in SCHEMAS.items():
+        query, model = _changes_query(collection, id_utilisateur)
+        query = query.where(model.version <= cursor)
+        if not full:
+            query = query.where(model.version > since)
+        changes[collection] = [schema.to_dict(row) for row in db.session.execute(query)]
+
+    deleted = {collection: [] for collection in SCHEMAS}
+    if not full:
+        rows = db.session.execute(
+            select(Suppression.collection, Suppression.id_objet).where(
+                Suppression.id_utilisateur == id_utilisateur,
+                Suppression.version > since,
+                Suppression.version <= cursor
+            )
+        )
+        for collection, id_objet in rows:
+            deleted[collection].append(id_objet)
+
+    return {'cursor': str(cursor), 'full': full, 'changes': changes, 'deleted': deleted}
@@ -0,0 +1,108 @@
+"""
+Fixtures des tests : application sur une base SQLite temporaire
+
+app.py configure l'application à l'import : les variables d'environnement
+sont donc fixées avant, et les services planifiés (retards, imports,
+statistiques) sont désactivés. Les tables sont vidées après chaque test.
+"""
+import os
+import shutil
+import tempfile
+
+import pytest
+
+DOSSIER = tempfile.mkdtemp(prefix='bibliotech-tests-')
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(DOSSIER, 'tests.db')}",
+    'UPLOAD_FOLDER': os.path.join(DOSSIER, 'uploads'),
+    'PROMETHEUS_MULTIPROC_DIR': '',
+    'OVERDUE_ENABLED': 'false',
+    'IMPORT_WORKER_ENABLED': 'false',
+    'ANALYTICS_ENABLED': 'false',
+    'CACHE_TYPE': 'null',
+    'LOG_LEVEL': 'WARNING',
+})
+os.environ.pop('PROMETHEUS_MULTIPROC_DIR')
+
+import app as application  # noqa: E402
+from models import db, Utilisateur  # noqa: E402
+
+MOT_DE_PASSE = 'secret1'
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(DOSSIER, ignore_errors=True)
+
+
+@pytest.fixture
+def app():
+    yield application.app
+    with application.app.app_context():
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+
+
+class Client:
+    """Client de test connecté (HTTPS : cookies de session sécurisés)"""
+
+    def __init__(self, app, email):
+        with app.app_context():
+            utilisateur = Utilisateur(nom='Test', prenom='Test', email=email, role='utilisateur', email_verified=True)
+            utilisateur.set_password(MOT_DE_PASSE)
+            db.session.add(utilisateur)
+            db.session.commit()
+            self.id_utilisateur = utilisateur.id_utilisateur
+        self.client = app.test_client()
+        reponse = self.post('/api/auth/login', json={'email': email, 'mot_de_passe': MOT_DE_PASSE})
+        assert reponse.status_code == 200, reponse.json
+
+    def get(self, url, **kwargs):
+        return self.client.get(url, base_url='https://localhost', **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.client.post(url, base_url='https://localhost', **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.client.put(url, base_url='https://localhost', **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.client.delete(url, base_url='https://localhost', **kwargs)
+
+
+@pytest.fixture
+def client(app):
+    return Client(app, 'bibliothecaire@test.fr')
+
+
+@pytest.fixture
+def autre_client(app):
+    return Client(app, 'autre@test.fr')
+
+
+@pytest.fixture
+def livre(client):
+    """Fabrique de livres de la bibliothèque du client"""
+    def creer(titre='Titre', nombre_exemplaires=1, **donnees):
+        reponse = client.post('/api/livres', json={
+            'titre': titre, 'auteur': 'Auteur', 'nombre_exemplaires': nombre_exemplaires, **donnees
+        })
+        assert reponse.status_code == 201, reponse.json
+        return reponse.json
+    return creer
+
+
+@pytest.fixture
+def membre(client):
+    """Fabrique de membres de la bibliothèque du client"""
+    compteur = iter(range(1, 10_000))
+
+    def creer(**donnees):
+        numero = next(compteur)
+        reponse = client.post('/api/membres', json={
+            'nom': f'Nom{numero}', 'prenom': 'Prenom', 'email': f'membre{numero}@test.fr', **donnees
+        })
+        assert reponse.status_code == 201, reponse.json
+        return reponse.json
+    return creer
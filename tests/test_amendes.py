@@ -0,0 +1,80 @@
+"""Amendes de retard : montant calculé à la lecture, plafond, paiement et retour"""
+from datetime import datetime, timedelta
+from circulation import AMENDE_PLAFOND
+from models import db, Amende, Emprunt
+from overdue_service import OverdueService
+
+
+def emprunt_en_retard(app, client, livre, membre, jours):
+    """Emprunt échu depuis `jours` jours, passé en retard par le job ; retourne (emprunt, id_amende)"""
+    id_membre = membre()['id_membre']
+    emprunt = client.post('/api/emprunts', json={'id_livre': livre()['id_livre'], 'id_membre': id_membre}).json
+    aujourd_hui = datetime.utcnow().date()
+    with app.app_context():
+        db.session.get(Emprunt, emprunt['id_emprunt']).date_retour_prevue = aujourd_hui - timedelta(days=jours)
+        db.session.commit()
+    OverdueService(app).run(aujourd_hui)
+    with app.app_context():
+        return emprunt, db.session.query(Amende.id_amende).filter_by(id_emprunt=emprunt['id_emprunt']).scalar()
+
+
+def reculer_calcul(app, id_amende, jours):
+    """Simule `jours` jours écoulés depuis l'ouverture de l'amende"""
+    with app.app_context():
+        amende = db.session.get(Amende, id_amende)
+        amende.date_calcul -= timedelta(days=jours)
+        db.session.get(Emprunt, amende.id_emprunt).date_retour_prevue -= timedelta(days=jours)
+        db.session.commit()
+
+
+def montant(client, id_amende):
+    return next(a['montant'] for a in client.get('/api/amendes').json if a['id_amende'] == id_amende)
+
+
+def test_montant_croit_chaque_jour_sans_reecriture(app, client, livre, membre):
+    emprunt, id_amende = emprunt_en_retard(app, client, livre, membre, 10)
+    assert montant(client, id_amende) == 5.0
+    etag = client.get('/api/amendes').headers['ETag']
+
+    reculer_calcul(app, id_amende, 4)
+    OverdueService(app).run()
+
+    assert client.get('/api/amendes', headers={'If-None-Match': etag}).status_code == 200
+    assert montant(client, id_amende) == 7.0
+    historique = client.get(f"/api/membres/{emprunt['id_membre']}/emprunts").json
+    assert historique['amendes_dues'] == 7.0
+    with app.app_context():
+        assert db.session.get(Amende, id_amende).montant == 5.0
+
+
+def test_montant_plafonne(app, client, livre, membre):
+    _, id_amende = emprunt_en_retard(app, client, livre, membre, 10)
+
+    reculer_calcul(app, id_amende, 100)
+
+    assert montant(client, id_amende) == AMENDE_PLAFOND
+
+
+def test_paiement_arrete_le_montant(app, client, livre, membre):
+    _, id_amende = emprunt_en_retard(app, client, livre, membre, 10)
+    reculer_calcul(app, id_amende, 4)
+
+    reponse = client.post(f'/api/amendes/{id_amende}/payer')
+
+    assert reponse.status_code == 200
+    assert reponse.json['montant'] == 7.0
+    with app.app_context():
+        amende = db.session.get(Amende, id_amende)
+        assert (amende.montant, amende.date_calcul, amende.statut) == (7.0, None, 'payee')
+
+
+def test_retour_solde_le_montant_du_jour(app, client, livre, membre):
+    emprunt, id_amende = emprunt_en_retard(app, client, livre, membre, 10)
+    reculer_calcul(app, id_amende, 4)
+
+    reponse = client.post(f"/api/emprunts/{emprunt['id_emprunt']}/retour")
+
+    assert reponse.status_code == 200
+    with app.app_context():
+        amende = db.session.get(Amende, id_amende)
+        assert (amende.montant, amende.date_calcul) == (7.0, None)
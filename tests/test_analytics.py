@@ -0,0 +1,76 @@
+"""Statistiques de circulation : agrégats quotidiens, jours non agrégés comptés en direct, classements"""
+from datetime import date, datetime, timedelta
+from analytics import AnalyticsService
+from models import db, Emprunt, StatistiqueJour
+
+
+def emprunter(app, client, id_livre, id_membre, jour, rendu=False):
+    """Emprunt daté de `jour`, rendu le même jour si `rendu`"""
+    emprunt = client.post('/api/emprunts', json={'id_livre': id_livre, 'id_membre': id_membre}).json
+    if rendu:
+        client.post(f"/api/emprunts/{emprunt['id_emprunt']}/retour")
+    with app.app_context():
+        ligne = db.session.get(Emprunt, emprunt['id_emprunt'])
+        ligne.date_emprunt = jour
+        if rendu:
+            ligne.date_retour_reelle = jour
+        db.session.commit()
+
+
+def serie(client, depuis, jusqu_au, periode='jour'):
+    reponse = client.get('/api/analytics/circulation',
+                         query_string={'depuis': depuis.isoformat(), 'jusqu_au': jusqu_au.isoformat(), 'periode': periode})
+    assert reponse.status_code == 200, reponse.json
+    return reponse.json
+
+
+def test_agregats_identiques_au_calcul_direct(app, client, livre, membre):
+    aujourd_hui = datetime.utcnow().date()
+    avant_hier, hier = aujourd_hui - timedelta(days=2), aujourd_hui - timedelta(days=1)
+    roman, essai = livre(titre='Roman', categorie='Roman')['id_livre'], livre(titre='Essai', nombre_exemplaires=3)['id_livre']
+    alice, bob = membre(nom='Alice')['id_membre'], membre(nom='Bob')['id_membre']
+    emprunter(app, client, essai, alice, avant_hier, rendu=True)
+    emprunter(app, client, essai, bob, hier, rendu=True)
+    emprunter(app, client, essai, alice, hier)
+    emprunter(app, client, roman, bob, aujourd_hui)
+    directe = serie(client, avant_hier, aujourd_hui)
+
+    assert AnalyticsService(app).run(aujourd_hui) == 2
+    assert AnalyticsService(app).run(aujourd_hui) == 1  # Dernier jour agrégé recalculé, sans doublon
+
+    with app.app_context():
+        assert db.session.query(StatistiqueJour.jour).order_by(StatistiqueJour.jour).all() == [(avant_hier,), (hier,)]
+    agregee = serie(client, avant_hier, aujourd_hui)
+    assert agregee == directe
+    assert [(j['emprunts'], j['retours']) for j in agregee['serie']] == [(1, 1), (2, 1), (1, 0)]
+    assert agregee['totaux']['emprunts'] == 4
+
+    livres = client.get('/api/analytics/livres', query_string={'depuis': avant_hier.isoformat()}).json['livres']
+    categories = client.get('/api/analytics/categories', query_string={'depuis': avant_hier.isoformat()}).json
+    membres = client.get('/api/analytics/membres', query_string={'depuis': avant_hier.isoformat(), 'limite': 1}).json
+    assert [(l['titre'], l['emprunts']) for l in livres] == [('Essai', 3), ('Roman', 1)]
+    assert categories['categories'] == [{'categorie': None, 'emprunts': 3}, {'categorie': 'Roman', 'emprunts': 1}]
+    assert [(m['nom'], m['emprunts']) for m in membres['membres']] == [('Alice', 2)]
+
+
+def test_regroupement_par_mois(app, client, livre, membre):
+    id_livre, id_membre = livre(nombre_exemplaires=2)['id_livre'], membre()['id_membre']
+    emprunter(app, client, id_livre, id_membre, date(2024, 1, 31), rendu=True)
+    emprunter(app, client, id_livre, id_membre, date(2024, 2, 1))
+
+    resultat = serie(client, date(2024, 1, 15), date(2024, 3, 1), periode='mois')
+
+    assert [(m['periode'], m['emprunts']) for m in resultat['serie']] == [
+        ('2024-01-01', 1), ('2024-02-01', 1), ('2024-03-01', 0)
+    ]
+
+
+def test_parametres_invalides(client):
+    for url, parametres, erreur in [
+        ('/api/analytics/circulation', {'periode': 'annee'}, 'Période inconnue (jour, semaine, mois)'),
+        ('/api/analytics/circulation', {'depuis': '2024-02-01', 'jusqu_au': '2024-01-01'}, 'depuis doit précéder jusqu_au'),
+        ('/api/analytics/livres', {'limite': 500}, 'limite doit être comprise entre 1 et 100')
+    ]:
+        reponse = client.get(url, query_string=parametres)
+        assert (reponse.status_code, reponse.json['error']) == (400, erreur)
+    assert client.get('/api/analytics/auteurs').status_code == 404
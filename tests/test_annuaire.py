@@ -0,0 +1,70 @@
+"""Annuaire des membres : recherche par préfixe sans accents, filtres, tri et pagination par curseur"""
+
+
+def page(client, **parametres):
+    reponse = client.get('/api/membres', query_string=parametres)
+    assert reponse.status_code == 200, reponse.json
+    return reponse.json
+
+
+def test_recherche_par_prefixes(client, membre):
+    helene = membre(nom='Dupré', prenom='Hélène', email='h.dupre@test.fr', telephone='+226 70 11 22 33')
+    membre(nom='Dupont', prenom='Jean', email='jean@test.fr')
+    membre(nom='Martin', prenom='Hélène', email='martin@test.fr')
+
+    def ids(q):
+        return [m['id_membre'] for m in page(client, q=q)['membres']]
+
+    assert ids('hel dup') == [helene['id_membre']]
+    assert ids('DUPRE') == [helene['id_membre']]
+    assert ids('+226 70 11') == [helene['id_membre']]
+    assert ids('upre') == []
+    assert len(ids('dup')) == 2
+
+
+def test_pagination_par_curseur_sans_doublon(client, membre):
+    for nom in ['Bernard', 'Arnaud', 'Durand', 'Claude', 'Arnaud']:
+        membre(nom=nom)
+
+    noms, curseur = [], None
+    while True:
+        resultat = page(client, tri='-nom', limite=2, fields='nom', **({'curseur': curseur} if curseur else {}))
+        noms += [m['nom'] for m in resultat['membres']]
+        curseur = resultat['curseur_suivant']
+        if curseur is None:
+            break
+
+    assert noms == ['Durand', 'Claude', 'Bernard', 'Arnaud', 'Arnaud']
+
+
+def test_filtre_par_statut(client, membre):
+    actif = membre()
+    suspendu = membre()
+    client.put(f"/api/membres/{suspendu['id_membre']}", json={'statut': 'suspendu'})
+
+    assert [m['id_membre'] for m in page(client, statut='suspendu')['membres']] == [suspendu['id_membre']]
+    assert {m['id_membre'] for m in page(client, statut='actif,suspendu')['membres']} == {
+        actif['id_membre'], suspendu['id_membre']
+    }
+
+
+def test_parametres_invalides(client, membre):
+    membre()
+    membre()
+    curseur = page(client, tri='nom', limite=1)['curseur_suivant']
+
+    for parametres, erreur in [
+        ({'tri': 'age'}, 'Tri inconnu'),
+        ({'limite': 500}, 'limite doit être comprise entre 1 et 200'),
+        ({'curseur': 'xyz'}, 'Curseur invalide'),
+        ({'tri': 'email', 'curseur': curseur}, 'Curseur invalide pour ce tri')
+    ]:
+        reponse = client.get('/api/membres', query_string=parametres)
+        assert reponse.status_code == 400
+        assert reponse.json['error'].startswith(erreur)
+
+
+def test_sans_parametre_liste_complete(client, membre):
+    membre()
+
+    assert isinstance(client.get('/api/membres').json, list)
@@ -0,0 +1,18 @@
+"""Réinitialisation du mot de passe : le code n'apparaît pas dans les journaux"""
+import logging
+import app as module_app
+from models import Utilisateur
+
+
+def test_echec_d_envoi_ne_journalise_pas_le_code(monkeypatch, app, client, caplog):
+    monkeypatch.setattr(module_app, 'send_reset_code_email', lambda *args: False)
+    caplog.set_level(logging.DEBUG)
+
+    reponse = client.post('/api/auth/forgot-password', json={'email': 'bibliothecaire@test.fr'})
+
+    assert reponse.status_code == 500
+    assert reponse.json['dev_code'] is None
+    with app.app_context():
+        code = Utilisateur.query.filter_by(email='bibliothecaire@test.fr').one().reset_code
+    assert "Erreur d'envoi du code de réinitialisation" in caplog.messages
+    assert all(getattr(r, 'code', None) != code and code not in r.getMessage() for r in caplog.records)
@@ -0,0 +1,43 @@
+"""Requêtes groupées : sous-requêtes GET exécutées pour l'utilisateur connecté, validation du corps"""
+
+
+def test_sous_requetes_executees(client, livre):
+    id_livre = livre(titre='Candide')['id_livre']
+    etag = client.get('/api/livres').headers['ETag']
+
+    reponse = client.post('/api/batch', json={'requests': [
+        {'id': 'livres', 'path': '/api/livres?fields=titre'},
+        {'id': 'revalidation', 'path': '/api/livres', 'headers': {'If-None-Match': etag, 'Cookie': 'ignore'}},
+        {'path': f'/api/livres/{id_livre + 1}/emprunts'},
+        {'path': '/api/inexistant'}
+    ]})
+
+    assert reponse.status_code == 200
+    livres, revalidation, introuvable, inexistant = reponse.json['responses']
+    assert (livres['id'], livres['status'], livres['body']) == ('livres', 200, [{'titre': 'Candide'}])
+    assert 'ETag' in livres['headers']
+    assert (revalidation['status'], revalidation['body']) == (304, None)
+    assert (introuvable['id'], introuvable['status'], introuvable['body']) == (2, 404, {'error': 'Livre non trouvé'})
+    assert inexistant['status'] == 404
+
+
+def test_corps_invalide_refuse(client):
+    cas = [
+        ({}, "Le corps doit contenir une liste 'requests'"),
+        ({'requests': []}, "La liste 'requests' est vide"),
+        ({'requests': [{'path': '/api/livres'}] * 11}, 'Trop de sous-requêtes (maximum 10)'),
+        ({'requests': [{'path': '/api/livres', 'method': 'DELETE'}]},
+         'Sous-requête 0 : seules les requêtes GET sont acceptées'),
+        ({'requests': [{'path': 'https://exemple.fr/api/livres'}]}, 'Sous-requête 0 : chemin invalide'),
+        ({'requests': [{'path': '/admin'}]}, 'Sous-requête 0 : chemin invalide')
+    ]
+    for corps, erreur in cas:
+        reponse = client.post('/api/batch', json=corps)
+        assert (reponse.status_code, reponse.json['error']) == (400, erreur)
+
+
+def test_batch_reserve_aux_utilisateurs_connectes(app):
+    reponse = app.test_client().post('/api/batch', json={'requests': [{'path': '/api/livres'}]},
+                                     base_url='https://localhost')
+
+    assert reponse.status_code == 401
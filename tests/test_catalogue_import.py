@@ -0,0 +1,23 @@
+"""Import en masse du catalogue : dédoublonnage dans le fichier et contre la base"""
+from catalogue_import import ImportCatalogue
+from models import db, Livre, Utilisateur
+
+
+def test_doublons_entre_lots_et_avec_le_catalogue(app, client, livre):
+    livre(titre='Existant', auteur='Auteur')
+    lignes = enumerate([
+        {'titre': 'Un', 'auteur': 'A'},
+        {'titre': 'Deux', 'auteur': 'B'},
+        {'titre': '  un ', 'auteur': 'a'},
+        {'titre': 'existant', 'auteur': 'AUTEUR'},
+        {'titre': 'Deux', 'auteur': 'B'},
+        {'titre': 'Trois', 'auteur': 'C'}
+    ], 1)
+
+    with app.app_context():
+        id_utilisateur = Utilisateur.query.filter_by(email='bibliothecaire@test.fr').one().id_utilisateur
+        rapport = ImportCatalogue(id_utilisateur, taille_lot=2).executer(lignes)
+        titres = sorted(titre for titre, in db.session.query(Livre.titre))
+
+    assert (rapport['importes'], rapport['doublons'], rapport['rejetes']) == (3, 3, 0)
+    assert titres == ['Deux', 'Existant', 'Trois', 'Un']
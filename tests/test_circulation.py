@@ -0,0 +1,113 @@
+"""Prêts et retours : stock, exemplaires et refus (survente, double retour)"""
+from models import db, Exemplaire, Livre
+
+
+def disponibles(app, id_livre):
+    with app.app_context():
+        return db.session.get(Livre, id_livre).disponibles
+
+
+def test_emprunt_decremente_le_stock(app, client, livre, membre):
+    id_livre = livre(nombre_exemplaires=2)['id_livre']
+    reponse = client.post('/api/emprunts', json={'id_livre': id_livre, 'id_membre': membre()['id_membre']})
+
+    assert reponse.status_code == 201
+    assert reponse.json['statut'] == 'en_cours'
+    assert reponse.json['id_exemplaire'] is not None
+    assert disponibles(app, id_livre) == 1
+
+
+def test_retour_remet_en_stock(app, client, livre, membre):
+    id_livre = livre()['id_livre']
+    emprunt = client.post('/api/emprunts', json={'id_livre': id_livre, 'id_membre': membre()['id_membre']}).json
+
+    reponse = client.post(f"/api/emprunts/{emprunt['id_emprunt']}/retour")
+
+    assert reponse.status_code == 200
+    assert reponse.json['statut'] == 'retourne'
+    assert disponibles(app, id_livre) == 1
+    with app.app_context():
+        assert db.session.get(Exemplaire, emprunt['id_exemplaire']).statut == 'disponible'
+
+
+def test_pas_de_survente(app, client, livre, membre):
+    id_livre = livre(nombre_exemplaires=1)['id_livre']
+    premier = client.post('/api/emprunts', json={'id_livre': id_livre, 'id_membre': membre()['id_membre']})
+    second = client.post('/api/emprunts', json={'id_livre': id_livre, 'id_membre': membre()['id_membre']})
+
+    assert premier.status_code == 201
+    assert second.status_code == 400
+    assert second.json['error'] == 'Livre non disponible'
+    assert disponibles(app, id_livre) == 0
+
+
+def test_emprunts_par_lot_sans_survente(app, client, livre, membre):
+    id_livre = livre(nombre_exemplaires=2)['id_livre']
+    demandes = [{'id_livre': id_livre, 'id_membre': membre()['id_membre']} for _ in range(3)]
+
+    reponse = client.post('/api/emprunts/lot', json={'emprunts': demandes})
+
+    assert [resultat['status'] for resultat in reponse.json['resultats']] == [201, 201, 400]
+    assert disponibles(app, id_livre) == 0
+
+
+def sortir_tous_les_exemplaires(app, id_livre):
+    """Exemplaires pris par un prêt concurrent alors que le stock n'est pas encore décrémenté"""
+    with app.app_context():
+        db.session.query(Exemplaire).filter_by(id_livre=id_livre).update({'statut': 'emprunte'})
+        db.session.commit()
+
+
+def test_emprunt_sans_exemplaire_libre_annule(app, client, livre, membre):
+    id_livre = livre(nombre_exemplaires=1)['id_livre']
+    sortir_tous_les_exemplaires(app, id_livre)
+
+    reponse = client.post('/api/emprunts', json={'id_livre': id_livre, 'id_membre': membre()['id_membre']})
+
+    assert reponse.status_code == 409
+    assert disponibles(app, id_livre) == 1
+    assert client.get('/api/emprunts').json == []
+
+
+def test_emprunts_par_lot_sans_exemplaire_libre(app, client, livre, membre):
+    id_livre, autre = livre()['id_livre'], livre()['id_livre']
+    sortir_tous_les_exemplaires(app, id_livre)
+    demandes = [{'id_livre': id_livre, 'id_membre': membre()['id_membre']},
+                {'id_livre': autre, 'id_membre': membre()['id_membre']}]
+
+    reponse = client.post('/api/emprunts/lot', json={'emprunts': demandes})
+
+    assert [resultat['status'] for resultat in reponse.json['resultats']] == [409, 201]
+    assert disponibles(app, id_livre) == 1
+    assert disponibles(app, autre) == 0
+    assert all(e['id_exemplaire'] is not None for e in client.get('/api/emprunts').json)
+
+
+def test_double_retour_refuse(client, livre, membre):
+    emprunt = client.post('/api/emprunts', json={'id_livre': livre()['id_livre'], 'id_membre': membre()['id_membre']}).json
+    client.post(f"/api/emprunts/{emprunt['id_emprunt']}/retour")
+
+    reponse = client.post(f"/api/emprunts/{emprunt['id_emprunt']}/retour")
+
+    assert reponse.status_code == 400
+    assert reponse.json['error'] == 'Emprunt déjà retourné'
+
+
+def test_membre_inactif_refuse(client, livre, membre):
+    id_membre = membre()['id_membre']
+    client.put(f'/api/membres/{id_membre}', json={'statut': 'inactif'})
+
+    reponse = client.post('/api/emprunts', json={'id_livre': livre()['id_livre'], 'id_membre': id_membre})
+
+    assert reponse.status_code == 400
+    assert reponse.json['error'] == 'Membre invalide'
+
+
+def test_emprunt_d_une_autre_bibliotheque(app, client, autre_client, livre, membre):
+    id_livre = livre()['id_livre']
+    id_membre = autre_client.post('/api/membres', json={'nom': 'N', 'prenom': 'P', 'email': 'n@test.fr'}).json['id_membre']
+
+    reponse = autre_client.post('/api/emprunts', json={'id_livre': id_livre, 'id_membre': id_membre})
+
+    assert reponse.status_code == 400
+    assert disponibles(app, id_livre) == 1
@@ -0,0 +1,48 @@
+"""Compression des réponses : négociation Accept-Encoding, seuil de taille, réponses streamées"""
+import gzip
+import zlib
+import brotli
+from compression import choose_encoding
+
+
+def test_negociation_de_l_encodage():
+    assert choose_encoding('gzip, br') == 'br'
+    assert choose_encoding('br;q=0.5, gzip') == 'gzip'
+    assert choose_encoding('br;q=0, gzip;q=0') is None
+    assert choose_encoding('*') == 'br'
+    assert choose_encoding(None) is None
+
+
+def test_reponse_json_compressee(client, livre):
+    for numero in range(30):
+        livre(titre=f'Livre {numero}')
+    brute = client.get('/api/livres', headers={'Accept-Encoding': 'identity'})
+
+    en_br = client.get('/api/livres', headers={'Accept-Encoding': 'br'})
+    en_gzip = client.get('/api/livres', headers={'Accept-Encoding': 'br;q=0, gzip'})
+
+    assert 'Content-Encoding' not in brute.headers
+    assert en_br.headers['Content-Encoding'] == 'br'
+    assert brotli.decompress(en_br.data) == brute.data
+    assert en_gzip.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(en_gzip.data) == brute.data
+    assert len(en_gzip.data) < len(brute.data)
+    assert 'Accept-Encoding' in en_gzip.headers['Vary']
+
+
+def test_petite_reponse_non_compressee(client):
+    reponse = client.get('/api/stats', headers={'Accept-Encoding': 'gzip'})
+
+    assert 'Content-Encoding' not in reponse.headers
+    assert reponse.json['total_livres'] == 0
+
+
+def test_export_streame_compresse_par_morceaux(client, livre):
+    livre(titre='Seul')
+
+    reponse = client.get('/api/export/livres', headers={'Accept-Encoding': 'gzip'})
+
+    assert reponse.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in reponse.headers
+    texte = zlib.decompress(reponse.data, 31).decode('utf-8')
+    assert 'Seul' in texte
@@ -0,0 +1,44 @@
+"""ETag faibles et 304 : revalidation des listes, invalidation par une écriture ou un autre paramètre"""
+
+
+def test_revalidation_sans_changement(client, livre):
+    livre()
+    premiere = client.get('/api/livres')
+
+    seconde = client.get('/api/livres', headers={'If-None-Match': premiere.headers['ETag']})
+
+    assert premiere.headers['ETag'].startswith('W/"')
+    assert premiere.headers['Cache-Control'] == 'private, no-cache'
+    assert seconde.status_code == 304
+    assert seconde.data == b''
+    assert seconde.headers['ETag'] == premiere.headers['ETag']
+
+
+def test_ecriture_et_parametres_changent_l_etag(client, livre):
+    id_livre = livre()['id_livre']
+    etag = client.get('/api/livres').headers['ETag']
+
+    autre_parametre = client.get('/api/livres', query_string={'fields': 'titre'}, headers={'If-None-Match': etag})
+    client.put(f'/api/livres/{id_livre}', json={'titre': 'Nouveau titre'})
+    apres_ecriture = client.get('/api/livres', headers={'If-None-Match': etag})
+
+    assert autre_parametre.status_code == 200
+    assert apres_ecriture.status_code == 200
+    assert apres_ecriture.json[0]['titre'] == 'Nouveau titre'
+
+
+def test_etag_propre_a_chaque_bibliotheque(client, autre_client, livre):
+    livre()
+    etag = client.get('/api/livres').headers['ETag']
+
+    reponse = autre_client.get('/api/livres', headers={'If-None-Match': etag})
+
+    assert reponse.status_code == 200
+    assert reponse.json == []
+
+
+def test_erreur_sans_etag(client):
+    reponse = client.get('/api/livres', query_string={'fields': 'inconnu'})
+
+    assert reponse.status_code == 400
+    assert 'ETag' not in reponse.headers
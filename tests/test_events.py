@@ -0,0 +1,36 @@
+"""Flux SSE : abonnement le temps du flux et évènements sans curseur de reprise"""
+from events import EventBroker, LocalTransport
+
+
+def nouveau_broker():
+    broker = EventBroker(transport=LocalTransport())
+    broker.transport.attach(broker)
+    return broker
+
+
+def test_flux_abonne_puis_desabonne(app):
+    broker = nouveau_broker()
+    flux = broker.stream(1)
+    assert not broker._subscribers
+
+    assert next(flux).startswith('retry: ')
+    broker.publish(1, 'emprunt.cree', {'id_livre': 3, 'disponibles': 0})
+    broker.publish(2, 'emprunt.cree', {'id_livre': 4})
+
+    assert next(flux) == 'event: emprunt.cree\ndata: {"id_livre":3,"disponibles":0}\n\n'
+    flux.close()
+    assert not broker._subscribers
+
+
+def test_file_saturee_demande_une_resynchronisation(app):
+    broker = nouveau_broker()
+    broker.queue_size = 1
+    flux = broker.stream(1)
+    next(flux)
+
+    broker.publish(1, 'livre.modifie', {'id_livre': 1})
+    broker.publish(1, 'livre.modifie', {'id_livre': 2})
+
+    assert next(flux) == 'event: resync\ndata: {}\n\n'
+    assert next(flux, None) is None
+    assert not broker._subscribers
@@ -0,0 +1,62 @@
+"""Exemplaires : codes-barres par défaut et nombre d'exemplaires d'un livre"""
+from exemplaires import code_barres_defaut
+from models import db, Exemplaire, Livre
+
+
+def test_code_barres_par_defaut_apres_le_plus_grand_numero(client, livre):
+    id_livre = livre()['id_livre']
+    etiquette = code_barres_defaut(id_livre, 3)
+    assert client.post(f'/api/livres/{id_livre}/exemplaires', json={'code_barres': etiquette}).status_code == 201
+
+    reponse = client.post(f'/api/livres/{id_livre}/exemplaires')
+
+    assert reponse.status_code == 201
+    assert reponse.json['code_barres'] == code_barres_defaut(id_livre, 4)
+
+
+def test_hausse_du_nombre_d_exemplaires_cree_les_exemplaires(app, client, livre):
+    id_livre = livre(nombre_exemplaires=2)['id_livre']
+
+    reponse = client.put(f'/api/livres/{id_livre}', json={'titre': 'Nouveau', 'nombre_exemplaires': 4})
+
+    assert reponse.status_code == 200
+    assert reponse.json['titre'] == 'Nouveau'
+    assert reponse.json['nombre_exemplaires'] == 4
+    with app.app_context():
+        assert db.session.get(Livre, id_livre).disponibles == 4
+        assert Exemplaire.query.filter_by(id_livre=id_livre, statut='disponible').count() == 4
+
+
+def test_baisse_du_nombre_d_exemplaires_refusee(app, client, livre):
+    id_livre = livre(nombre_exemplaires=2)['id_livre']
+
+    reponse = client.put(f'/api/livres/{id_livre}', json={'nombre_exemplaires': 1})
+
+    assert reponse.status_code == 400
+    with app.app_context():
+        livre = db.session.get(Livre, id_livre)
+        assert (livre.nombre_exemplaires, livre.disponibles) == (2, 2)
+
+
+def test_livre_ancien_sans_nombre_d_exemplaires(app, client, livre):
+    id_livre = livre(nombre_exemplaires=2)['id_livre']
+    with app.app_context():
+        db.session.get(Livre, id_livre).nombre_exemplaires = None
+        db.session.commit()
+
+    assert client.put(f'/api/livres/{id_livre}', json={'titre': 'Modifié'}).status_code == 200
+    reponse = client.put(f'/api/livres/{id_livre}', json={'nombre_exemplaires': 3})
+
+    assert reponse.status_code == 200
+    assert reponse.json['nombre_exemplaires'] == 3
+    with app.app_context():
+        assert Exemplaire.query.filter_by(id_livre=id_livre).count() == 3
+
+
+def test_suppression_change_l_etag_des_exemplaires(client, livre):
+    id_livre = livre()['id_livre']
+    etag = client.get(f'/api/livres/{id_livre}/exemplaires').headers['ETag']
+
+    assert client.delete(f'/api/livres/{id_livre}').status_code == 200
+
+    assert client.get(f'/api/livres/{id_livre}/exemplaires', headers={'If-None-Match': etag}).status_code == 200
@@ -0,0 +1,57 @@
+"""Export en flux : CSV et NDJSON par paquets, champs choisis, fichier gzip, isolation des bibliothèques"""
+import csv
+import gzip
+import io
+import json
+from export import Export
+
+
+def test_csv_par_paquets(app, client, livre):
+    for numero in range(5):
+        livre(titre=f'Livre {numero}', categorie='Roman')
+
+    with app.app_context():
+        morceaux = list(Export(client.id_utilisateur, 'livres', taille_paquet=2).morceaux())
+    reponse = client.get('/api/export/livres', query_string={'fields': 'titre,categorie'})
+
+    # En-tête puis un morceau par paquet de deux lignes
+    assert len(morceaux) == 1 + 3
+    lignes = list(csv.reader(io.StringIO(reponse.get_data(as_text=True))))
+    assert lignes[0] == ['titre', 'categorie']
+    assert lignes[1:] == [[f'Livre {numero}', 'Roman'] for numero in range(5)]
+    assert reponse.headers['Content-Disposition'].startswith('attachment; filename="livres-')
+    assert reponse.headers['Cache-Control'] == 'no-store'
+
+
+def test_ndjson_des_emprunts(client, livre, membre):
+    id_livre, id_membre = livre()['id_livre'], membre()['id_membre']
+    emprunt = client.post('/api/emprunts', json={'id_livre': id_livre, 'id_membre': id_membre}).json
+
+    reponse = client.get('/api/export/emprunts', query_string={'format': 'ndjson'})
+
+    assert reponse.mimetype == 'application/x-ndjson'
+    [ligne] = [json.loads(ligne) for ligne in reponse.get_data(as_text=True).splitlines()]
+    assert (ligne['id_emprunt'], ligne['id_livre'], ligne['statut']) == (emprunt['id_emprunt'], id_livre, 'en_cours')
+    assert ligne['date_emprunt'] == emprunt['date_emprunt']
+
+
+def test_fichier_gzip_et_isolation(client, autre_client, livre):
+    livre(titre='Mien')
+    autre_client.post('/api/livres', json={'titre': 'Autre', 'auteur': 'Auteur'})
+
+    reponse = client.get('/api/export/livres', query_string={'compression': 'gzip', 'fields': 'titre'})
+
+    assert reponse.mimetype == 'application/gzip'
+    assert reponse.headers['Content-Disposition'].endswith('.csv.gz"')
+    assert gzip.decompress(reponse.data).decode('utf-8').splitlines() == ['titre', 'Mien']
+
+
+def test_parametres_invalides(client):
+    assert client.get('/api/export/utilisateurs').status_code == 404
+    for parametres, erreur in [
+        ({'format': 'xlsx'}, 'Format inconnu (csv ou ndjson)'),
+        ({'compression': 'zip'}, 'Compression inconnue (gzip)'),
+        ({'fields': 'titre,empreinte'}, 'Champ(s) inconnu(s) : empreinte')
+    ]:
+        reponse = client.get('/api/export/livres', query_string=parametres)
+        assert (reponse.status_code, reponse.json['error']) == (400, erreur)
@@ -0,0 +1,59 @@
+"""Historique des emprunts : plage de dates, pagination par curseur, amendes dues par emprunt et au total"""
+from datetime import date
+from models import db, Emprunt
+from test_amendes import emprunt_en_retard
+
+
+def dater(app, id_emprunt, jour):
+    with app.app_context():
+        db.session.get(Emprunt, id_emprunt).date_emprunt = jour
+        db.session.commit()
+
+
+def test_plage_de_dates_et_pagination(app, client, livre, membre):
+    id_membre = membre()['id_membre']
+    ids = []
+    for jour in (date(2024, 1, 10), date(2024, 2, 10), date(2024, 3, 10)):
+        emprunt = client.post('/api/emprunts', json={'id_livre': livre()['id_livre'], 'id_membre': id_membre}).json
+        dater(app, emprunt['id_emprunt'], jour)
+        ids.append(emprunt['id_emprunt'])
+    url = f'/api/membres/{id_membre}/emprunts'
+
+    plage = client.get(url, query_string={'depuis': '2024-02-01', 'jusqu_au': '2024-03-10'}).json
+    premiere = client.get(url, query_string={'limite': 2}).json
+    seconde = client.get(url, query_string={'limite': 2, 'curseur': premiere['curseur_suivant']}).json
+
+    assert [e['id_emprunt'] for e in plage['emprunts']] == [ids[2], ids[1]]
+    assert plage['emprunts'][0]['livre']['titre'] == 'Titre'
+    assert 'membre' not in plage['emprunts'][0]
+    assert [e['id_emprunt'] for e in premiere['emprunts'] + seconde['emprunts']] == ids[::-1]
+    assert seconde['curseur_suivant'] is None
+
+
+def test_amendes_dues_par_emprunt_et_au_total(app, client, livre, membre):
+    emprunt, _ = emprunt_en_retard(app, client, livre, membre, 4)
+    id_membre = emprunt['id_membre']
+    autre = client.post('/api/emprunts', json={'id_livre': livre()['id_livre'], 'id_membre': id_membre}).json
+    url = f'/api/membres/{id_membre}/emprunts'
+
+    complet = client.get(url).json
+    filtre = client.get(url, query_string={'statut': 'en_cours', 'fields': 'id_emprunt,amendes_dues'}).json
+    vide = client.get(url, query_string={'depuis': '2999-01-01'}).json
+
+    dues = {e['id_emprunt']: e['amendes_dues'] for e in complet['emprunts']}
+    assert dues == {emprunt['id_emprunt']: 2.0, autre['id_emprunt']: 0.0}
+    assert complet['amendes_dues'] == 2.0
+    # Le total porte sur tout l'historique, quels que soient les filtres
+    assert filtre['emprunts'] == [{'id_emprunt': autre['id_emprunt'], 'amendes_dues': 0.0}]
+    assert (filtre['amendes_dues'], vide['emprunts'], vide['amendes_dues']) == (2.0, [], 2.0)
+    livre_en_retard = client.get(f"/api/livres/{emprunt['id_livre']}/emprunts").json
+    assert livre_en_retard['emprunts'][0]['membre']['id_membre'] == id_membre
+
+
+def test_parametres_invalides_et_autre_bibliotheque(client, autre_client, membre):
+    id_membre = membre()['id_membre']
+
+    reponse = client.get(f'/api/membres/{id_membre}/emprunts', query_string={'depuis': '10/01/2024'})
+
+    assert (reponse.status_code, reponse.json['error']) == (400, "Paramètre 'depuis' invalide (AAAA-MM-JJ attendu)")
+    assert autre_client.get(f'/api/membres/{id_membre}/emprunts').status_code == 404
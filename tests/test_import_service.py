@@ -0,0 +1,32 @@
+"""Imports en arrière-plan : reprise après la dernière notice et tâche signalée active pendant la relecture"""
+from datetime import datetime, timedelta
+import import_service as module_import
+from import_service import ImportService
+from models import db, Livre, TacheImport
+
+
+def test_reprise_signale_la_tache_active(monkeypatch, app, client, tmp_path):
+    chemin = tmp_path / 'livres.ndjson'
+    chemin.write_text(''.join(f'{{"titre": "Livre {n}", "auteur": "A"}}\n' for n in range(1, 6)))
+    with app.app_context():
+        tache = TacheImport(id_utilisateur=client.id_utilisateur, chemin=str(chemin), format='ndjson', erreurs=[],
+                            statut='en_cours', position=3, date_maj=datetime.utcnow() - timedelta(hours=1))
+        db.session.add(tache)
+        db.session.commit()
+        id_tache = tache.id_tache
+
+    # Délai d'abandon nul : la tâche est signalée active à chaque notice, y compris celles relues
+    service = ImportService(app, str(tmp_path / 'imports'), stale_minutes=0)
+    signalements = []
+    signaler = service._signaler_activite
+    monkeypatch.setattr(service, '_signaler_activite', lambda id_tache: (signalements.append(id_tache), signaler(id_tache)))
+    monkeypatch.setattr(module_import, 'publish', lambda *args: None)
+    with app.app_context():
+        assert service._reserver() == id_tache
+        service._executer(id_tache)
+        tache = db.session.get(TacheImport, id_tache)
+        titres = sorted(titre for titre, in db.session.query(Livre.titre))
+
+    assert len(signalements) == 5
+    assert (tache.statut, tache.position, tache.importes) == ('terminee', 5, 2)
+    assert titres == ['Livre 4', 'Livre 5']
@@ -0,0 +1,40 @@
+"""Import en masse des membres : mise à jour des inscrits par email"""
+from models import db, Membre
+
+
+def lire_membre(app, id_membre):
+    with app.app_context():
+        return db.session.get(Membre, id_membre).to_dict()
+
+
+def test_ligne_partielle_conserve_le_telephone(app, client, membre):
+    existant = membre(email='alice@test.fr', telephone='06 12 34 56 78')
+
+    reponse = client.post('/api/membres/import', json=[
+        {'nom': 'Martin', 'prenom': 'Alice', 'email': 'ALICE@test.fr'},
+        {'nom': 'Durand', 'prenom': 'Bob', 'email': 'bob@test.fr'}
+    ])
+
+    assert reponse.status_code == 200
+    assert reponse.json['mis_a_jour'] == 1
+    assert reponse.json['crees'] == 1
+    apres = lire_membre(app, existant['id_membre'])
+    assert apres['nom'] == 'Martin'
+    assert apres['telephone'] == '06 12 34 56 78'
+    recherche = client.get('/api/membres', query_string={'q': '0612'})
+    assert [m['id_membre'] for m in recherche.json['membres']] == [existant['id_membre']]
+
+
+def test_lot_mixte_met_a_jour_chaque_jeu_de_colonnes(app, client, membre):
+    premier = membre(email='a@test.fr', telephone='0101010101')
+    second = membre(email='b@test.fr', telephone='0202020202')
+
+    reponse = client.post('/api/membres/import', json=[
+        {'nom': 'A', 'prenom': 'Un', 'email': 'a@test.fr', 'telephone': ''},
+        {'nom': 'B', 'prenom': 'Deux', 'email': 'b@test.fr', 'telephone': '0303030303'}
+    ])
+
+    assert reponse.json['mis_a_jour'] == 2
+    assert lire_membre(app, premier['id_membre'])['telephone'] == '0101010101'
+    assert lire_membre(app, second['id_membre'])['telephone'] == '0303030303'
+    assert lire_membre(app, second['id_membre'])['nom'] == 'B'
@@ -0,0 +1,19 @@
+"""Endpoint /metrics : fermé sans jeton"""
+
+
+def test_metrics_ferme_sans_jeton(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', None)
+
+    assert app.test_client().get('/metrics').status_code == 403
+
+
+def test_metrics_avec_jeton(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 'jeton')
+    client = app.test_client()
+
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer autre'}).status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer jetoné'}).status_code == 401
+    reponse = client.get('/metrics', headers={'Authorization': 'Bearer jeton'})
+    assert reponse.status_code == 200
+    assert b'bibliotech_db_connect_duration_seconds_count' in reponse.data
@@ -0,0 +1,53 @@
+"""Migrations de données : appliquées une seule fois par base"""
+from datetime import date, datetime
+from sqlalchemy import insert, update
+from exemplaires import code_barres_defaut
+from migrations import MIGRATIONS_DONNEES, dater_paiements, migrer_donnees
+from models import db, Amende, Exemplaire, MigrationDonnees
+
+
+def test_migrations_de_donnees_appliquees_une_fois(app):
+    with app.app_context():
+        MigrationDonnees.query.delete()
+        db.session.commit()
+
+        assert migrer_donnees(db) == [nom for nom, _ in MIGRATIONS_DONNEES]
+        assert migrer_donnees(db) == []
+        assert MigrationDonnees.query.count() == len(MIGRATIONS_DONNEES)
+
+
+def test_exemplaires_en_conflit_laissent_la_migration_en_attente(app, livre):
+    id_a, id_b, id_c = livre()['id_livre'], livre(nombre_exemplaires=2)['id_livre'], livre()['id_livre']
+    with app.app_context():
+        MigrationDonnees.query.delete()
+        Exemplaire.query.filter(Exemplaire.id_livre.in_([id_b, id_c])).delete()
+        # Étiquette posée à la main sur A avec le code par défaut du premier exemplaire de B
+        etiquete = Exemplaire.query.filter_by(id_livre=id_a).one()
+        etiquete.code_barres = code_barres_defaut(id_b, 1)
+        db.session.commit()
+
+        assert 'creer_exemplaires_manquants' not in migrer_donnees(db)
+        assert Exemplaire.query.filter_by(id_livre=id_b).count() == 0
+        assert Exemplaire.query.filter_by(id_livre=id_c).count() == 1
+
+        etiquete.code_barres = 'A-0001'
+        db.session.commit()
+        assert 'creer_exemplaires_manquants' in migrer_donnees(db)
+        assert Exemplaire.query.filter_by(id_livre=id_b).count() == 2
+
+
+def test_paiements_sans_trace_restent_sans_date(app, client, livre, membre):
+    emprunt = client.post('/api/emprunts', json={'id_livre': livre()['id_livre'], 'id_membre': membre()['id_membre']}).json
+    with app.app_context():
+        ids = db.session.execute(insert(Amende).returning(Amende.id_amende), [
+            {'id_emprunt': emprunt['id_emprunt'], 'montant': 1.0, 'statut': 'payee',
+             'date_creation': date(2020, 1, 1), 'updated_at': updated_at}
+            for updated_at in (datetime(2024, 3, 5, 10), datetime(2024, 3, 6, 10))
+        ]).scalars().all()
+        # Amende payée avant le suivi des modifications
+        db.session.execute(update(Amende).where(Amende.id_amende == ids[1]).values(updated_at=None))
+        db.session.commit()
+
+        dater_paiements(db)
+
+        assert [db.session.get(Amende, id_amende).date_paiement for id_amende in ids] == [date(2024, 3, 5), None]
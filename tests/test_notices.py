@@ -0,0 +1,119 @@
+"""Lecture des notices : ISO 2709 (MARC21, UNIMARC), MARCXML, ONIX, notices tronquées"""
+import io
+import pytest
+from notices import lire_marc, lire_xml
+
+
+def notice_iso2709(controle, champs, utf8=True):
+    """Notice ISO 2709 : `controle` étiquette -> texte, `champs` liste (étiquette, [(code, valeur)])"""
+    zones = [(etiquette, texte.encode() + b'\x1e') for etiquette, texte in controle.items()]
+    zones += [
+        (etiquette, b'  ' + b''.join(b'\x1f' + code.encode() + valeur.encode() for code, valeur in sous_champs) + b'\x1e')
+        for etiquette, sous_champs in champs
+    ]
+    repertoire, donnees = b'', b''
+    for etiquette, zone in zones:
+        repertoire += f'{etiquette}{len(zone):04d}{len(donnees):05d}'.encode()
+        donnees += zone
+    base = 24 + len(repertoire) + 1
+    guide = f'{base + len(donnees) + 1:05d}nam {"a" if utf8 else " "}22{base:05d}   4500'.encode()
+    return guide + repertoire + b'\x1e' + donnees + b'\x1d'
+
+
+def lire(lecteur, contenu):
+    return list(lecteur(io.BytesIO(contenu)))
+
+
+def test_marc21_et_unimarc():
+    marc21 = notice_iso2709({'008': '990101s1862    fr            000 0 fre d'}, [
+        ('100', [('a', 'Hugo, Victor,')]),
+        ('245', [('a', 'Les misérables /'), ('c', 'Victor Hugo.')]),
+        ('650', [('a', 'Romans.')]),
+        ('952', [('p', '0001')]),
+        ('952', [('p', '0002')])
+    ])
+    unimarc = notice_iso2709({}, [
+        ('200', [('a', 'Germinal'), ('e', 'roman')]),
+        ('210', [('d', 'impr. 1885')]),
+        ('700', [('a', 'Zola'), ('b', 'Émile')]),
+        ('995', [('f', '0003')])
+    ])
+
+    assert lire(lire_marc, marc21 + b'\n' + unimarc) == [
+        (1, {'titre': 'Les misérables', 'auteur': 'Hugo, Victor', 'categorie': 'Romans',
+             'annee_publication': 1862, 'nombre_exemplaires': 2}),
+        (2, {'titre': 'Germinal : roman', 'auteur': 'Zola, Émile', 'categorie': '',
+             'annee_publication': 1885, 'nombre_exemplaires': 1})
+    ]
+
+
+def test_notice_marc_tronquee_signalee_puis_lecture_continue():
+    complete = notice_iso2709({}, [('245', [('a', 'Complet')]), ('100', [('a', 'Auteur')])])
+    tronquee = complete[:40] + b'\x1d'
+
+    notices = lire(lire_marc, tronquee + complete + complete[:-1])
+
+    assert [numero for numero, _ in notices] == [1, 2, 3]
+    assert isinstance(notices[0][1], ValueError)
+    assert notices[1][1]['titre'] == 'Complet'
+    # Dernière notice sans terminateur : lue telle quelle à la fin du flux
+    assert notices[2][1]['titre'] == 'Complet'
+
+
+def test_marcxml():
+    contenu = '''<?xml version="1.0" encoding="UTF-8"?>
+    <collection xmlns="http://www.loc.gov/MARC21/slim">
+      <record>
+        <controlfield tag="008">990101s1857    fr            000 0 fre d</controlfield>
+        <datafield tag="245" ind1="1" ind2="0">
+          <subfield code="a">Madame Bovary :</subfield><subfield code="b">mœurs de province</subfield>
+        </datafield>
+        <datafield tag="100" ind1="1" ind2=" "><subfield code="a">Flaubert, Gustave</subfield></datafield>
+      </record>
+    </collection>'''.encode()
+
+    assert lire(lire_xml, contenu) == [
+        (1, {'titre': 'Madame Bovary : mœurs de province', 'auteur': 'Flaubert, Gustave', 'categorie': '',
+             'annee_publication': 1857, 'nombre_exemplaires': None})
+    ]
+
+
+def test_onix_balises_longues_et_courtes():
+    onix3 = b'''<ONIXMessage release="3.0"><Product>
+      <DescriptiveDetail>
+        <TitleDetail><TitleType>01</TitleType><TitleElement><TitleText>Le Horla</TitleText></TitleElement></TitleDetail>
+        <Contributor><ContributorRole>B01</ContributorRole><PersonName>Editeur</PersonName></Contributor>
+        <Contributor><ContributorRole>A01</ContributorRole><PersonName>Guy de Maupassant</PersonName></Contributor>
+        <Subject><SubjectHeadingText>Fantastique</SubjectHeadingText></Subject>
+      </DescriptiveDetail>
+      <PublishingDetail><PublishingDate><PublishingDateRole>01</PublishingDateRole><Date>18870101</Date></PublishingDate></PublishingDetail>
+    </Product></ONIXMessage>'''
+    onix21_court = b'''<ONIXmessage><product>
+      <title><b202>01</b202><b203>Candide</b203></title>
+      <contributor><b035>A01</b035><b039>Voltaire</b039></contributor>
+      <b003>1759</b003>
+    </product></ONIXmessage>'''
+
+    assert lire(lire_xml, onix3) == [
+        (1, {'titre': 'Le Horla', 'auteur': 'Guy de Maupassant', 'categorie': 'Fantastique',
+             'annee_publication': 1887, 'nombre_exemplaires': None})
+    ]
+    assert lire(lire_xml, onix21_court)[0][1]['titre'] == 'Candide'
+    assert lire(lire_xml, onix21_court)[0][1]['auteur'] == 'Voltaire'
+    assert lire(lire_xml, onix21_court)[0][1]['annee_publication'] == 1759
+
+
+def test_xml_tronque():
+    contenu = b'''<collection>
+      <record><datafield tag="245"><subfield code="a">Un</subfield></datafield></record>
+      <record><datafield tag="245"><subfield code="a">Deu'''
+
+    notices = lire(lire_xml, contenu)
+
+    assert notices[0] == (1, {'titre': 'Un', 'auteur': '', 'categorie': '',
+                              'annee_publication': None, 'nombre_exemplaires': None})
+    assert notices[1][0] == 2 and isinstance(notices[1][1], ValueError)
+    with pytest.raises(ValueError, match='XML invalide'):
+        lire(lire_xml, b'<collection><record>')
+    with pytest.raises(ValueError, match='non reconnu'):
+        lire(lire_xml, b'<html></html>')
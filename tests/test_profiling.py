@@ -0,0 +1,48 @@
+"""Profilage à la demande : désactivé par défaut, fichiers nommés par le serveur"""
+import os
+import re
+import time
+from flask import Flask
+from profiling import RequestProfiler
+
+
+def test_profilage_desactive_par_defaut(app):
+    assert app.config['PROFILING_ENABLED'] is False
+    assert 'get_profile_output' not in app.view_functions
+
+
+def test_nom_de_fichier_genere_par_le_serveur(tmp_path):
+    application = Flask(__name__)
+    application.config.update(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=1.0, PROFILING_FOLDER=str(tmp_path))
+    application.add_url_rule('/', 'accueil', lambda: 'ok')
+    RequestProfiler(application)
+
+    reponse = application.test_client().get('/', headers={'X-Request-ID': '../../etc/passwd'})
+
+    profile_id = reponse.headers['X-Profile-Id']
+    assert re.fullmatch(r'[0-9a-f]{32}', profile_id)
+    assert [fichier.name for fichier in tmp_path.iterdir()] == [f'{profile_id}.folded']
+
+
+def test_retention_des_profils(tmp_path):
+    application = Flask(__name__)
+    application.config.update(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=1.0, PROFILING_FOLDER=str(tmp_path),
+                              PROFILING_MAX_FILES=2, PROFILING_MAX_AGE_HOURS=1)
+    application.add_url_rule('/', 'accueil', lambda: 'ok')
+    RequestProfiler(application)
+    ancien = tmp_path / f'{"0" * 32}.prof'
+    ancien.write_text('')
+    os.utime(ancien, (time.time() - 7200, time.time() - 7200))
+    autre = tmp_path / 'notes.txt'
+    autre.write_text('')
+
+    client = application.test_client()
+    ids = []
+    for _ in range(3):
+        ids.append(client.get('/').headers['X-Profile-Id'])
+        time.sleep(0.01)
+
+    # Le profil expiré et le plus ancien au-delà de deux sont supprimés ; les autres fichiers restent
+    assert sorted(fichier.name for fichier in tmp_path.iterdir()) == sorted(
+        [f'{profile_id}.folded' for profile_id in ids[1:]] + ['notes.txt']
+    )
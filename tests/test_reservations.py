@@ -0,0 +1,59 @@
+"""Réservations : exemplaire mis de côté au retour, retrait et annulation"""
+from models import db, Exemplaire, Reservation
+
+
+def statut_exemplaire(app, id_exemplaire):
+    with app.app_context():
+        return db.session.get(Exemplaire, id_exemplaire).statut
+
+
+def reservation_prete(client, livre, membre, nombre_exemplaires=2):
+    """Livre dont un exemplaire rendu est mis de côté pour un membre : (id_livre, emprunteurs, réservataire, réservation)"""
+    id_livre = livre(nombre_exemplaires=nombre_exemplaires)['id_livre']
+    emprunteurs = [membre()['id_membre'] for _ in range(nombre_exemplaires)]
+    emprunts = [client.post('/api/emprunts', json={'id_livre': id_livre, 'id_membre': id_membre}).json
+                for id_membre in emprunteurs]
+    reservataire = membre()['id_membre']
+    reservation = client.post('/api/reservations', json={'id_livre': id_livre, 'id_membre': reservataire}).json
+    # Le premier exemplaire rendu (le plus petit id) est mis de côté
+    assert client.post(f"/api/emprunts/{emprunts[0]['id_emprunt']}/retour").status_code == 200
+    return id_livre, emprunts, reservataire, reservation
+
+
+def test_exemplaire_rendu_mis_de_cote(app, client, livre, membre):
+    _, emprunts, _, reservation = reservation_prete(client, livre, membre)
+
+    with app.app_context():
+        reservation = db.session.get(Reservation, reservation['id_reservation'])
+        assert reservation.statut == 'disponible'
+        assert reservation.id_exemplaire == emprunts[0]['id_exemplaire']
+    assert statut_exemplaire(app, emprunts[0]['id_exemplaire']) == 'reserve'
+
+
+def test_pret_ordinaire_ne_prend_pas_l_exemplaire_mis_de_cote(app, client, livre, membre):
+    id_livre, emprunts, _, _ = reservation_prete(client, livre, membre)
+    # Un second exemplaire rentre en stock : un autre membre peut l'emprunter
+    assert client.post(f"/api/emprunts/{emprunts[1]['id_emprunt']}/retour").status_code == 200
+
+    emprunt = client.post('/api/emprunts', json={'id_livre': id_livre, 'id_membre': membre()['id_membre']}).json
+
+    assert emprunt['id_exemplaire'] == emprunts[1]['id_exemplaire']
+    assert statut_exemplaire(app, emprunts[0]['id_exemplaire']) == 'reserve'
+
+
+def test_reservataire_emprunte_l_exemplaire_mis_de_cote(app, client, livre, membre):
+    id_livre, emprunts, reservataire, _ = reservation_prete(client, livre, membre)
+
+    emprunt = client.post('/api/emprunts', json={'id_livre': id_livre, 'id_membre': reservataire}).json
+
+    assert emprunt['id_exemplaire'] == emprunts[0]['id_exemplaire']
+    assert statut_exemplaire(app, emprunt['id_exemplaire']) == 'emprunte'
+
+
+def test_annulation_remet_l_exemplaire_en_rayon(app, client, livre, membre):
+    _, emprunts, _, reservation = reservation_prete(client, livre, membre)
+
+    reponse = client.post(f"/api/reservations/{reservation['id_reservation']}/annuler")
+
+    assert reponse.status_code == 200
+    assert statut_exemplaire(app, emprunts[0]['id_exemplaire']) == 'disponible'
@@ -0,0 +1,77 @@
+"""Cache de réponses : hit, miss et invalidation par les versions de collections après une écriture"""
+import pytest
+from sqlalchemy.exc import OperationalError
+import response_cache as module_cache
+import versioning
+from models import VersionCollection
+from response_cache import MemoryBackend, ResponseCache
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """Cache mémoire activé le temps du test (désactivé par défaut dans les tests)"""
+    cache = ResponseCache()
+    cache.backend = MemoryBackend()
+    monkeypatch.setattr(module_cache, 'response_cache', cache)
+    return cache
+
+
+def consultations(resultat):
+    return module_cache.CACHE_REQUESTS.labels(endpoint='get_stats', result=resultat)._value.get()
+
+
+def version_livres(app):
+    with app.app_context():
+        return VersionCollection.query.filter_by(collection='livres').one().version
+
+
+def test_seconde_lecture_servie_par_le_cache(client, livre, cache):
+    livre()
+    hits, misses = consultations('hit'), consultations('miss')
+
+    premiere = client.get('/api/stats')
+    seconde = client.get('/api/stats')
+
+    assert seconde.json == premiere.json == {
+        'total_livres': 1, 'total_membres': 0, 'emprunts_actifs': 0, 'amendes_impayees': 0
+    }
+    assert (consultations('miss') - misses, consultations('hit') - hits) == (1, 1)
+
+
+def test_ecriture_perime_l_entree(client, livre, cache):
+    livre()
+    assert client.get('/api/stats').json['total_livres'] == 1
+    misses = consultations('miss')
+
+    livre()
+
+    assert client.get('/api/stats').json['total_livres'] == 2
+    assert consultations('miss') - misses == 1
+
+
+def test_increment_en_echec_repris(monkeypatch, app, client, livre, membre, cache):
+    livre()
+    assert client.get('/api/stats').json['total_livres'] == 1
+    incrementer = versioning._incrementer
+    monkeypatch.setattr(versioning, 'DELAIS_INCREMENT', (0,))
+
+    def verrouille(*args):
+        raise OperationalError('UPDATE versions_collections', {}, Exception('database is locked'))
+
+    # Une tentative en échec puis une réussite : la nouvelle tentative suffit
+    echecs = iter([True])
+    monkeypatch.setattr(versioning, '_incrementer',
+                        lambda *args: verrouille() if next(echecs, False) else incrementer(*args))
+    livre()
+    assert client.get('/api/stats').json['total_livres'] == 2
+
+    # Toutes les tentatives en échec : l'incrément est repris au commit suivant, même d'une autre collection
+    avant = version_livres(app)
+    monkeypatch.setattr(versioning, '_incrementer', verrouille)
+    livre()
+    assert client.get('/api/stats').json['total_livres'] == 2
+    assert version_livres(app) == avant
+    monkeypatch.setattr(versioning, '_incrementer', incrementer)
+    membre()
+    assert version_livres(app) == avant + 1
+    assert client.get('/api/stats').json['total_livres'] == 3
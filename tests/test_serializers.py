@@ -0,0 +1,48 @@
+"""Listes en ?fields= et ?embed= : colonnes et ressources imbriquées demandées seulement"""
+from test_amendes import emprunt_en_retard
+
+
+def emprunter(client, livre, membre):
+    id_livre, id_membre = livre(titre='Candide')['id_livre'], membre(nom='Martin')['id_membre']
+    return client.post('/api/emprunts', json={'id_livre': id_livre, 'id_membre': id_membre}).json
+
+
+def test_format_historique_sans_parametre(client, livre, membre):
+    emprunt = emprunter(client, livre, membre)
+
+    [ligne] = client.get('/api/emprunts').json
+
+    assert ligne['id_emprunt'] == emprunt['id_emprunt']
+    assert ligne['livre']['titre'] == 'Candide'
+    assert ligne['membre']['nom'] == 'Martin'
+    assert 'date_emprunt' in ligne
+
+
+def test_champs_et_ressources_demandes(client, livre, membre):
+    emprunt = emprunter(client, livre, membre)
+
+    champs = client.get('/api/emprunts', query_string={'fields': 'id_emprunt,statut,livre.titre'}).json
+    embarques = client.get('/api/emprunts', query_string={'fields': 'id_emprunt', 'embed': 'membre'}).json
+    livres = client.get('/api/livres', query_string={'fields': 'titre'}).json
+
+    assert champs == [{'id_emprunt': emprunt['id_emprunt'], 'statut': 'en_cours', 'livre': {'titre': 'Candide'}}]
+    assert embarques[0].keys() == {'id_emprunt', 'membre'}
+    assert embarques[0]['membre']['nom'] == 'Martin'
+    assert livres == [{'titre': 'Candide'}]
+
+
+def test_amendes_embarquent_l_emprunt_et_son_livre(client, livre, membre, app):
+    _, id_amende = emprunt_en_retard(app, client, livre, membre, 3)
+
+    [amende] = client.get('/api/amendes', query_string={'fields': 'id_amende,montant,emprunt.livre.titre'}).json
+
+    assert (amende['id_amende'], amende['montant']) == (id_amende, 1.5)
+    assert amende['emprunt']['livre'] == {'titre': 'Titre'}
+
+
+def test_champ_ou_ressource_inconnus(client):
+    champ = client.get('/api/livres', query_string={'fields': 'titre,mot_de_passe'})
+    ressource = client.get('/api/emprunts', query_string={'embed': 'utilisateur'})
+
+    assert (champ.status_code, champ.json['error']) == (400, 'Champ(s) inconnu(s) : mot_de_passe')
+    assert (ressource.status_code, ressource.json['error']) == (400, 'Ressource imbriquée inconnue : utilisateur')
@@ -0,0 +1,50 @@
+"""Instrumentation SQL : en-têtes de comptage et de durée, détection des N+1"""
+import json
+import pytest
+from flask import Response
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+import sql_instrumentation as module_instrumentation
+from models import db
+
+
+@pytest.fixture
+def instrumentation(monkeypatch):
+    instrumentation = module_instrumentation.sql_instrumentation
+    monkeypatch.setattr(instrumentation, 'expose_header', True)
+    return instrumentation
+
+
+def test_en_tetes_de_comptage_et_de_duree(client, livre, instrumentation):
+    livre()
+    une = client.get('/api/livres')
+    for _ in range(9):
+        livre()
+    dix = client.get('/api/livres')
+
+    assert int(une.headers['X-SQL-Count']) >= 1
+    assert float(une.headers['X-SQL-Time-Ms']) >= 0
+    assert len(json.loads(une.headers['X-SQL-Slowest'])) <= instrumentation.top_slowest
+    # Liste sérialisée en un SELECT : le nombre de requêtes ne dépend pas du nombre de livres
+    assert dix.headers['X-SQL-Count'] == une.headers['X-SQL-Count']
+    assert 'X-SQL-N-Plus-One' not in dix.headers
+
+
+def test_formes_repetees_signalees(app, caplog, instrumentation):
+    with app.test_request_context('/api/livres'):
+        instrumentation._start_request()
+        for id_livre in range(instrumentation.n_plus_one_threshold):
+            db.session.execute(text(f'SELECT * FROM livres WHERE id_livre = {id_livre}'))
+        db.session.execute(text("SELECT * FROM membres WHERE email = 'a@test.fr'"))
+        # Une requête en erreur n'est pas comptée et ne fausse pas la mesure des suivantes
+        with pytest.raises(OperationalError):
+            db.session.execute(text('SELECT * FROM table_inexistante'))
+        db.session.rollback()
+
+        response = instrumentation._finish_request(Response())
+
+    assert response.headers['X-SQL-Count'] == str(instrumentation.n_plus_one_threshold + 1)
+    assert response.headers['X-SQL-N-Plus-One'] == '1'
+    assert [r.sql for r in caplog.records if r.getMessage() == 'N+1 probable'] == [
+        'SELECT * FROM livres WHERE id_livre = ?'
+    ]
@@ -0,0 +1,25 @@
+"""Versions de collections (ETag) et curseur de synchronisation après une écriture"""
+
+
+def test_emprunt_change_l_etag_et_avance_le_curseur(client, livre, membre):
+    id_livre, id_membre = livre()['id_livre'], membre()['id_membre']
+    etag = client.get('/api/emprunts').headers['ETag']
+    curseur = client.get('/api/sync').json['cursor']
+
+    emprunt = client.post('/api/emprunts', json={'id_livre': id_livre, 'id_membre': id_membre}).json
+
+    assert client.get('/api/emprunts', headers={'If-None-Match': etag}).status_code == 200
+    changements = client.get('/api/sync', query_string={'since': curseur}).json
+    assert changements['full'] is False
+    assert [e['id_emprunt'] for e in changements['changes']['emprunts']] == [emprunt['id_emprunt']]
+    assert [l['id_livre'] for l in changements['changes']['livres']] == [id_livre]
+
+
+def test_emprunt_refuse_garde_l_etag(client, livre, membre):
+    id_livre, id_membre = livre(nombre_exemplaires=0)['id_livre'], membre()['id_membre']
+    etag = client.get('/api/emprunts').headers['ETag']
+
+    reponse = client.post('/api/emprunts', json={'id_livre': id_livre, 'id_membre': id_membre})
+
+    assert reponse.status_code == 400
+    assert client.get('/api/emprunts', headers={'If-None-Match': etag}).status_code == 304
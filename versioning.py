@@ -0,0 +1,221 @@
+"""
+Versions de collections par bibliothèque et requêtes conditionnelles (ETag / 304)
+
+Chaque route d'écriture signale les collections qu'elle modifie ; leurs
+compteurs sont incrémentés juste après le commit, dans une courte transaction
+à part (retentée, puis reprise au commit suivant en cas d'échec), pour que les verrous des lignes de compteurs ne soient pas tenus
+pendant toute la transaction d'écriture (ce qui sérialiserait les prêts et
+retours d'une même bibliothèque). Les routes de lecture calculent leur ETag
+à partir de ces compteurs (une seule lecture sur la clé primaire) et répondent
+304 sans exécuter la requête de liste quand le client possède déjà la bonne
+version. Entre le commit des données et celui des compteurs, un client peut
+encore recevoir un 304 : la réponse suivante porte la nouvelle version.
+
+Le curseur de /api/sync n'utilise pas de compteur verrouillé sur PostgreSQL :
+chaque écriture porte l'identifiant de sa transaction et le curseur est
+l'horizon des transactions terminées (voir next_sequence et sequence_validee).
+"""
+import hashlib
+import logging
+import threading
+import time
+from functools import wraps
+from flask import current_app, g, request
+from flask_login import current_user
+from sqlalchemy import event, insert, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, VersionCollection
+
+logger = logging.getLogger(__name__)
+
+# Compteur global de la bibliothèque, distinct des versions par collection (hors PostgreSQL)
+SEQUENCE = 'sync'
+# Attentes (secondes) avant de retenter l'incrément des versions après un commit (verrou, base occupée)
+DELAIS_INCREMENT = (0.05, 0.2)
+
+# Incréments en échec après toutes les tentatives, repris au commit suivant du processus
+_en_attente = set()
+_en_attente_lock = threading.Lock()
+
+
+def _upsert():
+    """INSERT ... ON CONFLICT propre au dialecte (PostgreSQL et SQLite le supportent)"""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(VersionCollection)
+    if dialect == 'sqlite':
+        return sqlite.insert(VersionCollection)
+    return None
+
+
+def _incrementer(executor, id_utilisateur, collection):
+    """Incrémente un compteur (session ou connexion) ; la ligne reste verrouillée jusqu'au commit"""
+    upsert = _upsert()
+    if upsert is not None:
+        executor.execute(
+            upsert.values(id_utilisateur=id_utilisateur, collection=collection, version=1)
+            .on_conflict_do_update(
+                index_elements=['id_utilisateur', 'collection'],
+                set_={'version': VersionCollection.version + 1}
+            )
+        )
+        return
+    result = executor.execute(
+        update(VersionCollection)
+        .where(VersionCollection.id_utilisateur == id_utilisateur,
+               VersionCollection.collection == collection)
+        .values(version=VersionCollection.version + 1)
+    )
+    if result.rowcount == 0:
+        executor.execute(insert(VersionCollection).values(id_utilisateur=id_utilisateur, collection=collection,
+                                                          version=1))
+
+
+def bump_versions(id_utilisateur, *collections):
+    """
+    Signale les collections modifiées par la transaction en cours : leurs versions
+    sont incrémentées après le commit (rien si la transaction est annulée)
+    """
+    g.pop('_versions', None)
+    db.session.info.setdefault('versions_modifiees', set()).update(
+        (id_utilisateur, collection) for collection in collections
+    )
+
+
+def _after_commit(session):
+    modifiees = session.info.pop('versions_modifiees', set())
+    # Incréments d'un commit précédent restés en échec : repris avec ceux-ci
+    with _en_attente_lock:
+        modifiees |= _en_attente
+        _en_attente.clear()
+    if not modifiees:
+        return
+    g.pop('_versions', None)
+    for attente in (*DELAIS_INCREMENT, None):
+        try:
+            # Ordre fixe : deux commits concurrents verrouillent les compteurs dans le même ordre
+            with db.engine.begin() as connection:
+                for id_utilisateur, collection in sorted(modifiees):
+                    _incrementer(connection, id_utilisateur, collection)
+            return
+        except Exception as e:
+            erreur = e
+            if attente is not None:
+                time.sleep(attente)
+    # Les données sont validées : l'échec ne doit pas faire échouer la requête. ETag et cache
+    # servent l'ancienne version jusqu'au prochain commit du worker, qui reprend ces incréments.
+    with _en_attente_lock:
+        _en_attente.update(modifiees)
+    logger.error("Versions de collections non incrémentées", exc_info=erreur,
+                 extra={'collections': sorted(modifiees)})
+
+
+def _after_transaction_end(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('versions_modifiees', None)
+
+
+def init_versioning(app):
+    """Incrémente les versions signalées après chaque commit de la session de l'application"""
+    event.listen(db.session, 'after_commit', _after_commit)
+    event.listen(db.session, 'after_transaction_end', _after_transaction_end)
+
+
+def next_sequence(id_utilisateur):
+    """
+    Numéro de séquence de la transaction en cours (version des lignes écrites)
+
+    PostgreSQL : identifiant de la transaction (pg_current_xact_id), sans verrou ;
+    sequence_validee() ne renvoie qu'un curseur antérieur à toute transaction
+    encore en cours, si bien qu'un curseur ne peut jamais sauter une modification.
+    Autres bases : compteur de la bibliothèque, verrouillé jusqu'au commit (SQLite
+    n'accepte de toute façon qu'une transaction d'écriture à la fois).
+    """
+    g.pop('_versions', None)
+    if db.engine.dialect.name == 'postgresql':
+        return db.session.scalar(text('SELECT pg_current_xact_id()::text::bigint'))
+    upsert = _upsert()
+    if upsert is not None:
+        return db.session.execute(
+            upsert.values(id_utilisateur=id_utilisateur, collection=SEQUENCE, version=1)
+            .on_conflict_do_update(
+                index_elements=['id_utilisateur', 'collection'],
+                set_={'version': VersionCollection.version + 1}
+            )
+            .returning(VersionCollection.version)
+        ).scalar_one()
+    _incrementer(db.session, id_utilisateur, SEQUENCE)
+    return db.session.query(VersionCollection.version).filter_by(
+        id_utilisateur=id_utilisateur, collection=SEQUENCE
+    ).scalar()
+
+
+def sequence_validee(id_utilisateur):
+    """
+    Curseur de /api/sync : toutes les écritures de version inférieure ou égale
+    sont validées (ou annulées), aucune ne peut encore apparaître
+
+    PostgreSQL : la plus ancienne transaction encore en cours (xmin de
+    l'instantané) moins un ; autres bases : compteur de la bibliothèque.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        return db.session.scalar(text('SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint')) - 1
+    return get_versions(id_utilisateur, [SEQUENCE])[0]
+
+
+def get_versions(id_utilisateur, collections):
+    """
+    Versions courantes des collections (0 pour une collection jamais modifiée)
+
+    Mémorisées le temps de la requête : ETag et cache de réponses partagent la même lecture.
+    """
+    memo = g.setdefault('_versions', {})
+    key = (id_utilisateur, tuple(collections))
+    if key in memo:
+        return memo[key]
+    rows = db.session.query(VersionCollection.collection, VersionCollection.version).filter(
+        VersionCollection.id_utilisateur == id_utilisateur,
+        VersionCollection.collection.in_(collections)
+    ).all()
+    versions = dict(rows)
+    memo[key] = [versions.get(collection, 0) for collection in collections]
+    return memo[key]
+
+
+def compute_etag(id_utilisateur, collections):
+    """ETag d'une réponse : bibliothèque, versions des collections lues et paramètres de la requête"""
+    versions = get_versions(id_utilisateur, collections)
+    parts = [
+        current_app.config.get('ETAG_SALT', ''),
+        str(id_utilisateur),
+        ','.join(f"{collection}:{version}" for collection, version in zip(collections, versions)),
+        request.path,
+        request.query_string.decode('latin-1')
+    ]
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:20]
+
+
+def conditional(*collections):
+    """
+    Décorateur de route GET : ETag faible calculé depuis les versions des
+    collections dont dépend la réponse, et 304 si If-None-Match correspond
+
+    À placer sous @login_required (l'ETag dépend de la bibliothèque connectée).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = compute_etag(current_user.id_utilisateur, collections)
+            # ETag faible : le corps peut être compressé différemment selon Accept-Encoding
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            # Le navigateur garde la réponse mais revalide à chaque chargement
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator